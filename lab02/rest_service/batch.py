@@ -0,0 +1,138 @@
+import codecs
+import json
+
+from storage import PRODUCT_FIELDS
+
+# Сколько байт тела читать за раз при разборе JSON-массива
+READ_SIZE = 64 * 1024
+
+# Самая длинная операция пакета: дальше этого в поисках её конца тело не буферизуется
+MAX_OPERATION_SIZE = 1024 * 1024
+
+BATCH_OPERATIONS = ('create', 'update', 'delete')
+
+
+class BatchFormatError(ValueError):
+    """Тело пакета повреждено так, что дальше его разобрать нельзя"""
+
+
+def iter_ndjson(stream, read_size=READ_SIZE):
+    """
+    Операции из NDJSON построчно; испорченная строка — ошибка только этой операции.
+    Строки режутся из больших блоков: readline входного потока WSGI на каждую строку в разы медленнее.
+    """
+    tail = b''
+    while True:
+        chunk = stream.read(read_size)
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop() if chunk else b''
+        if len(tail) > MAX_OPERATION_SIZE:
+            raise BatchFormatError('Operation is too large')
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line), None
+            except ValueError:
+                yield None, 'Invalid JSON'
+        if not chunk:
+            return
+
+
+def iter_json_array(stream, read_size=READ_SIZE):
+    """
+    Элементы JSON-массива по одному, без чтения всего тела в память: в буфере
+    лежит только ещё не разобранный хвост. Ошибка синтаксиса делает бессмысленным
+    весь остаток массива, поэтому она прерывает пакет целиком.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    eof = False
+    state = 'start'
+
+    def read_more():
+        nonlocal buffer, position, eof
+        chunk = stream.read(read_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + text_decoder.decode(chunk, final=eof)
+        position = 0
+
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise BatchFormatError('Unexpected end of JSON array')
+            read_more()
+            continue
+
+        char = buffer[position]
+        if state == 'start':
+            if char != '[':
+                raise BatchFormatError('Expected a JSON array')
+            position += 1
+            state = 'first'
+        elif char == ']' and state in ('first', 'after'):
+            return
+        elif state == 'after':
+            if char != ',':
+                raise BatchFormatError('Expected "," or "]"')
+            position += 1
+            state = 'next'
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # Оборванный на границе чтения элемент дочитываем, но не дальше MAX_OPERATION_SIZE:
+                # иначе испорченный JSON заставил бы буферизовать весь остаток тела
+                if eof or len(buffer) - position > MAX_OPERATION_SIZE:
+                    raise BatchFormatError('Invalid JSON')
+                read_more()
+                continue
+            if end == len(buffer) and not eof:
+                # Число на границе чтения могло оборваться: дочитываем и разбираем заново
+                read_more()
+                continue
+            position = end
+            state = 'after'
+            yield item, None
+
+
+def check_product_fields(fields):
+    """Поля товара хранятся строками; icon может быть null — картинки нет. Иначе ValueError"""
+    for field, value in fields.items():
+        if not isinstance(value, str) and not (field == 'icon' and value is None):
+            raise ValueError('Invalid field value')
+
+
+def parse_operation(item):
+    """Проверяет операцию пакета и возвращает (op, id, fields) либо бросает ValueError с текстом ошибки"""
+    if not isinstance(item, dict):
+        raise ValueError('Invalid operation')
+    op = item.get('op')
+    if op not in BATCH_OPERATIONS:
+        raise ValueError('Invalid operation')
+
+    if op == 'create':
+        try:
+            fields = {'name': item['name'], 'description': item['description']}
+        except KeyError:
+            raise ValueError('Missing required field')
+        check_product_fields(fields)
+        return op, None, fields
+
+    id = item.get('id')
+    if not isinstance(id, int) or isinstance(id, bool):
+        raise ValueError('Invalid product id')
+    if op == 'delete':
+        return op, id, None
+
+    fields = {field: value for field, value in item.items() if field not in ('op', 'id')}
+    if any(field not in PRODUCT_FIELDS for field in fields):
+        raise ValueError('Invalid field')
+    check_product_fields(fields)
+    return op, id, fields
@@ -0,0 +1,46 @@
+import argparse
+import json
+import os
+import time
+
+
+def main(count, single, db_path):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    os.environ['PRODUCTS_STORAGE'] = 'sqlite'
+    os.environ['PRODUCTS_DB'] = db_path
+    from service import app
+
+    client = app.test_client()
+
+    start = time.perf_counter()
+    for i in range(single):
+        client.post('/product', json={'name': f'single-{i}', 'description': f'description {i}'})
+    elapsed = time.perf_counter() - start
+    print(f'POST /product x {single}: {elapsed:.2f} s, {single / elapsed:.0f} products/s, '
+          f'{count} would take ~{count * elapsed / single:.0f} s')
+
+    for name, content_type, body in (
+            ('NDJSON', 'application/x-ndjson',
+             '\n'.join(json.dumps({'op': 'create', 'name': f'ndjson-{i}', 'description': f'description {i}'})
+                       for i in range(count))),
+            ('JSON array', 'application/json',
+             json.dumps([{'op': 'create', 'name': f'array-{i}', 'description': f'description {i}'}
+                         for i in range(count)]))):
+        start = time.perf_counter()
+        response = client.post('/products/batch', data=body.encode(), content_type=content_type)
+        results = response.data
+        elapsed = time.perf_counter() - start
+        print(f'POST /products/batch ({name}) x {count}: {elapsed:.2f} s, {count / elapsed:.0f} products/s, '
+              f'status {response.status_code}, {len(results)} bytes of results')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Catalog import: single POST /product calls versus one batch')
+    parser.add_argument('--count', type=int, default=100_000, help='Products imported with one batch')
+    parser.add_argument('--single', type=int, default=2000, help='Products created one request at a time')
+    parser.add_argument('--db', default='bench_batch.db', help='SQLite database for the benchmark (recreated)')
+
+    args = parser.parse_args()
+
+    main(args.count, args.single, args.db)
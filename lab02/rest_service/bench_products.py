@@ -0,0 +1,65 @@
+import argparse
+import os
+import random
+import string
+import time
+import tracemalloc
+
+
+def fill(db_path, count):
+    """Заполняет базу count товарами одной транзакцией, минуя HTTP"""
+    from storage import SQLiteStorage
+
+    storage = SQLiteStorage(db_path)
+    connection = storage.connection()
+    random.seed(0)
+    with connection:
+        connection.execute('DELETE FROM products')
+        connection.executemany(
+            'INSERT INTO products (id, name, description) VALUES (?, ?, ?)',
+            ((i, ''.join(random.choices(string.ascii_lowercase, k=8)), f'description {i}') for i in range(count)))
+        connection.execute("UPDATE ids SET last_id = ? WHERE name = 'products'", (count - 1,))
+
+
+def measure(client, name, url, repeats=5):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        response = client.get(url)
+        size = sum(len(chunk) for chunk in response.response)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{name:<28} {best * 1000:10.2f} ms  {size:>12} bytes')
+    return response
+
+
+def main(count, db_path):
+    if not os.path.exists(db_path):
+        print(f'Filling {db_path} with {count} products...')
+        fill(db_path, count)
+
+    os.environ['PRODUCTS_STORAGE'] = 'sqlite'
+    os.environ['PRODUCTS_DB'] = db_path
+    from service import app, encode_cursor
+
+    client = app.test_client()
+    measure(client, 'first page (limit=100)', '/products?limit=100')
+    measure(client, 'middle page (cursor)', f'/products?limit=100&cursor={encode_cursor(count // 2)}')
+    measure(client, 'prefix page (prefix=ab)', '/products?limit=100&prefix=ab')
+    measure(client, 'projection (fields=id)', '/products?limit=1000&fields=id')
+
+    tracemalloc.start()
+    measure(client, 'full list, JSON array', '/products', repeats=1)
+    print(f'{"peak memory while streaming":<28} {tracemalloc.get_traced_memory()[1] / 2 ** 20:10.2f} MB')
+    tracemalloc.stop()
+    measure(client, 'full list, NDJSON', '/products?format=ndjson', repeats=1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Latency of GET /products on a large catalog')
+    parser.add_argument('--count', type=int, default=1_000_000, help='Number of products')
+    parser.add_argument('--db', default='bench_products.db', help='SQLite database for the benchmark')
+
+    args = parser.parse_args()
+
+    main(args.count, args.db)
@@ -0,0 +1,58 @@
+import argparse
+import os
+import random
+import time
+
+
+def measure(name, client, urls, headers=None, before=None):
+    start = time.perf_counter()
+    for url in urls:
+        if before is not None:
+            before()
+        response = client.get(url, headers=headers(url) if headers else None)
+        response.close()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<34} {len(urls) / elapsed:10.0f} req/s  {elapsed / len(urls) * 1e6:8.1f} us/req  '
+          f'(last status {response.status_code})')
+
+
+def main(count, requests, db_path):
+    from bench_products import fill
+
+    if not os.path.exists(db_path):
+        print(f'Filling {db_path} with {count} products...')
+        fill(db_path, count)
+
+    os.environ['PRODUCTS_STORAGE'] = 'sqlite'
+    os.environ['PRODUCTS_DB'] = db_path
+    from service import app, encode_cursor, response_cache
+
+    client = app.test_client()
+    random.seed(1)
+    # Горячий набор из тысячи товаров: типичное распределение чтений в каталоге
+    hot = [f'/product/{random.randrange(count)}' for _ in range(1000)]
+    product_urls = [random.choice(hot) for _ in range(requests)]
+    pages = [f'/products?limit=100&cursor={encode_cursor(random.randrange(count))}' for _ in range(100)]
+    page_urls = [random.choice(pages) for _ in range(requests)]
+
+    etags = {}
+    for url in hot + pages:
+        etags[url] = client.get(url).headers['ETag']
+
+    measure('product, no cache', client, product_urls, before=response_cache.clear)
+    measure('product, LRU hit', client, product_urls)
+    measure('product, If-None-Match -> 304', client, product_urls, headers=lambda url: {'If-None-Match': etags[url]})
+    measure('page of 100, no cache', client, page_urls, before=response_cache.clear)
+    measure('page of 100, LRU hit', client, page_urls)
+    measure('page of 100, If-None-Match -> 304', client, page_urls, headers=lambda url: {'If-None-Match': etags[url]})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Read-heavy benchmark of product ETags and the response cache')
+    parser.add_argument('--count', type=int, default=100_000, help='Number of products')
+    parser.add_argument('--requests', type=int, default=20_000, help='Requests per scenario')
+    parser.add_argument('--db', default='bench_reads.db', help='SQLite database for the benchmark')
+
+    args = parser.parse_args()
+
+    main(args.count, args.requests, args.db)
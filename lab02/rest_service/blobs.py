@@ -0,0 +1,122 @@
+import hashlib
+import os
+import tempfile
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow нужен только для миниатюр: без него картинки хранятся и отдаются как обычно
+    Image = None
+
+THUMBNAILS_ENABLED = Image is not None
+
+# Блок копирования при загрузке: файл целиком в памяти не держится
+COPY_BUFFER_SIZE = 256 * 1024
+
+# Допустимые размеры миниатюр: каждый размер — отдельная копия в кэше, поэтому список закрыт
+THUMBNAIL_SIZES = (64, 128, 256)
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+class ThumbnailUnavailable(Exception):
+    """Миниатюру сделать нельзя: нет Pillow или файл не является картинкой"""
+
+
+def guess_image_type(path):
+    with open(path, 'rb') as f:
+        head = f.read(12)
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+class BlobStore:
+    """
+    Хранилище картинок по содержимому: имя файла — SHA-256 его байтов,
+    каталоги разбиты по первым двум парам символов хэша (ab/cd/abcd...),
+    чтобы ни в одном каталоге не скапливались сотни тысяч файлов.
+    Одинаковые загрузки хранятся один раз. Файлы не меняются после записи,
+    поэтому хэш сразу служит сильным ETag.
+    """
+
+    def __init__(self, root):
+        # Абсолютный путь: send_file разрешает относительные пути от каталога приложения, а не от cwd
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    @staticmethod
+    def is_digest(name):
+        return isinstance(name, str) and len(name) == 64 and all(c in '0123456789abcdef' for c in name)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def thumbnail_path(self, digest, size):
+        return os.path.join(self.root, 'thumbs', str(size), digest[:2], digest[2:4], f'{digest}.png')
+
+    def store(self, stream):
+        """
+        Копирует поток блоками во временный файл, считая хэш по ходу, затем
+        атомарно переименовывает его на место. Возвращает хэш содержимого.
+        """
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(COPY_BUFFER_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+            name = digest.hexdigest()
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+    def thumbnail(self, digest, size):
+        """
+        Путь к миниатюре size x size (с сохранением пропорций), создаётся при первом запросе.
+        Параллельные запросы могут сделать её дважды, но файл подменяется атомарно.
+        """
+        path = self.thumbnail_path(digest, size)
+        if os.path.exists(path):
+            return path
+        if Image is None:
+            raise ThumbnailUnavailable('Pillow is not installed')
+
+        tmp_path = None
+        try:
+            with Image.open(self.path(digest)) as image:
+                image.thumbnail((size, size))
+                if image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+                    # PNG не умеет, например, CMYK из JPEG
+                    image = image.convert('RGB')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+                with os.fdopen(fd, 'wb') as f:
+                    image.save(f, format='PNG')
+            os.replace(tmp_path, path)
+        except (OSError, Image.DecompressionBombError) as e:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise ThumbnailUnavailable(str(e))
+        return path
@@ -0,0 +1,65 @@
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from load_test import Client, fake_image
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_ready(client, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            client.request('GET', '/products?limit=1')
+            return
+        except OSError:
+            client.close()
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def main(port, images):
+    """
+    Сервис запускается из чужого рабочего каталога с путями по умолчанию (относительными):
+    загруженные картинки должны отдаваться так же, как при запуске из каталога сервиса
+    """
+    rng = random.Random(1)
+    failures = 0
+    with tempfile.TemporaryDirectory() as cwd:
+        env = {key: value for key, value in os.environ.items() if key not in ('PRODUCTS_DB', 'PRODUCTS_IMAGES')}
+        env['PRODUCTS_STORAGE'] = 'sqlite'
+        server = subprocess.Popen([sys.executable, os.path.join(SERVICE_DIR, 'serve.py'), '--port', str(port),
+                                   '--workers', '1'], cwd=cwd, env=env)
+        client = Client(f'http://127.0.0.1:{port}')
+        try:
+            wait_ready(client)
+            for i in range(images):
+                status, product = client.call('POST', '/product', {'name': f'cwd-{i}', 'description': 'check'})
+                body = fake_image(rng)
+                client.request('POST', f'/product/{product["id"]}/image', body, 'image/png')
+                status, data = client.request('GET', f'/product/{product["id"]}/image')
+                if status != 200 or data != body:
+                    failures += 1
+                    print(f'GET /product/{product["id"]}/image: status {status}, {len(data)} bytes')
+        finally:
+            client.close()
+            server.terminate()
+            server.wait()
+
+    print(f'Service started from another directory: {images - failures}/{images} images served')
+    return failures == 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Regression check: the service works from any working directory')
+    parser.add_argument('--port', type=int, default=5077, help='Port for the service under test')
+    parser.add_argument('--images', type=int, default=20, help='Images uploaded and read back')
+    args = parser.parse_args()
+
+    sys.exit(0 if main(args.port, args.images) else 1)
@@ -0,0 +1,356 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+# Доли операций в смеси: чтения преобладают, как в живом каталоге
+DEFAULT_MIX = {
+    'get': 40,
+    'list': 15,
+    'update': 12,
+    'create': 10,
+    'image_get': 12,
+    'image_upload': 5,
+    'delete': 6,
+}
+
+# Сколько товаров (и картинок к ним) создаётся перед каждым уровнем нагрузки
+SEED_PRODUCTS = 200
+SEED_IMAGES = 50
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Чтения не должны ошибаться вовсе; у записей допустима доля ошибок не больше этой, иначе прогон провален
+READ_ENDPOINTS = ('get', 'list', 'image_get')
+MAX_ERROR_SHARE = 0.01
+
+
+class Client:
+    """Постоянное HTTP/1.1-соединение одного виртуального пользователя"""
+
+    def __init__(self, base_url):
+        url = urllib.parse.urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.connection = None
+
+    def request(self, method, path, body=None, content_type='application/json'):
+        headers = {'Content-Type': content_type} if body is not None else {}
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.close()
+                return response.status, data
+            except (ConnectionError, http.client.HTTPException):
+                # Сервер мог закрыть простаивавшее соединение: одна повторная попытка с новым
+                self.close()
+                if attempt:
+                    raise
+
+    def call(self, method, path, data=None):
+        body = json.dumps(data).encode() if data is not None else None
+        status, response = self.request(method, path, body)
+        return status, json.loads(response) if response else None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Stats:
+    """
+    Задержки и пропускная способность считаются только по успешным запросам: быстрые ответы
+    с ошибкой не должны выглядеть как хорошая производительность
+    """
+
+    def __init__(self):
+        self.requests = {}
+        self.latencies = {}
+        self.errors = {}
+        self.races = {}
+        self.lock = threading.Lock()
+
+    def measure(self, name, func, *args, expected=(200,), race=None):
+        """
+        race(status) отвечает, объясняется ли неожиданный код гонкой с удалением товара другим
+        пользователем; такой запрос не считается ни успешным, ни ошибкой
+        """
+        start = time.perf_counter()
+        try:
+            status, result = func(*args)
+        except (OSError, ValueError, http.client.HTTPException):
+            status, result = None, None
+        elapsed = time.perf_counter() - start
+        if status in expected:
+            outcome = self.latencies
+        elif race is not None and race(status):
+            outcome = self.races
+        else:
+            outcome = self.errors
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            if outcome is self.latencies:
+                self.latencies.setdefault(name, []).append(elapsed)
+            else:
+                outcome[name] = outcome.get(name, 0) + 1
+        return status, result
+
+    def summary(self, total_time):
+        result = {}
+        for name, requests in sorted(self.requests.items()):
+            values = sorted(self.latencies.get(name, []))
+            result[name] = {
+                'requests': requests,
+                'errors': self.errors.get(name, 0),
+                'races': self.races.get(name, 0),
+                'throughput': round(len(values) / total_time, 1),
+            }
+            if values:
+                result[name].update({
+                    'mean_ms': round(sum(values) / len(values) * 1000, 3),
+                    'p50_ms': round(values[len(values) // 2] * 1000, 3),
+                    'p99_ms': round(values[min(len(values) - 1, int(len(values) * 0.99))] * 1000, 3),
+                    'max_ms': round(values[-1] * 1000, 3),
+                })
+        return result
+
+
+class IdPool:
+    """Множество идентификаторов со случайным выбором за O(1): список плюс позиции элементов в нём"""
+
+    def __init__(self):
+        self.items = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, id):
+        return id in self.positions
+
+    def add(self, id):
+        if id not in self.positions:
+            self.positions[id] = len(self.items)
+            self.items.append(id)
+
+    def discard(self, id):
+        position = self.positions.pop(id, None)
+        if position is None:
+            return
+        # На место удалённого переносим последний элемент
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def choice(self, rng):
+        return rng.choice(self.items) if self.items else None
+
+
+class Catalog:
+    """
+    Идентификаторы живых товаров и товаров с картинками, общие для всех виртуальных пользователей.
+    Товар с картинкой есть в обоих множествах, удаление убирает его из обоих
+    """
+
+    def __init__(self):
+        self.ids = IdPool()
+        self.with_images = IdPool()
+        self.lock = threading.Lock()
+
+    def add(self, id):
+        with self.lock:
+            self.ids.add(id)
+
+    def add_image(self, id):
+        """Отмечает картинку у товара, если его не успели удалить, пока она загружалась"""
+        with self.lock:
+            if id in self.ids:
+                self.with_images.add(id)
+
+    def deleted(self, id):
+        """Товара уже нет в каталоге: 404 на него — гонка с удалением, а не ошибка сервиса"""
+        with self.lock:
+            return id not in self.ids
+
+    def pick(self, rng, image=False):
+        with self.lock:
+            return (self.with_images if image else self.ids).choice(rng)
+
+    def remove(self, rng):
+        with self.lock:
+            if len(self.ids) <= 1:
+                return None
+            id = self.ids.choice(rng)
+            self.ids.discard(id)
+            self.with_images.discard(id)
+            return id
+
+
+def fake_image(rng, size=16 * 1024):
+    """Байты с сигнатурой PNG: сервис хранит картинку как есть, разбирать её не нужно"""
+    return PNG_SIGNATURE + rng.randbytes(size - len(PNG_SIGNATURE))
+
+
+def seed(base_url, catalog, rng):
+    client = Client(base_url)
+    for i in range(SEED_PRODUCTS):
+        status, product = client.call('POST', '/product', {'name': f'seed-{i}', 'description': f'description {i}'})
+        catalog.add(product['id'])
+        if i < SEED_IMAGES:
+            client.request('POST', f'/product/{product["id"]}/image', fake_image(rng), 'image/png')
+            catalog.add_image(product['id'])
+    client.close()
+
+
+def one_operation(client, stats, catalog, rng, operation, i):
+    if operation == 'create':
+        status, product = stats.measure('create', client.call, 'POST', '/product',
+                                        {'name': f'product-{i}', 'description': f'description {i}'})
+        if status == 200:
+            catalog.add(product['id'])
+    elif operation == 'delete':
+        id = catalog.remove(rng)
+        if id is not None:
+            stats.measure('delete', client.call, 'DELETE', f'/product/{id}')
+    elif operation == 'list':
+        stats.measure('list', client.request, 'GET', f'/products?limit=50&prefix=product-{rng.randrange(10)}')
+    else:
+        id = catalog.pick(rng, image=operation == 'image_get')
+        if id is None:
+            return
+
+        def race(status):
+            return status == 404 and catalog.deleted(id)
+
+        if operation == 'get':
+            stats.measure('get', client.call, 'GET', f'/product/{id}', race=race)
+        elif operation == 'update':
+            stats.measure('update', client.call, 'PUT', f'/product/{id}', {'description': f'updated {i}'}, race=race)
+        elif operation == 'image_get':
+            stats.measure('image_get', client.request, 'GET', f'/product/{id}/image', race=race)
+        elif operation == 'image_upload':
+            status, _ = stats.measure('image_upload', client.request, 'POST', f'/product/{id}/image',
+                                      fake_image(rng), 'image/png', race=race)
+            if status == 200:
+                catalog.add_image(id)
+
+
+def run_level(base_url, concurrency, duration, mix, seed_value):
+    """Один уровень нагрузки: concurrency пользователей в замкнутом цикле в течение duration секунд"""
+    stats = Stats()
+    catalog = Catalog()
+    seed(base_url, catalog, random.Random(seed_value))
+    operations = list(mix)
+    weights = [mix[name] for name in operations]
+    deadline = time.perf_counter() + duration
+
+    def user(number):
+        rng = random.Random(seed_value * 1000 + number)
+        client = Client(base_url)
+        i = 0
+        while time.perf_counter() < deadline:
+            operation = rng.choices(operations, weights)[0]
+            one_operation(client, stats, catalog, rng, operation, f'{number}-{i}')
+            i += 1
+        client.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total_time = time.perf_counter() - start
+
+    endpoints = stats.summary(total_time)
+    return {
+        'concurrency': concurrency,
+        'duration_s': round(total_time, 3),
+        'throughput': round(sum(len(values) for values in stats.latencies.values()) / total_time, 1),
+        'errors': sum(e['errors'] for e in endpoints.values()),
+        'endpoints': endpoints,
+    }
+
+
+def level_failures(level):
+    """Конечные точки, из-за которых уровень нагрузки провален"""
+    failures = []
+    for name, e in level['endpoints'].items():
+        if e['errors'] and (name in READ_ENDPOINTS or e['errors'] > e['requests'] * MAX_ERROR_SHARE):
+            failures.append(f'{name}: {e["errors"]} of {e["requests"]} requests failed')
+    return failures
+
+
+def print_level(level):
+    print(f'concurrency {level["concurrency"]}: {level["throughput"]:.1f} successful req/s total, '
+          f'{level["errors"]} errors')
+    for name, e in level['endpoints'].items():
+        latency = f'mean {e["mean_ms"]:.2f} ms  p99 {e["p99_ms"]:.2f} ms' if 'mean_ms' in e else 'no successful requests'
+        print(f'  {name:<13} {e["requests"]:>7} req  {e["throughput"]:>9.1f} req/s  {latency}  '
+              f'errors {e["errors"]}  races {e["races"]}')
+
+
+def main(base_url, levels, duration, mix, seed_value, output):
+    """Возвращает False, если хоть один уровень провален по ошибкам"""
+    result = {
+        'url': base_url,
+        'duration_per_level_s': duration,
+        'seed': seed_value,
+        'mix': mix,
+        'levels': [],
+    }
+    failed = False
+    for concurrency in levels:
+        level = run_level(base_url, concurrency, duration, mix, seed_value)
+        print_level(level)
+        level['failures'] = level_failures(level)
+        for failure in level['failures']:
+            print(f'  FAILED {failure}')
+        failed = failed or bool(level['failures'])
+        result['levels'].append(level)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f'Results saved to {os.path.abspath(output)}')
+    return not failed
+
+
+def parse_mix(text):
+    mix = dict(DEFAULT_MIX)
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'unknown operation: {name}')
+        mix[name] = float(weight)
+    return mix
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Load test of the product service: CRUD, list and image traffic at several concurrency levels')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Service base URL')
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated numbers of concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per concurrency level')
+    parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                        help='Override operation weights, e.g. get=80,update=5')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for a reproducible operation sequence')
+    parser.add_argument('--output', help='Save results as JSON to this file')
+
+    args = parser.parse_args()
+
+    if not main(args.url, [int(c) for c in args.concurrency.split(',')], args.duration, args.mix, args.seed,
+                args.output):
+        sys.exit(1)
@@ -0,0 +1,50 @@
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    LRU уже сериализованных ответов с ограничением на суммарный размер.
+    Запись хранится вместе с версией данных, из которых построена: при чтении
+    версия сверяется с текущей, поэтому изменения из других процессов
+    не отдаются устаревшими, даже если до этого процесса не дошла инвалидация.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, value, size):
+        # Слишком большие ответы (например, весь каталог) не вытесняют всё остальное
+        if size > self.max_bytes // 8:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            self.entries[key] = (version, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def discard(self, key):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
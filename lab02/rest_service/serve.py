@@ -0,0 +1,116 @@
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+# Рабочий процесс, упавший быстрее этого, считается сломанным при запуске: перезапускать его бессмысленно
+MIN_WORKER_LIFETIME = 1.0
+
+
+def serve_worker(listen_socket, host, port):
+    """Рабочий процесс: приложение импортируется уже после fork, так что соединения с базой у каждого свои"""
+    from werkzeug.serving import make_server
+    from service import app
+
+    server = make_server(host, port, app, threaded=True, fd=listen_socket.fileno())
+    server.serve_forever()
+
+
+def serve_prefork(host, port, workers):
+    """
+    Несколько процессов принимают соединения с одного слушающего сокета,
+    открытого до fork; ядро само распределяет соединения между ними.
+    Родитель только следит за процессами и перезапускает упавшие.
+    """
+    listen_socket = socket.create_server((host, port), backlog=1024)
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            status = 0
+            try:
+                serve_worker(listen_socket, host, port)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers):
+        spawn()
+    print(f'Serving on http://{host}:{listen_socket.getsockname()[1]} with {workers} worker processes')
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if stopping or started is None:
+            continue
+        if time.monotonic() - started < MIN_WORKER_LIFETIME:
+            print(f'Worker {pid} exited right after start (status {status}), shutting down', file=sys.stderr)
+            stop(None, None)
+            continue
+        print(f'Worker {pid} exited (status {status}), restarting', file=sys.stderr)
+        spawn()
+
+
+def serve_gunicorn(host, port, workers, threads):
+    """Тот же сервис под gunicorn с потоковыми воркерами, если он установлен"""
+    from gunicorn.app.base import BaseApplication
+
+    class ProductsApplication(BaseApplication):
+
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+
+        def load(self):
+            from service import app
+            return app
+
+    ProductsApplication().run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Production entry point of the product service')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=5000, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per worker (gunicorn only)')
+    parser.add_argument('--server', choices=('prefork', 'gunicorn'), default='prefork',
+                        help='Built-in pre-fork server on werkzeug, or gunicorn if installed')
+    parser.add_argument('--access-log', action='store_true', help='Log every request')
+
+    args = parser.parse_args()
+
+    if args.workers > 1 and os.environ.get('PRODUCTS_STORAGE') == 'memory':
+        parser.error('memory storage is per-process, use PRODUCTS_STORAGE=sqlite with several workers')
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    if args.server == 'gunicorn':
+        serve_gunicorn(args.host, args.port, args.workers, args.threads)
+    else:
+        serve_prefork(args.host, args.port, args.workers)
@@ -1,43 +1,57 @@
+import base64
 import json
+import mimetypes
+import os
 import flask
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 
-last_product_id = -1
+from batch import BatchFormatError, check_product_fields, iter_json_array, iter_ndjson, parse_operation
+from blobs import THUMBNAIL_SIZES, THUMBNAILS_ENABLED, BlobStore, ThumbnailUnavailable, guess_image_type
+from response_cache import ResponseCache
+from storage import PRODUCT_FIELDS, create_storage, scan_key
 
+app = Flask(__name__)
 
-class Product:
+products = create_storage()
 
-    def __init__(self, name, description, icon=None):
-        global last_product_id
-        last_product_id += 1
+images = BlobStore(os.environ.get('PRODUCTS_IMAGES', 'blobs'))
 
-        self.id = last_product_id
-        self.name = name
-        self.description = description
-        self.icon = icon
+PRODUCT_COLUMNS = ('id',) + PRODUCT_FIELDS
 
-    def __iter__(self):
-        yield 'id', self.id
-        yield 'name', self.name
-        yield 'description', self.description
-        if self.icon:
-            yield 'icon', self.icon
+# Сколько товаров сериализуется в одну порцию потокового ответа
+STREAM_BATCH_SIZE = 500
 
-    def set_field(self, name, field):
-        if name == 'name':
-            self.name = field
-        elif name == 'description':
-            self.description = field
-        elif name == 'icon':
-            self.icon = field
+# Наибольшая страница списка: больше сразу читать из базы и класть в кэш ответов нельзя,
+# остальное клиент дочитывает по X-Next-Cursor
+MAX_PAGE_SIZE = 1000
 
-    def get_image(self):
-        return self.icon
+# Объём LRU сериализованных ответов в каждом процессе
+RESPONSE_CACHE_SIZE = 64 * 1024 * 1024
 
+# Сколько секунд клиент может не перепроверять картинку
+IMAGE_MAX_AGE = 300
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+
+
+def product_dict(product):
+    return {column: getattr(product, column) for column in PRODUCT_COLUMNS}
+
+
+def product_etag(id, version):
+    return f'{id}-{version}'
 
-app = Flask(__name__)
 
-products = dict()
+def json_response(body, etag, mimetype='application/json'):
+    # no-cache: клиент хранит ответ, но каждый раз сверяет ETag; при совпадении получит 304 без тела
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def not_modified(etag):
+    return json_response(None, etag), 304
 
 
 @app.route('/product', methods=['POST'])
@@ -47,14 +61,21 @@ def create_product():
     except json.JSONDecodeError:
         return jsonify({'error': 'Invalid JSON'}), 400
 
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid JSON'}), 400
     try:
-        product = Product(data['name'], data['description'])
+        fields = {'name': data['name'], 'description': data['description']}
     except KeyError:
         return jsonify({'error': 'Missing required field'}), 400
+    # Проверка до хранилища: в SQLite null или не строка обернулись бы ошибкой 500
+    try:
+        check_product_fields(fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    products[product.id] = product
+    product = products.create(fields['name'], fields['description'])
 
-    return jsonify(product.__dict__)
+    return jsonify(product_dict(product))
 
 
 @app.route('/product/<product_id>', methods=['GET'])
@@ -63,10 +84,24 @@ def get_product(product_id):
         id = int(product_id)
     except ValueError:
         return jsonify({'error': 'Invalid product id'}), 400
-    if id not in products:
+
+    # Сначала только версия: для If-None-Match и для проверки кэша строку целиком читать не нужно
+    version = products.get_version(id)
+    if version is None:
         return jsonify({'error': 'Product not found'}), 404
+    if request.if_none_match.contains_weak(product_etag(id, version)):
+        return not_modified(product_etag(id, version))
+
+    body = response_cache.get(('product', id), version)
+    if body is None:
+        product = products.get(id)
+        if product is None:
+            return jsonify({'error': 'Product not found'}), 404
+        version = product.version
+        body = (app.json.dumps(product_dict(product)) + '\n').encode()
+        response_cache.put(('product', id), version, body, len(body))
 
-    return jsonify(products[id].__dict__)
+    return json_response(body, product_etag(id, version))
 
 
 @app.route('/product/<product_id>', methods=['PUT'])
@@ -80,17 +115,25 @@ def update_product(product_id):
         id = int(product_id)
     except ValueError:
         return jsonify({'error': 'Invalid product id'}), 400
-    if id not in products:
+    if products.get(id) is None:
         return jsonify({'error': 'Product not found'}), 404
 
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid JSON'}), 400
     for field in data.keys():
-        if field not in products[id].__dict__.keys() or field == 'id':
+        if field not in PRODUCT_FIELDS:
             return jsonify({'error': 'Invalid field'}), 400
+    try:
+        check_product_fields(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    for field in data.keys():
-        products[id].set_field(field, data[field])
+    product = products.update(id, data)
+    response_cache.discard(('product', id))
+    if product is None:
+        return jsonify({'error': 'Product not found'}), 404
 
-    return jsonify(products[id].__dict__)
+    return jsonify(product_dict(product))
 
 
 @app.route('/product/<product_id>', methods=['DELETE'])
@@ -99,41 +142,198 @@ def delete_product(product_id):
         id = int(product_id)
     except ValueError:
         return jsonify({'error': 'Invalid product id'}), 400
-    if id not in products:
+    product = products.delete(id)
+    response_cache.discard(('product', id))
+    if product is None:
         return jsonify({'error': 'Product not found'}), 404
 
-    product = products[id]
-    del products[id]
-
-    return jsonify(product.__dict__)
+    return jsonify(product_dict(product))
 
 
 @app.route('/products', methods=['GET'])
 def get_all():
-    return jsonify(list(map(lambda x: x.__dict__, products.values())))
+    prefix = request.args.get('prefix') or None
+
+    fields = None
+    if request.args.get('fields'):
+        fields = request.args.get('fields').split(',')
+        if any(field not in PRODUCT_COLUMNS for field in fields):
+            return jsonify({'error': 'Invalid field'}), 400
+
+    limit = None
+    if request.args.get('limit'):
+        try:
+            limit = int(request.args.get('limit'))
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
+        if limit <= 0:
+            return jsonify({'error': 'Invalid limit'}), 400
+        limit = min(limit, MAX_PAGE_SIZE)
+
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args.get('cursor'), prefix)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    ndjson = request.args.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', '')
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+
+    # Версия каталога читается до выборки: если запись успеет вклиниться, ответ окажется
+    # новее своего ETag, и клиент просто получит его заново, но никогда не получит 304 на устаревший
+    version = products.catalog_version()
+    etag = f'catalog-{version}-{"ndjson" if ndjson else "json"}'
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    if limit:
+        key = ('products', request.query_string, ndjson)
+        cached = response_cache.get(key, version)
+        if cached is None:
+            # Страница ограничена limit, поэтому её можно прочитать целиком и узнать курсор следующей
+            items = list(products.scan(prefix, after, limit + 1))
+            next_cursor = None
+            if len(items) > limit:
+                items = items[:limit]
+                next_cursor = encode_cursor(scan_key(items[-1], prefix))
+            body = ''.join(stream_products(items, fields, ndjson)).encode()
+            cached = (body, next_cursor)
+            response_cache.put(key, version, cached, len(body))
+        body, next_cursor = cached
+        response = json_response(body, etag, mimetype)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+    else:
+        response = json_response(stream_products(products.scan(prefix, after), fields, ndjson), etag, mimetype)
+    response.vary.add('Accept')
+    return response
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor, prefix):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if prefix:
+        if not (isinstance(key, list) and len(key) == 2 and isinstance(key[0], str) and isinstance(key[1], int)):
+            raise ValueError('Invalid cursor')
+    elif not isinstance(key, int):
+        raise ValueError('Invalid cursor')
+    return key
+
+
+def stream_products(items, fields, ndjson):
+    return stream_json((product_dict(product) if fields is None else {field: getattr(product, field) for field in fields}
+                        for product in items), ndjson)
+
+
+def stream_json(records, ndjson):
+    """Отдаёт записи порциями: в памяти одновременно не больше STREAM_BATCH_SIZE сериализованных записей"""
+    separator = '\n' if ndjson else ','
+    if not ndjson:
+        yield '['
+    first = True
+    batch = []
+    for data in records:
+        batch.append(app.json.dumps(data, separators=(',', ':')))
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield ('' if first or ndjson else separator) + separator.join(batch) + ('\n' if ndjson else '')
+            first = False
+            batch = []
+    if batch:
+        yield ('' if first or ndjson else separator) + separator.join(batch) + ('\n' if ndjson else '')
+    if not ndjson:
+        yield ']'
+
+
+@app.route('/products/batch', methods=['POST'])
+def batch_products():
+    """
+    Пакет операций create/update/delete в виде NDJSON или JSON-массива, все в одной транзакции.
+    Тело сначала читается и проверяется целиком, и только потом открывается транзакция: медленный
+    клиент не держит блокировку записи. На каждую операцию возвращается результат с кодом как у
+    одиночного запроса; ошибочные операции пропускаются, не мешая остальным.
+    """
+    ndjson = request.mimetype == 'application/x-ndjson' or request.args.get('format') == 'ndjson'
+    items = iter_ndjson(request.stream) if ndjson else iter_json_array(request.stream)
+
+    operations = []
+    try:
+        for item, error in items:
+            if error is None:
+                try:
+                    operations.append(parse_operation(item))
+                    continue
+                except ValueError as e:
+                    error = str(e)
+            operations.append(error)
+    except BatchFormatError as e:
+        return jsonify({'error': str(e)}), 400
+
+    results = []
+    changed = []
+    with products.batch() as batch:
+        for operation in operations:
+            if isinstance(operation, str):
+                results.append({'status': 400, 'error': operation})
+                continue
+            op, id, fields = operation
+
+            if op == 'create':
+                id = batch.create(fields['name'], fields['description'])
+                found = True
+            elif op == 'update':
+                found = batch.update(id, fields)
+            else:
+                found = batch.delete(id)
+
+            if found:
+                results.append({'status': 200, 'id': id})
+                if op != 'create':
+                    changed.append(id)
+            else:
+                results.append({'status': 404, 'id': id, 'error': 'Product not found'})
+
+    for id in changed:
+        response_cache.discard(('product', id))
+
+    return Response(stream_json(results, ndjson), mimetype='application/x-ndjson' if ndjson else 'application/json')
 
 
 @app.route('/product/<product_id>/image', methods=['POST'])
 def upload_image(product_id):
+    """
+    Картинка принимается полем icon формы multipart или прямо телом запроса (Content-Type: image/*).
+    Второй вариант копируется из сокета в хранилище блоками, минуя разбор формы.
+    """
     try:
         id = int(product_id)
     except ValueError:
         return jsonify({'error': 'Invalid product id'}), 400
 
-    if id not in products:
+    if products.get(id) is None:
         return jsonify({'error': 'Product not found'}), 404
 
-    product = products[id]
-
-    try:
-        file = request.files['icon']
-        file.save(f'{product_id}.png')
-    except KeyError:
+    if request.mimetype == 'multipart/form-data':
+        try:
+            stream = request.files['icon'].stream
+        except KeyError:
+            return jsonify({'error': 'Missing required field'}), 400
+    elif request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+        stream = request.stream
+    else:
         return jsonify({'error': 'Missing required field'}), 400
 
-    product.icon = f'{product_id}.png'
+    digest = images.store(stream)
+    products.update(id, {'icon': digest})
+    response_cache.discard(('product', id))
 
-    return jsonify({'image': f'{product_id}.png'}), 200
+    return jsonify({'image': digest}), 200
 
 
 @app.route('/product/<product_id>/image', methods=['GET'])
@@ -143,15 +343,41 @@ def get_image(product_id):
     except ValueError:
         return jsonify({'error': 'Invalid product id'}), 400
 
-    if id not in products:
+    product = products.get(id)
+    if product is None:
         return jsonify({'error': 'Product not found'}), 404
 
-    product = products[id]
-
     if not product.icon:
         return jsonify({'error': 'Icon not found'}), 404
 
-    return send_file(product.icon, as_attachment=True)
+    # Старые записи хранят имя файла вместо хэша
+    digest = product.icon if BlobStore.is_digest(product.icon) else None
+    path = images.path(digest) if digest else os.path.abspath(product.icon)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Icon not found'}), 404
+    etag = digest or True
+
+    if request.args.get('size'):
+        try:
+            size = int(request.args.get('size'))
+        except ValueError:
+            return jsonify({'error': 'Invalid size'}), 400
+        if size not in THUMBNAIL_SIZES or digest is None:
+            return jsonify({'error': 'Invalid size'}), 400
+        try:
+            path = images.thumbnail(digest, size)
+        except ThumbnailUnavailable:
+            if not THUMBNAILS_ENABLED:
+                return jsonify({'error': 'Thumbnails are not available'}), 501
+            return jsonify({'error': 'Icon is not an image'}), 415
+        etag = f'{digest}-{size}'
+
+    # send_file отвечает 304 на If-None-Match и 206 на Range; файл отдаётся через wsgi.file_wrapper,
+    # и серверы, которые его поддерживают, шлют его sendfile без копирования в пользовательское пространство
+    mimetype = guess_image_type(path)
+    return send_file(path, mimetype=mimetype, as_attachment=True,
+                     download_name=f'{product_id}{mimetypes.guess_extension(mimetype) or ""}',
+                     etag=etag, max_age=IMAGE_MAX_AGE)
 
 if __name__ == '__main__':
     app.run(debug=True)
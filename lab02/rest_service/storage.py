@@ -0,0 +1,332 @@
+import contextlib
+import os
+import sqlite3
+import threading
+
+PRODUCT_FIELDS = ('name', 'description', 'icon')
+
+# Граница сверху для поиска по префиксу: максимальный символ Unicode
+PREFIX_END = '\U0010ffff'
+
+# Сколько строк читать из базы за раз при потоковой выдаче
+SCAN_BATCH_SIZE = 1000
+
+
+def scan_key(product, prefix=None):
+    """Ключ товара в порядке выдачи scan: id, а при фильтре по префиксу — (name, id)"""
+    return [product.name, product.id] if prefix else product.id
+
+
+class Product:
+
+    def __init__(self, name, description, icon=None, id=None, version=0):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.icon = icon
+        # Растёт при каждом изменении товара, из него строится ETag
+        self.version = version
+
+    def __iter__(self):
+        yield 'id', self.id
+        yield 'name', self.name
+        yield 'description', self.description
+        if self.icon:
+            yield 'icon', self.icon
+
+    def set_field(self, name, field):
+        if name == 'name':
+            self.name = field
+        elif name == 'description':
+            self.description = field
+        elif name == 'icon':
+            self.icon = field
+
+    def get_image(self):
+        return self.icon
+
+
+class MemoryBatch:
+    """Операции пакета над MemoryStorage; откатить их нельзя, пакет только не перемежается с другими записями"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def create(self, name, description):
+        return self.storage.create(name, description).id
+
+    def update(self, id, fields):
+        return self.storage.update(id, fields) is not None
+
+    def delete(self, id):
+        return self.storage.delete(id) is not None
+
+
+class SQLiteBatch:
+    """
+    Операции пакета внутри одной транзакции SQLiteStorage. Счётчики id и версии
+    каталога читаются один раз в начале и записываются один раз при фиксации,
+    а не обновляются на каждую вставку.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.last_id = connection.execute("SELECT last_id FROM ids WHERE name = 'products'").fetchone()[0]
+        self.changes = 0
+
+    def create(self, name, description):
+        self.last_id += 1
+        self.connection.execute(
+            'INSERT INTO products (id, name, description) VALUES (?, ?, ?)', (self.last_id, name, description))
+        self.changes += 1
+        return self.last_id
+
+    def update(self, id, fields):
+        columns = [field for field in PRODUCT_FIELDS if field in fields]
+        if not columns:
+            return self.connection.execute('SELECT 1 FROM products WHERE id = ?', (id,)).fetchone() is not None
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        cursor = self.connection.execute(f'UPDATE products SET {assignments}, version = version + 1 WHERE id = ?',
+                                         [fields[column] for column in columns] + [id])
+        self.changes += cursor.rowcount
+        return cursor.rowcount > 0
+
+    def delete(self, id):
+        cursor = self.connection.execute('DELETE FROM products WHERE id = ?', (id,))
+        self.changes += cursor.rowcount
+        return cursor.rowcount > 0
+
+    def finish(self):
+        self.connection.execute("UPDATE ids SET last_id = ? WHERE name = 'products'", (self.last_id,))
+        if self.changes:
+            self.connection.execute("UPDATE ids SET last_id = last_id + ? WHERE name = 'catalog'", (self.changes,))
+
+
+class MemoryStorage:
+    """Хранение в словаре процесса: данные теряются при перезапуске, годится только для одного процесса"""
+
+    def __init__(self):
+        self.products = dict()
+        self.last_product_id = -1
+        self.version = 0
+        # Повторно входимая: пакет держит блокировку и вызывает create/update/delete
+        self.lock = threading.RLock()
+
+    def create(self, name, description):
+        with self.lock:
+            self.last_product_id += 1
+            product = Product(name, description, id=self.last_product_id)
+            self.products[product.id] = product
+            self.version += 1
+        return product
+
+    def get(self, id):
+        return self.products.get(id)
+
+    def get_version(self, id):
+        product = self.products.get(id)
+        return product.version if product is not None else None
+
+    def catalog_version(self):
+        return self.version
+
+    def update(self, id, fields):
+        with self.lock:
+            product = self.products.get(id)
+            if product is None or not fields:
+                return product
+            # Изменения применяются к копии: читатели без блокировки не видят товар наполовину обновлённым
+            product = Product(product.name, product.description, product.icon, id=id, version=product.version + 1)
+            for field, value in fields.items():
+                product.set_field(field, value)
+            self.products[id] = product
+            self.version += 1
+        return product
+
+    def delete(self, id):
+        with self.lock:
+            product = self.products.pop(id, None)
+            if product is not None:
+                self.version += 1
+            return product
+
+    def list(self):
+        return list(self.products.values())
+
+    @contextlib.contextmanager
+    def batch(self):
+        with self.lock:
+            yield MemoryBatch(self)
+
+    def scan(self, prefix=None, after=None, limit=None):
+        """Полный перебор словаря: без индексов, только для отладки и тестов"""
+        if prefix:
+            products = sorted((p for p in list(self.products.values()) if p.name.startswith(prefix)),
+                              key=lambda p: (p.name, p.id))
+            if after is not None:
+                products = [p for p in products if [p.name, p.id] > list(after)]
+        else:
+            products = [p for p in list(self.products.values()) if after is None or p.id > after]
+        return iter(products[:limit] if limit else products)
+
+
+class SQLiteStorage:
+    """
+    Хранение в SQLite в режиме WAL: читатели не блокируют писателя, так что
+    один файл базы могут разделять несколько процессов WSGI-сервера.
+    Идентификаторы берутся из счётчика в той же транзакции, что и вставка:
+    UPDATE захватывает блокировку записи, поэтому процессы не получат один id.
+    Так же устроена версия каталога: каждое изменение увеличивает её в своей транзакции.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        connection = self.connection()
+        with connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS products ('
+                'id INTEGER PRIMARY KEY, '
+                'name TEXT NOT NULL, '
+                'description TEXT NOT NULL, '
+                'icon TEXT, '
+                'version INTEGER NOT NULL DEFAULT 0)'
+            )
+            # Базы, созданные до появления версий, дополняются столбцом на месте
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(products)')]
+            if 'version' not in columns:
+                connection.execute('ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+            connection.execute('CREATE INDEX IF NOT EXISTS products_name ON products (name)')
+            connection.execute('CREATE TABLE IF NOT EXISTS ids (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)')
+            connection.execute("INSERT OR IGNORE INTO ids (name, last_id) VALUES ('products', -1)")
+            connection.execute("INSERT OR IGNORE INTO ids (name, last_id) VALUES ('catalog', 0)")
+
+    def connection(self):
+        # Соединение на поток: sqlite3 кэширует подготовленные выражения внутри соединения
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, cached_statements=256)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    @staticmethod
+    def to_product(row):
+        if row is None:
+            return None
+        id, name, description, icon, version = row
+        return Product(name, description, icon, id=id, version=version)
+
+    def create(self, name, description):
+        connection = self.connection()
+        with connection:
+            connection.execute("UPDATE ids SET last_id = last_id + 1 WHERE name = 'products'")
+            id = connection.execute("SELECT last_id FROM ids WHERE name = 'products'").fetchone()[0]
+            connection.execute(
+                'INSERT INTO products (id, name, description) VALUES (?, ?, ?)', (id, name, description))
+            connection.execute("UPDATE ids SET last_id = last_id + 1 WHERE name = 'catalog'")
+        return Product(name, description, id=id)
+
+    def get(self, id):
+        row = self.connection().execute(
+            'SELECT id, name, description, icon, version FROM products WHERE id = ?', (id,)).fetchone()
+        return self.to_product(row)
+
+    def get_version(self, id):
+        row = self.connection().execute('SELECT version FROM products WHERE id = ?', (id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def catalog_version(self):
+        return self.connection().execute("SELECT last_id FROM ids WHERE name = 'catalog'").fetchone()[0]
+
+    def update(self, id, fields):
+        connection = self.connection()
+        columns = [field for field in PRODUCT_FIELDS if field in fields]
+        with connection:
+            if columns:
+                assignments = ', '.join(f'{column} = ?' for column in columns)
+                cursor = connection.execute(f'UPDATE products SET {assignments}, version = version + 1 WHERE id = ?',
+                                            [fields[column] for column in columns] + [id])
+                if cursor.rowcount:
+                    connection.execute("UPDATE ids SET last_id = last_id + 1 WHERE name = 'catalog'")
+            row = connection.execute(
+                'SELECT id, name, description, icon, version FROM products WHERE id = ?', (id,)).fetchone()
+        return self.to_product(row)
+
+    def delete(self, id):
+        connection = self.connection()
+        with connection:
+            row = connection.execute(
+                'SELECT id, name, description, icon, version FROM products WHERE id = ?', (id,)).fetchone()
+            if row is not None:
+                connection.execute('DELETE FROM products WHERE id = ?', (id,))
+                connection.execute("UPDATE ids SET last_id = last_id + 1 WHERE name = 'catalog'")
+        return self.to_product(row)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Транзакция для пакета операций. BEGIN IMMEDIATE сразу берёт блокировку записи,
+        поэтому прочитанный в начале счётчик id не устареет до фиксации.
+        Исключение внутри блока откатывает весь пакет.
+        """
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            batch = SQLiteBatch(connection)
+            yield batch
+            batch.finish()
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+
+    def list(self):
+        rows = self.connection().execute('SELECT id, name, description, icon, version FROM products ORDER BY id')
+        return [self.to_product(row) for row in rows]
+
+    def scan(self, prefix=None, after=None, limit=None):
+        """
+        Генератор товаров по возрастанию id, либо по (name, id) при фильтре по префиксу имени.
+        after — scan_key последнего товара предыдущей страницы. Оба варианта идут по
+        индексу (первичному ключу или products_name), поэтому страница стоит O(limit)
+        независимо от её номера и размера каталога.
+        """
+        sql = 'SELECT id, name, description, icon, version FROM products'
+        params = []
+        if prefix:
+            sql += ' WHERE name >= ? AND name < ?'
+            if after is not None:
+                # Диапазон индекса начинается сразу с имени из курсора, а не с начала префикса
+                sql += ' AND (name, id) > (?, ?)'
+                params += [max(prefix, after[0]), prefix + PREFIX_END] + list(after)
+            else:
+                params += [prefix, prefix + PREFIX_END]
+            sql += ' ORDER BY name, id'
+        else:
+            if after is not None:
+                sql += ' WHERE id > ?'
+                params.append(after)
+            sql += ' ORDER BY id'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        cursor = self.connection().execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(SCAN_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield self.to_product(row)
+
+
+def create_storage():
+    """Выбор хранилища через PRODUCTS_STORAGE (sqlite или memory) и PRODUCTS_DB"""
+    kind = os.environ.get('PRODUCTS_STORAGE', 'sqlite')
+    if kind == 'memory':
+        return MemoryStorage()
+    if kind == 'sqlite':
+        return SQLiteStorage(os.environ.get('PRODUCTS_DB', 'products.db'))
+    raise ValueError(f'Unknown storage: {kind}')
@@ -0,0 +1,92 @@
+import argparse
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import server
+
+
+def fetch(local_socket: socket.socket, filename: str, buffer: bytearray) -> int:
+    """Отправляет один GET по keep-alive соединению и дочитывает тело по Content-Length"""
+    local_socket.sendall(f'GET /{filename} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+
+    head = b''
+    while b'\r\n\r\n' not in head:
+        chunk = local_socket.recv(4096)
+        if not chunk:
+            raise ConnectionError('Server closed connection')
+        head += chunk
+    head, body = head.split(b'\r\n\r\n', 1)
+    content_length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.lower() == b'content-length':
+            content_length = int(value)
+
+    received = len(body)
+    view = memoryview(buffer)
+    while received < content_length:
+        n = local_socket.recv_into(view[:min(len(buffer), content_length - received)])
+        if n == 0:
+            raise ConnectionError('Server closed connection')
+        received += n
+    return content_length
+
+
+def run(port: int, filename: str, connections: int, requests: int) -> tuple[float, float]:
+    """connections клиентов по requests запросов каждый; возвращает (запросов/с, MB/с)"""
+    total_bytes = [0] * connections
+
+    def client(index: int) -> None:
+        buffer = bytearray(1024 * 1024)
+        with socket.create_connection(('127.0.0.1', port)) as local_socket:
+            for _ in range(requests):
+                total_bytes[index] += fetch(local_socket, filename, buffer)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(connections)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return connections * requests / elapsed, sum(total_bytes) / elapsed / 2 ** 20
+
+
+def main(concurrency_level: int, connections: int, requests: int, small_size: int, large_size: int) -> None:
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+    with open('small.bin', 'wb') as f:
+        f.write(os.urandom(small_size))
+    with open('large.bin', 'wb') as f:
+        f.write(os.urandom(large_size))
+
+    start_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    start_socket.bind(('127.0.0.1', 0))
+    start_socket.listen(128)
+    port = start_socket.getsockname()[1]
+    threading.Thread(target=server.serve_forever, args=(start_socket, concurrency_level, 64), daemon=True).start()
+
+    for filename, size, count in (('small.bin', small_size, requests), ('large.bin', large_size, max(1, requests // 100))):
+        rps, mbps = run(port, filename, connections, count)
+        print(f'{filename} ({size} bytes): {rps:.0f} requests/s, {mbps:.1f} MB/s')
+
+    for filename in ('small.bin', 'large.bin'):
+        os.remove(filename)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the lab03 file server')
+    parser.add_argument('--concurrency-level', type=int, default=8, help='Server worker threads')
+    parser.add_argument('--connections', type=int, default=8, help='Concurrent keep-alive client connections')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per connection for the small file')
+    parser.add_argument('--small-size', type=int, default=1024, help='Small file size in bytes')
+    parser.add_argument('--large-size', type=int, default=64 * 1024 * 1024, help='Large file size in bytes')
+
+    args = parser.parse_args()
+
+    main(args.concurrency_level, args.connections, args.requests, args.small_size, args.large_size)
@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import json
+import math
+import time
+
+from client import get_request_str
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек в стиле HDR: логарифмические интервалы, внутри
+    каждого — 2 ** precision_bits линейных ячеек, так что относительная
+    погрешность не превышает 2 ** (1 - precision_bits) при любом диапазоне значений.
+    """
+
+    def __init__(self, precision_bits: int = 7):
+        self.precision_bits = precision_bits
+        self.sub_buckets = 1 << precision_bits
+        self.counts = {}
+        self.total = 0
+        self.max_value = 0
+        self.min_value = None
+
+    def index(self, value: int) -> int:
+        if value < self.sub_buckets:
+            return value
+        exponent = value.bit_length() - self.precision_bits
+        return (exponent << self.precision_bits) + (value >> exponent)
+
+    def value_at(self, index: int) -> int:
+        """Верхняя граница ячейки"""
+        if index < self.sub_buckets:
+            return index
+        exponent = index >> self.precision_bits
+        mantissa = index & (self.sub_buckets - 1)
+        return ((mantissa + 1) << exponent) - 1
+
+    def record(self, value: int) -> None:
+        index = self.index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.max_value = max(self.max_value, value)
+        self.min_value = value if self.min_value is None else min(self.min_value, value)
+
+    def percentile(self, p: float) -> int:
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(self.total * p / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.value_at(index), self.max_value)
+        return self.max_value
+
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    """Дочитывает один ответ по Content-Length, возвращает код ответа"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode(errors='ignore').split('\r\n')
+    status = int(lines[0].split()[1])
+    content_length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name.lower() == 'content-length':
+            content_length = int(value)
+    left = content_length
+    while left > 0:
+        chunk = await reader.read(min(left, 1 << 20))
+        if not chunk:
+            raise ConnectionError('Server closed connection')
+        left -= len(chunk)
+    return status
+
+
+async def connection_worker(host: str, port: int, request: bytes, schedule: asyncio.Queue,
+                            histogram: LatencyHistogram, errors: list) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            intended = await schedule.get()
+            if intended is None:
+                return
+            try:
+                writer.write(request)
+                await writer.drain()
+                status = await read_response(reader)
+                if status != 200:
+                    errors.append(status)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                errors.append(str(e))
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            # Задержка отсчитывается от запланированного, а не фактического времени отправки:
+            # ожидание свободного соединения тоже входит в неё (без coordinated omission)
+            histogram.record(int((time.perf_counter() - intended) * 1_000_000))
+    finally:
+        writer.close()
+
+
+async def run(host: str, port: int, filename: str, rate: float, duration: float, connections: int) -> dict:
+    request = get_request_str(filename, host, port).encode()
+    histogram = LatencyHistogram()
+    errors = []
+    schedule = asyncio.Queue()
+
+    workers = [asyncio.create_task(connection_worker(host, port, request, schedule, histogram, errors))
+               for _ in range(connections)]
+
+    # Открытая модель нагрузки: запросы ставятся в очередь по расписанию, не дожидаясь ответов
+    total = int(rate * duration)
+    start = time.perf_counter()
+    sent = 0
+    while sent < total:
+        due = min(total, int((time.perf_counter() - start) * rate) + 1)
+        while sent < due:
+            schedule.put_nowait(start + sent / rate)
+            sent += 1
+        await asyncio.sleep(max(0.0, start + sent / rate - time.perf_counter()))
+
+    for _ in workers:
+        schedule.put_nowait(None)
+    await asyncio.gather(*workers)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'target_rate': rate,
+        'achieved_rate': round(histogram.total / elapsed, 1),
+        'requests': histogram.total,
+        'errors': len(errors),
+        'latency_us': {
+            'min': histogram.min_value or 0,
+            'p50': histogram.percentile(50),
+            'p90': histogram.percentile(90),
+            'p99': histogram.percentile(99),
+            'p99.9': histogram.percentile(99.9),
+            'max': histogram.max_value,
+        },
+    }
+
+
+def main(host: str, port: int, filename: str, rate: float, duration: float, connections: int, as_json: bool) -> None:
+    result = asyncio.run(run(host, port, filename, rate, duration, connections))
+    if as_json:
+        print(json.dumps(result))
+        return
+
+    print(f'{result["requests"]} requests at {result["achieved_rate"]} req/s '
+          f'(target {rate} req/s), errors: {result["errors"]}')
+    for name, value in result['latency_us'].items():
+        print(f'  {name:>6}: {value / 1000:.3f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Open-loop load generator for the lab03 server')
+    parser.add_argument('server_host', type=str, help='The host address of the server')
+    parser.add_argument('server_port', type=int, help='The port of the server')
+    parser.add_argument('filename', type=str, help='The filename of the file')
+    parser.add_argument('--rate', type=float, default=1000, help='Requests per second')
+    parser.add_argument('--duration', type=float, default=10, help='Test duration in seconds')
+    parser.add_argument('--connections', type=int, default=32, help='Number of keep-alive connections')
+    parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+
+    args = parser.parse_args()
+
+    main(args.server_host, args.server_port, args.filename, args.rate, args.duration, args.connections, args.json)
@@ -1,66 +1,388 @@
 import argparse
-import json
+import asyncio
+import heapq
+import mimetypes
+import os
+import queue
+import re
 import socket
+import stat as stat_module
 import threading
 import time
-from turtledemo.penrose import start
+from collections import OrderedDict
 
-threads = {}
-last_index = 0
+# Конец заголовков запроса; клиент из client.py завершает запрос последовательностью '\r\n\n'
+HEADERS_END = re.compile(rb'\r?\n\r?\n')
 
+MAX_REQUEST_SIZE = 64 * 1024
+KEEP_ALIVE_TIMEOUT = 5.0
+SMALL_FILE_SIZE = 16 * 1024
+FILE_CACHE_SIZE = 1024
 
-def one_socket_worker(current_socket: socket, addr, sem: threading.Semaphore) -> None:
-    sem.acquire()
 
-    request = current_socket.recv(1024).decode()
-    if not request:
-        sem.release()
+def split_request(buffer: bytes) -> tuple[bytes | None, bytes]:
+    """Отделяет заголовки первого запроса в буфере; (None, buffer), если они ещё не пришли целиком"""
+    match = HEADERS_END.search(buffer)
+    if match:
+        return buffer[:match.start()], buffer[match.end():]
+    return None, buffer
+
+
+def read_request(current_socket: socket.socket, buffer: bytes) -> tuple[bytes | None, bytes]:
+    """Читает заголовки одного запроса; возвращает (запрос, остаток буфера) или (None, b'') при закрытии"""
+    while True:
+        request, buffer = split_request(buffer)
+        if request is not None:
+            return request, buffer
+        if len(buffer) > MAX_REQUEST_SIZE:
+            return None, b''
+        chunk = current_socket.recv(4096)
+        if not chunk:
+            return None, b''
+        buffer += chunk
+
+
+def parse_request(request: bytes) -> tuple[str, bool] | None:
+    """Возвращает (имя файла, keep-alive) или None для некорректного запроса"""
+    request = request.decode(errors='ignore')
+    parts = request.split()
+    if len(parts) < 2:
+        return None
+    return parts[1][1:], wants_keep_alive(request)
+
+
+def wants_keep_alive(request: str) -> bool:
+    lines = request.split('\n')
+    version = lines[0].split()[2] if len(lines[0].split()) > 2 else 'HTTP/1.0'
+    connection = ''
+    for line in lines[1:]:
+        if line.lower().startswith('connection:'):
+            connection = line.split(':', 1)[1].strip().lower()
+    if version == 'HTTP/1.1':
+        return connection != 'close'
+    return connection == 'keep-alive'
+
+
+class CachedFile:
+    def __init__(self, file: str, stat: os.stat_result):
+        self.name = file
+        self.version = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        self.size = stat.st_size
+        self.content_type = mimetypes.guess_type(file)[0] or 'application/octet-stream'
+        self.content = None
+        self.f = None
+        f = open(file, 'rb')
+        if self.size <= SMALL_FILE_SIZE:
+            with f:
+                self.content = f.read()
+        elif hasattr(os, 'sendfile'):
+            # sendfile передаёт смещение явно, поэтому один открытый файл делят все потоки
+            self.f = f
+        else:
+            f.close()
+
+
+class FileCache:
+    """
+    Кэш метаданных и открытых файлов. Запись проверяется одним os.stat и
+    сбрасывается при смене mtime, размера или inode. Отсутствующие файлы
+    запоминаются вместе с mtime каталога: пока каталог не менялся, файла в нём нет.
+    Вытесненные файлы закрываются сборщиком мусора, когда их перестанут отправлять.
+    """
+
+    def __init__(self, max_entries: int = FILE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.files = OrderedDict()
+        self.missing = OrderedDict()
+        self.lock = threading.Lock()
+
+    def remember(self, entries: OrderedDict, file: str, value) -> None:
+        with self.lock:
+            entries[file] = value
+            entries.move_to_end(file)
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def get(self, file: str) -> CachedFile | None:
+        """Возвращает CachedFile или None, если файла нет"""
+        missing_version = self.missing.get(file)
+        if missing_version is not None:
+            try:
+                if os.stat(os.path.dirname(file) or '.').st_mtime_ns == missing_version:
+                    return None
+            except OSError:
+                return None
+
+        try:
+            stat = os.stat(file)
+        except OSError:
+            self.files.pop(file, None)
+            try:
+                self.remember(self.missing, file, os.stat(os.path.dirname(file) or '.').st_mtime_ns)
+            except OSError:
+                pass
+            return None
+        if not stat_module.S_ISREG(stat.st_mode):
+            return None
+
+        cached = self.files.get(file)
+        if cached and cached.version == (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+            return cached
+
+        try:
+            cached = CachedFile(file, stat)
+        except OSError:
+            return None
+        self.missing.pop(file, None)
+        self.remember(self.files, file, cached)
+        return cached
+
+
+file_cache = FileCache()
+
+
+def file_response_header(cached: CachedFile, keep_alive: bool) -> bytes:
+    connection = 'keep-alive' if keep_alive else 'close'
+    return (f'HTTP/1.1 200 OK\r\nContent-Type: {cached.content_type}\r\nContent-Length: {cached.size}\r\n'
+            f'Connection: {connection}\r\n\r\n').encode()
+
+
+def not_found_response(keep_alive: bool) -> bytes:
+    body = b'File not found error'
+    connection = 'keep-alive' if keep_alive else 'close'
+    header = (f'HTTP/1.1 404 Not Found\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n'
+              f'Connection: {connection}\r\n\r\n')
+    return header.encode() + body
+
+
+def send_file(current_socket: socket.socket, cached: CachedFile, keep_alive: bool) -> None:
+    header = file_response_header(cached, keep_alive)
+    if cached.content is not None:
+        # Маленький файл уходит вместе с заголовками одним сегментом
+        current_socket.sendall(header + cached.content)
         return
+    current_socket.sendall(header)
+    # Содержимое файла передаётся ядром напрямую из файла в сокет
+    if cached.f is not None:
+        current_socket.sendfile(cached.f, 0, cached.size)
+    else:
+        with open(cached.name, 'rb') as f:
+            current_socket.sendfile(f, 0, cached.size)
+
+
+def send_not_found(current_socket: socket.socket, keep_alive: bool) -> None:
+    current_socket.sendall(not_found_response(keep_alive))
+
 
-    global threads
-    global last_index
+class DelayedResponder:
+    """
+    Отложенные ответы без занятого потока пула: сокет передаётся единственному
+    потоку-таймеру, который отправляет ответ в назначенное время и закрывает соединение.
+    """
 
-    if not addr[1] in threads:
-        threads[addr[1]] = last_index
-        last_index += 1
+    def __init__(self):
+        self.heap = []
+        self.counter = 0
+        self.condition = threading.Condition()
+        threading.Thread(target=self.run, daemon=True).start()
 
-    file = request.split()[1][1:]
+    def schedule(self, delay: float, current_socket: socket.socket, respond) -> None:
+        with self.condition:
+            self.counter += 1
+            heapq.heappush(self.heap, (time.monotonic() + delay, self.counter, current_socket, respond))
+            self.condition.notify()
 
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    self.condition.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+                _, _, current_socket, respond = heapq.heappop(self.heap)
+            try:
+                respond(current_socket)
+            except OSError:
+                pass
+            finally:
+                current_socket.close()
+
+
+delayed_responder = None
+
+
+def one_socket_worker(current_socket: socket.socket, addr, not_found_delay: float = 0) -> None:
+    """Обслуживает соединение: несколько запросов подряд, пока клиент держит keep-alive"""
+    current_socket.settimeout(KEEP_ALIVE_TIMEOUT)
+    current_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    buffer = b''
+    handed_off = False
     try:
-        with open(file, 'r') as f:
-            response = 'HTTP/1.1 200 OK\n\n' + f.read()
-    except FileNotFoundError:
-        time.sleep(10)
-        response = 'HTTP/1.1 404 Not Found\nFile not found error'
+        while True:
+            request, buffer = read_request(current_socket, buffer)
+            if not request:
+                return
 
-    current_socket.sendall(response.encode())
-    current_socket.close()
-    sem.release()
+            parsed = parse_request(request)
+            if not parsed:
+                return
+            file, keep_alive = parsed
 
+            cached = file_cache.get(file)
+            if cached:
+                send_file(current_socket, cached, keep_alive)
+            elif not_found_delay > 0:
+                # Задержка 404 не держит поток пула: ответ отправит таймер
+                delayed_responder.schedule(not_found_delay, current_socket,
+                                           lambda s: send_not_found(s, keep_alive=False))
+                handed_off = True
+                return
+            else:
+                send_not_found(current_socket, keep_alive)
+
+            if not keep_alive:
+                return
+    except (socket.timeout, ConnectionError):
+        pass
+    finally:
+        if not handed_off:
+            current_socket.close()
 
-def main(port: int, concurrency_level: int) -> None:
-    start_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    start_socket.bind(('', port))
 
-    start_socket.listen(7)
+def pool_worker(connections: queue.Queue, not_found_delay: float) -> None:
+    while True:
+        current_socket, addr = connections.get()
+        try:
+            one_socket_worker(current_socket, addr, not_found_delay)
+        except Exception as e:
+            # Ошибка одного соединения не должна уменьшать пул потоков
+            print(f'Error while serving {addr}: {e}')
+        finally:
+            connections.task_done()
 
-    semaphore = threading.Semaphore(concurrency_level)
 
-    max_requests = 10
-    for i in range(max_requests):
+def serve_forever(start_socket: socket.socket, concurrency_level: int, queue_size: int,
+                  not_found_delay: float = 0) -> None:
+    """
+    concurrency_level постоянных потоков обслуживают соединения из очереди.
+    Когда очередь заполнена, accept ждёт, и новые клиенты остаются в backlog сокета.
+    """
+    global delayed_responder
+    if not_found_delay > 0 and delayed_responder is None:
+        delayed_responder = DelayedResponder()
+
+    connections = queue.Queue(maxsize=queue_size)
+    for _ in range(concurrency_level):
+        threading.Thread(target=pool_worker, args=(connections, not_found_delay), daemon=True).start()
+
+    while True:
         current_socket, addr = start_socket.accept()
+        connections.put((current_socket, addr))
 
-        thread = threading.Thread(target=one_socket_worker, args=(current_socket, addr, semaphore))
-        thread.start()
 
-    start_socket.close()
+def send_late_not_found(writer: asyncio.StreamWriter) -> None:
+    try:
+        writer.write(not_found_response(False))
+    finally:
+        writer.close()
+
+
+async def async_socket_worker(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                              not_found_delay: float) -> None:
+    """То же, что one_socket_worker, но для одной корутины на соединение"""
+    loop = asyncio.get_running_loop()
+    writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    buffer = b''
+    handed_off = False
+    try:
+        while True:
+            request, buffer = split_request(buffer)
+            if request is None:
+                if len(buffer) > MAX_REQUEST_SIZE:
+                    return
+                chunk = await asyncio.wait_for(reader.read(4096), KEEP_ALIVE_TIMEOUT)
+                if not chunk:
+                    return
+                buffer += chunk
+                continue
+
+            parsed = parse_request(request)
+            if not parsed:
+                return
+            file, keep_alive = parsed
+
+            cached = file_cache.get(file)
+            if cached is None:
+                if not_found_delay > 0:
+                    # Задержка 404 не держит слот семафора: ответ отправит таймер цикла событий
+                    loop.call_later(not_found_delay, send_late_not_found, writer)
+                    handed_off = True
+                    return
+                writer.write(not_found_response(keep_alive))
+            elif cached.content is not None:
+                writer.write(file_response_header(cached, keep_alive) + cached.content)
+            else:
+                writer.write(file_response_header(cached, keep_alive))
+                await writer.drain()
+                if cached.f is not None:
+                    await loop.sendfile(writer.transport, cached.f, 0, cached.size)
+                else:
+                    with open(cached.name, 'rb') as f:
+                        await loop.sendfile(writer.transport, f, 0, cached.size)
+            await writer.drain()
+
+            if not keep_alive:
+                return
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        if not handed_off:
+            writer.close()
+
+
+async def serve_async(start_socket: socket.socket, concurrency_level: int, not_found_delay: float = 0) -> None:
+    """
+    Все соединения обслуживаются в одном потоке цикла событий.
+    concurrency_level ограничивает число соединений, обслуживаемых одновременно.
+    """
+    semaphore = asyncio.Semaphore(concurrency_level)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        async with semaphore:
+            await async_socket_worker(reader, writer, not_found_delay)
+
+    server = await asyncio.start_server(handle, sock=start_socket, backlog=128)
+    async with server:
+        await server.serve_forever()
+
+
+def main(port: int, concurrency_level: int, queue_size: int, not_found_delay: float, mode: str) -> None:
+    start_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    start_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    start_socket.bind(('', port))
+
+    start_socket.listen(128)
+
+    try:
+        if mode == 'async':
+            asyncio.run(serve_async(start_socket, concurrency_level, not_found_delay))
+        else:
+            serve_forever(start_socket, concurrency_level, queue_size, not_found_delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        start_socket.close()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('port', type=int, help='Port to listen on')
     parser.add_argument('concurrency_level', type=int, help='Maximum number of concurrent threads')
+    parser.add_argument('--queue-size', type=int, default=64,
+                        help='Maximum number of accepted connections waiting for a free thread')
+    parser.add_argument('--mode', choices=['thread', 'async'], default='thread',
+                        help='Thread pool or asyncio event loop')
+    parser.add_argument('--not-found-delay', type=float, default=0,
+                        help='Delay in seconds before answering 404, without holding a worker thread')
 
     args = parser.parse_args()
 
-    main(args.port, args.concurrency_level)
+    main(args.port, args.concurrency_level, args.queue_size, args.not_found_delay, args.mode)
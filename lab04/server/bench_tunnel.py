@@ -0,0 +1,116 @@
+import argparse
+import socket
+import threading
+import time
+
+from tunnel import HAS_SPLICE, relay
+
+
+def start_source_server(total_bytes, chunk_size=256 * 1024):
+    """Сервер-источник: каждому клиенту отдаёт total_bytes байт и закрывает соединение"""
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind(('127.0.0.1', 0))
+    server_socket.listen(16)
+    payload = b'x' * chunk_size
+
+    def serve(conn):
+        with conn:
+            left = total_bytes
+            while left > 0:
+                n = min(left, chunk_size)
+                conn.sendall(payload[:n])
+                left -= n
+
+    def accept_loop():
+        while True:
+            conn, _ = server_socket.accept()
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return server_socket.getsockname()
+
+
+def start_connect_proxy(use_splice):
+    """Минимальный CONNECT-прокси поверх tunnel.relay для сравнения режимов перекачки"""
+    proxy_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    proxy_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    proxy_socket.bind(('127.0.0.1', 0))
+    proxy_socket.listen(16)
+
+    def handle(client_socket):
+        with client_socket:
+            request = b''
+            while b'\r\n\r\n' not in request:
+                request += client_socket.recv(4096)
+            host, port = request.split(b' ')[1].decode().rsplit(':', 1)
+            with socket.create_connection((host, int(port))) as server_socket:
+                client_socket.sendall(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+                relay(client_socket, server_socket, use_splice=use_splice)
+
+    def accept_loop():
+        while True:
+            conn, _ = proxy_socket.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return proxy_socket.getsockname()
+
+
+def download(target, proxy=None, buffer_size=256 * 1024):
+    """Скачивает всё, что отдаёт target (напрямую или через CONNECT), возвращает число байт"""
+    if proxy:
+        sock = socket.create_connection(proxy)
+        sock.sendall(f"CONNECT {target[0]}:{target[1]} HTTP/1.1\r\nHost: {target[0]}:{target[1]}\r\n\r\n".encode())
+        response = b''
+        while b'\r\n\r\n' not in response:
+            response += sock.recv(1)
+        if b' 200 ' not in response.split(b'\r\n')[0]:
+            raise Exception(f"Прокси отказал в туннеле: {response!r}")
+    else:
+        sock = socket.create_connection(target)
+
+    buffer = bytearray(buffer_size)
+    received = 0
+    with sock:
+        while True:
+            n = sock.recv_into(buffer)
+            if n == 0:
+                break
+            received += n
+    return received
+
+
+def run(name, target, proxy, repeats, total_bytes):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        received = download(target, proxy)
+        elapsed = time.perf_counter() - start
+        if received != total_bytes:
+            raise Exception(f"{name}: получено {received} из {total_bytes} байт")
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<10} {total_bytes / best / 2 ** 20:10.1f} MB/s  ({best * 1000:.1f} мс на {total_bytes // 2 ** 20} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пропускная способность CONNECT-туннеля на loopback')
+    parser.add_argument('--size', type=int, default=256, help='Объём данных на одно соединение, MB (по умолчанию: 256)')
+    parser.add_argument('--repeats', type=int, default=3, help='Число повторов, берётся лучший (по умолчанию: 3)')
+    parser.add_argument('--proxy', help='Адрес запущенного прокси host:port (например, proxy_server_C.py)')
+
+    args = parser.parse_args()
+    total_bytes = args.size * 2 ** 20
+
+    target = start_source_server(total_bytes)
+    run('direct', target, None, args.repeats, total_bytes)
+    run('buffer', target, start_connect_proxy(use_splice=False), args.repeats, total_bytes)
+    if HAS_SPLICE:
+        run('splice', target, start_connect_proxy(use_splice=True), args.repeats, total_bytes)
+    if args.proxy:
+        host, port = args.proxy.rsplit(':', 1)
+        run('proxy', target, (host, int(port)), args.repeats, total_bytes)
+
+
+if __name__ == "__main__":
+    main()
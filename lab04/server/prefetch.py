@@ -0,0 +1,247 @@
+import argparse
+import importlib
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin
+
+from range_cache import get_header, parse_response_head
+
+# Журнал прокси, по которому определяются самые популярные URL
+ACCESS_LOG_FILE = os.path.join('logs', 'proxy.log')
+
+# Строки журнала, означающие, что URL был запрошен клиентом
+ACCESS_LOG_PATTERN = re.compile(r'(?:- URL: |Отправка из кэша \([^)]*\): )(http://[^\s,]+)')
+
+
+class RateLimiter:
+    """Ограничение числа запросов в секунду (token bucket), общее для всех потоков"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst else max(1.0, rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class LinkExtractor(HTMLParser):
+    """Сбор ссылок на страницы и ресурсы из HTML"""
+
+    LINK_ATTRIBUTES = {'a': 'href', 'link': 'href', 'img': 'src', 'script': 'src'}
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        attribute = self.LINK_ATTRIBUTES.get(tag)
+        if not attribute:
+            return
+        for name, value in attrs:
+            if name == attribute and value:
+                self.links.append(value)
+
+
+def urls_from_file(path):
+    """URL из файла, по одному в строке; пустые строки и # комментарии пропускаются"""
+    urls = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                urls.append(line)
+    return urls
+
+
+def urls_from_access_log(top_n, log_path=ACCESS_LOG_FILE):
+    """Top-N самых часто запрашиваемых URL по журналу прокси"""
+    counter = Counter()
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, 'r', errors='ignore') as f:
+        for line in f:
+            match = ACCESS_LOG_PATTERN.search(line)
+            if match:
+                counter[match.group(1)] += 1
+    return [url for url, _ in counter.most_common(top_n)]
+
+
+def urls_from_cached_html(proxy, cache_dir, limit):
+    """Ссылки из закэшированных HTML-страниц (только http://, без фрагментов)"""
+    with proxy.cache_lock:
+        entries = list(proxy.cache_index.items())
+
+    urls = []
+    seen = set(url for url, _ in entries)
+    for page_url, cache_info in entries:
+        try:
+            with open(os.path.join(cache_dir, cache_info['filename']), 'rb') as f:
+                response_data = f.read()
+        except OSError:
+            continue
+        parsed = parse_response_head(response_data)
+        if not parsed:
+            continue
+        status_code, headers, body_offset = parsed
+        content_type = get_header(headers, 'Content-Type') or ''
+        if 'text/html' not in content_type or get_header(headers, 'Content-Encoding') \
+                or get_header(headers, 'Transfer-Encoding'):
+            continue
+
+        extractor = LinkExtractor()
+        try:
+            extractor.feed(response_data[body_offset:].decode('utf-8', errors='ignore'))
+        except Exception as e:
+            logging.warning(f"Ошибка при разборе HTML из кэша {page_url}: {e}")
+            continue
+
+        for link in extractor.links:
+            url = urldefrag(urljoin(page_url, link))[0]
+            if url.startswith('http://') and url not in seen:
+                seen.add(url)
+                urls.append(url)
+                if len(urls) >= limit:
+                    return urls
+    return urls
+
+
+class Prefetcher:
+    """
+    Прогрев кэша прокси: URL загружаются пулом из workers потоков с общим
+    ограничением rate запросов в секунду и сохраняются через store_in_cache.
+    """
+
+    def __init__(self, proxy, workers=4, rate=10.0, timeout=10):
+        self.proxy = proxy
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.timeout = timeout
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def fetch(self, url):
+        if self.proxy.get_cache_info(url):
+            self.count('already_cached')
+            return
+        if hasattr(self.proxy, 'is_blacklisted') and self.proxy.is_blacklisted(url):
+            self.count('blacklisted')
+            return
+
+        self.limiter.acquire()
+        host, port, path = self.proxy.extract_host_port_path(url)
+        server_request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n"
+        server_request += "Accept-Encoding: identity\r\n\r\n"
+
+        try:
+            with socket.create_connection((host, port), timeout=self.timeout) as server_socket:
+                server_socket.sendall(server_request.encode())
+                chunks = []
+                while True:
+                    data = server_socket.recv(65536)
+                    if not data:
+                        break
+                    chunks.append(data)
+        except Exception as e:
+            logging.warning(f"Прогрев: ошибка при загрузке {url}: {e}")
+            self.count('failed')
+            return
+
+        if self.proxy.store_in_cache(url, b''.join(chunks)):
+            self.count('cached')
+        else:
+            self.count('not_cacheable')
+
+    def run(self, urls):
+        """Загрузка списка URL; возвращает статистику по результатам"""
+        urls = list(dict.fromkeys(urls))
+        start = time.monotonic()
+        logging.info(f"Прогрев кэша: {len(urls)} URL, потоков: {self.workers}")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(self.fetch, urls))
+        elapsed = time.monotonic() - start
+
+        summary = ', '.join(f"{key}: {value}" for key, value in sorted(self.stats.items()))
+        logging.info(f"Прогрев кэша завершен за {elapsed:.1f} с ({summary})")
+        print(f"Прогрев кэша завершен за {elapsed:.1f} с ({summary})")
+        return dict(self.stats)
+
+
+def add_prefetch_arguments(parser):
+    group = parser.add_argument_group('прогрев кэша')
+    group.add_argument('--prefetch-list', help='Файл со списком URL для прогрева')
+    group.add_argument('--prefetch-top', type=int, default=0, help='Прогреть N самых популярных URL из журнала')
+    group.add_argument('--prefetch-links', type=int, default=0,
+                       help='Прогреть до N ссылок из закэшированных HTML-страниц')
+    group.add_argument('--prefetch-workers', type=int, default=4, help='Число параллельных загрузок (по умолчанию: 4)')
+    group.add_argument('--prefetch-rate', type=float, default=10.0,
+                       help='Максимум запросов в секунду, 0 — без ограничения (по умолчанию: 10)')
+
+
+def collect_urls(args, proxy, cache_dir):
+    urls = []
+    if args.prefetch_list:
+        urls += urls_from_file(args.prefetch_list)
+    if args.prefetch_top:
+        urls += urls_from_access_log(args.prefetch_top)
+    if args.prefetch_links:
+        urls += urls_from_cached_html(proxy, cache_dir, args.prefetch_links)
+    return urls
+
+
+def start_background_prefetch(args, proxy, cache_dir):
+    """Прогрев в фоне параллельно с обслуживанием клиентов"""
+    urls = collect_urls(args, proxy, cache_dir)
+    if not urls:
+        return None
+    prefetcher = Prefetcher(proxy, args.prefetch_workers, args.prefetch_rate)
+    thread = threading.Thread(target=prefetcher.run, args=(urls,))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Прогрев кэша прокси-сервера до его запуска')
+    parser.add_argument('--proxy', choices=['B', 'C'], default='C', help='Вариант прокси-сервера (по умолчанию: C)')
+    add_prefetch_arguments(parser)
+
+    args = parser.parse_args()
+
+    module = importlib.import_module(f'proxy_server_{args.proxy}')
+    # Порт 0: сокет не мешает уже запущенному прокси, нужны только методы кэша
+    proxy = module.ProxyServer(port=0)
+    urls = collect_urls(args, proxy, module.CACHE_DIR)
+    if not urls:
+        print("Нет URL для прогрева")
+        return
+    Prefetcher(proxy, args.prefetch_workers, args.prefetch_rate).run(urls)
+    proxy.server_socket.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ import logging
 import re
 import os
 
+from tunnel import parse_connect_target, relay
+
 # Настройка логирования
 if not os.path.exists('logs'):
     os.makedirs('logs')
@@ -34,7 +36,8 @@ class ProxyServer:
 
     def handle_client(self, client_socket, client_address):
         try:
-            request = client_socket.recv(4096).decode('utf-8', errors='ignore')
+            request_data = client_socket.recv(4096)
+            request = request_data.decode('utf-8', errors='ignore')
 
             if not request:
                 client_socket.close()
@@ -42,6 +45,12 @@ class ProxyServer:
 
             # Анализ запроса
             request_method = request.split(' ')[0]
+
+            # HTTPS: устанавливаем туннель и дальше только перекачиваем байты
+            if request_method == "CONNECT":
+                self.handle_connect(client_socket, request_data, request)
+                return
+
             url = self.parse_url(request)
 
             if not url:
@@ -136,6 +145,44 @@ class ProxyServer:
         finally:
             client_socket.close()
 
+    def handle_connect(self, client_socket, request_data, request):
+        host, port = parse_connect_target(request)
+        if not host:
+            error_response = "HTTP/1.1 400 Bad Request\r\nContent-Type: text/html\r\n\r\n"
+            error_response += "<html><body><h1>400 Bad Request</h1><p>Неверный адрес для CONNECT</p></body></html>"
+            client_socket.sendall(error_response.encode())
+            return
+
+        try:
+            server_socket = socket.create_connection((host, port), timeout=10)
+        except socket.timeout as e:
+            error_msg = f"Timeout при подключении к {host}: {e}"
+            logging.error(error_msg)
+            error_response = "HTTP/1.1 504 Gateway Timeout\r\nContent-Type: text/html\r\n\r\n"
+            error_response += f"<html><body><h1>504 Gateway Timeout</h1><p>{error_msg}</p></body></html>"
+            client_socket.sendall(error_response.encode())
+            return
+        except OSError as e:
+            error_msg = f"Ошибка при подключении к {host}:{port}: {e}"
+            logging.error(error_msg)
+            error_response = "HTTP/1.1 502 Bad Gateway\r\nContent-Type: text/html\r\n\r\n"
+            error_response += f"<html><body><h1>502 Bad Gateway</h1><p>{error_msg}</p></body></html>"
+            client_socket.sendall(error_response.encode())
+            return
+
+        try:
+            logging.info(f"CONNECT {host}:{port}")
+            client_socket.sendall(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+
+            # Данные, пришедшие вместе с заголовками запроса, сразу передаём серверу
+            leftover = request_data.split(b'\r\n\r\n', 1)[1] if b'\r\n\r\n' in request_data else b''
+            if leftover:
+                server_socket.sendall(leftover)
+
+            relay(client_socket, server_socket)
+        finally:
+            server_socket.close()
+
     def parse_url(self, request):
         try:
             first_line = request.split('\r\n')[0]
@@ -8,6 +8,12 @@ import json
 from datetime import datetime
 import time
 import shutil
+import argparse
+
+from prefetch import add_prefetch_arguments, start_background_prefetch
+from range_cache import (SparseRangeStore, get_header, parse_range_header, parse_response_head, send_ranges,
+                         send_not_satisfiable)
+from tunnel import parse_connect_target, relay
 
 # Настройка логирования
 if not os.path.exists('logs'):
@@ -23,6 +29,9 @@ if not os.path.exists(CACHE_DIR):
 # Файл с метаданными кэша
 CACHE_INDEX_FILE = os.path.join(CACHE_DIR, 'cache_index.json')
 
+# Папка для фрагментов из ответов 206 Partial Content
+PARTIAL_CACHE_DIR = os.path.join(CACHE_DIR, 'partial')
+
 class ProxyServer:
     def __init__(self, host='localhost', port=8888):
         self.host = host
@@ -33,6 +42,7 @@ class ProxyServer:
         self.server_socket.listen(5)
         self.cache_index = self.load_cache_index()
         self.cache_lock = threading.Lock()
+        self.partial_store = SparseRangeStore(PARTIAL_CACHE_DIR)
         self.blacklist = self.load_blacklist()
         print(f"Прокси-сервер запущен на {self.host}:{self.port}")
 
@@ -118,14 +128,24 @@ class ProxyServer:
             with open(cache_path, 'wb') as f:
                 f.write(response_data)
 
+            # Смещение тела в файле нужно для ответов на Range-запросы без чтения всего файла
+            body_offset = len(response_parts[0]) + 4
+            body_length = len(response_parts[1])
+            content_length = get_header(headers, 'Content-Length')
+            if get_header(headers, 'Transfer-Encoding') or (content_length and content_length != str(body_length)):
+                body_offset = None
+
             with self.cache_lock:
                 self.cache_index[url] = {
                     'filename': cache_filename,
                     'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                     'etag': headers.get('ETag', None),
-                    'last_modified': headers.get('Last-Modified', None)
+                    'last_modified': headers.get('Last-Modified', None),
+                    'body_offset': body_offset,
+                    'body_length': body_length
                 }
                 self.save_cache_index()
+            self.partial_store.discard(url)
 
             logging.info(f"Закэширован URL: {url}")
             return True
@@ -156,6 +176,43 @@ class ProxyServer:
                 logging.error(f"Ошибка при чтении из кэша для {url}: {e}")
                 return None, None
 
+    def get_cache_info(self, url):
+        """Получение метаданных кэша без чтения самого ответа"""
+        with self.cache_lock:
+            cache_info = self.cache_index.get(url)
+            if cache_info and not os.path.exists(os.path.join(CACHE_DIR, cache_info['filename'])):
+                del self.cache_index[url]
+                self.save_cache_index()
+                return None
+            return cache_info
+
+    def send_from_cache(self, client_socket, url, cache_info, range_header=None):
+        """Отправка ответа из кэша; для Range читаются с диска только запрошенные диапазоны"""
+        body_offset = cache_info.get('body_offset')
+        if range_header and body_offset is not None:
+            body_length = cache_info['body_length']
+            ranges = parse_range_header(range_header, body_length)
+            if ranges == []:
+                send_not_satisfiable(client_socket, body_length)
+                return True
+            if ranges:
+                with open(os.path.join(CACHE_DIR, cache_info['filename']), 'rb') as f:
+                    status_code, cached_headers, _ = parse_response_head(f.read(body_offset))
+
+                    def read(offset, size):
+                        f.seek(body_offset + offset)
+                        return f.read(size)
+
+                    send_ranges(client_socket, cached_headers, ranges, body_length, read)
+                logging.info(f"Отправка диапазонов из кэша ({range_header}): {url}")
+                return True
+
+        cached_response, _ = self.get_from_cache(url)
+        if cached_response is None:
+            return False
+        client_socket.sendall(cached_response)
+        return True
+
     def start(self):
         print(f"Ожидание подключений... Используйте http://{self.host}:{self.port}/example.com для доступа к сайтам")
         while True:
@@ -193,6 +250,12 @@ class ProxyServer:
             try:
                 first_line = request.split('\r\n')[0]
                 method = first_line.split(' ')[0]
+
+                # HTTPS: устанавливаем туннель и дальше только перекачиваем байты
+                if method == "CONNECT":
+                    self.handle_connect_request(client_socket, request_data, request)
+                    return
+
                 url = self.parse_url(request)
 
                 if not url:
@@ -237,9 +300,10 @@ class ProxyServer:
 
     def handle_get_request(self, client_socket, host, port, path, headers, url):
         try:
-            cached_response, cache_info = self.get_from_cache(url)
+            range_header = get_header(headers, 'Range')
+            cache_info = self.get_cache_info(url)
 
-            if cached_response:
+            if cache_info:
                 conditional_headers = {}
                 if cache_info.get('etag'):
                     conditional_headers['If-None-Match'] = cache_info['etag']
@@ -275,13 +339,15 @@ class ProxyServer:
                                 if status_code == 304:
                                     logging.info(f"Отправка из кэша (304 Not Modified): {url}")
                                     print(f"Отправка из кэша (304 Not Modified): {url}")
-                                    client_socket.sendall(cached_response)
+                                    self.send_from_cache(client_socket, url, cache_info, range_header)
                                     server_socket.close()
                                     return
                                 else:
                                     logging.info(f"Обновление кэша для: {url}")
-                                    self.store_in_cache(url, response)
-                                    client_socket.sendall(response)
+                                    stored = self.store_in_cache(url, response)
+                                    if not (stored and range_header and
+                                            self.send_from_cache(client_socket, url, self.get_cache_info(url), range_header)):
+                                        client_socket.sendall(response)
                                     server_socket.close()
                                     return
                             except Exception as e:
@@ -293,7 +359,12 @@ class ProxyServer:
 
                 logging.info(f"Отправка из кэша (без проверки актуальности): {url}")
                 print(f"Отправка из кэша (без проверки актуальности): {url}")
-                client_socket.sendall(cached_response)
+                if self.send_from_cache(client_socket, url, cache_info, range_header):
+                    return
+
+            # Диапазон мог быть закэширован из предыдущих ответов 206
+            if range_header and self.partial_store.serve(client_socket, url, range_header):
+                logging.info(f"Отправка диапазона из частичного кэша ({range_header}): {url}")
                 return
 
             server_request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n"
@@ -322,6 +393,53 @@ class ProxyServer:
             print(f"Ошибка при обработке POST запроса: {e}")
             self.send_error_response(client_socket, 500, f"Internal Server Error: {str(e)}")
 
+    def handle_connect_request(self, client_socket, request_data, request):
+        """Туннель для CONNECT (HTTPS): после установки соединения байты только перекачиваются"""
+        host, port = parse_connect_target(request)
+        if not host:
+            self.send_error_response(client_socket, 400, "Bad Request: Неверный адрес для CONNECT")
+            return
+
+        if self.is_blacklisted(f"{host}:{port}"):
+            logging.info(f"Блокировка CONNECT (черный список): {host}:{port}")
+            self.send_error_response(client_socket, 403, "Эта страница заблокирована прокси-сервером.")
+            return
+
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] CONNECT {host}:{port}")
+
+        try:
+            server_socket = socket.create_connection((host, port), timeout=10)
+        except socket.gaierror as e:
+            error_msg = f"DNS ошибка при подключении к {host}: {e}"
+            logging.error(error_msg)
+            self.send_error_response(client_socket, 502, f"Bad Gateway: {error_msg}")
+            return
+        except socket.timeout as e:
+            error_msg = f"Timeout при подключении к {host}: {e}"
+            logging.error(error_msg)
+            self.send_error_response(client_socket, 504, f"Gateway Timeout: {error_msg}")
+            return
+        except OSError as e:
+            error_msg = f"Ошибка при подключении к {host}:{port}: {e}"
+            logging.error(error_msg)
+            self.send_error_response(client_socket, 502, f"Bad Gateway: {error_msg}")
+            return
+
+        try:
+            logging.info(f"CONNECT {host}:{port}")
+            client_socket.sendall(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+
+            # Данные, пришедшие вместе с заголовками запроса, сразу передаём серверу
+            leftover = request_data.split(b'\r\n\r\n', 1)[1] if b'\r\n\r\n' in request_data else b''
+            if leftover:
+                server_socket.sendall(leftover)
+
+            relay(client_socket, server_socket)
+        except Exception as e:
+            logging.error(f"Ошибка в туннеле {host}:{port}: {e}")
+        finally:
+            server_socket.close()
+
     def forward_request_to_server(self, client_socket, host, port, request_data, url):
         server_socket = None
         try:
@@ -348,6 +466,8 @@ class ProxyServer:
 
                 if request_data.startswith(b'GET') and status_code == 200:
                     self.store_in_cache(url, response)
+                elif request_data.startswith(b'GET') and status_code == 206:
+                    self.partial_store.store(url, response)
             except Exception as e:
                 logging.warning(f"Не удалось определить код ответа для {url}: {e}")
 
@@ -381,6 +501,7 @@ class ProxyServer:
     def send_error_response(self, client_socket, code, message):
         status_messages = {
             400: "Bad Request",
+            403: "Forbidden",
             404: "Not Found",
             500: "Internal Server Error",
             502: "Bad Gateway",
@@ -471,6 +592,7 @@ class ProxyServer:
             with self.cache_lock:
                 self.cache_index = {}
                 self.save_cache_index()
+                self.partial_store.clear()
                 for filename in os.listdir(CACHE_DIR):
                     file_path = os.path.join(CACHE_DIR, filename)
                     if os.path.isfile(file_path) and filename != 'cache_index.json':
@@ -485,5 +607,13 @@ class ProxyServer:
             return False
 
 if __name__ == "__main__":
-    proxy = ProxyServer()
+    parser = argparse.ArgumentParser(description='Кэширующий HTTP прокси-сервер')
+    parser.add_argument('--host', default='localhost', help='Адрес для прослушивания (по умолчанию: localhost)')
+    parser.add_argument('--port', type=int, default=8888, help='Порт для прослушивания (по умолчанию: 8888)')
+    add_prefetch_arguments(parser)
+
+    args = parser.parse_args()
+
+    proxy = ProxyServer(args.host, args.port)
+    start_background_prefetch(args, proxy, CACHE_DIR)
     proxy.start()
@@ -0,0 +1,316 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+# Размер блока разреженного хранилища частичных ответов
+BLOCK_SIZE = 64 * 1024
+
+# Размер порции при чтении диапазона с диска
+READ_CHUNK_SIZE = 256 * 1024
+
+
+def parse_response_head(response_data):
+    """Разбор статуса и заголовков ответа. Возвращает (код, заголовки, длина заголовков) или None"""
+    head_end = response_data.find(b'\r\n\r\n')
+    if head_end == -1:
+        return None
+    try:
+        lines = response_data[:head_end].decode('utf-8', errors='ignore').split('\r\n')
+        status_code = int(lines[0].split(' ')[1])
+    except (IndexError, ValueError):
+        return None
+
+    headers = {}
+    for line in lines[1:]:
+        if ': ' in line:
+            key, value = line.split(': ', 1)
+            headers[key] = value
+    return status_code, headers, head_end + 4
+
+
+def get_header(headers, name):
+    """Поиск заголовка без учёта регистра"""
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def parse_range_header(value, total_length):
+    """
+    Разбор заголовка Range (RFC 7233) для объекта длиной total_length.
+
+    Returns:
+        None, если заголовок некорректен и должен быть проигнорирован;
+        [] если ни один диапазон не выполним (ответ 416);
+        иначе список пар (start, end) с включительными границами.
+    """
+    if not value:
+        return None
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if '-' not in part:
+            return None
+        first, _, last = part.partition('-')
+        try:
+            if first == '':
+                # Суффиксный диапазон: последние N байт
+                suffix = int(last)
+                if suffix == 0:
+                    continue
+                start = max(total_length - suffix, 0)
+                end = total_length - 1
+            else:
+                start = int(first)
+                end = int(last) if last else total_length - 1
+                if last and end < start:
+                    return None
+                end = min(end, total_length - 1)
+        except ValueError:
+            return None
+        if start < total_length and start <= end:
+            ranges.append((start, end))
+    return ranges
+
+
+def parse_content_range(value):
+    """Разбор Content-Range: bytes start-end/total. Возвращает (start, end, total) или None"""
+    try:
+        unit, _, spec = value.partition(' ')
+        if unit.lower() != 'bytes':
+            return None
+        span, _, total = spec.partition('/')
+        start, _, end = span.partition('-')
+        return int(start), int(end), int(total)
+    except (AttributeError, ValueError):
+        return None
+
+
+def build_range_head(headers, ranges, total_length, boundary=None):
+    """Заголовки ответа 206 для одного диапазона или multipart/byteranges для нескольких"""
+    skip = {'content-length', 'content-range', 'transfer-encoding', 'connection', 'accept-ranges'}
+    content_type = get_header(headers, 'Content-Type') or 'application/octet-stream'
+
+    head = "HTTP/1.1 206 Partial Content\r\n"
+    for key, value in headers.items():
+        if key.lower() in skip or (boundary and key.lower() == 'content-type'):
+            continue
+        head += f"{key}: {value}\r\n"
+    head += "Accept-Ranges: bytes\r\nConnection: close\r\n"
+
+    if boundary is None:
+        start, end = ranges[0]
+        head += f"Content-Range: bytes {start}-{end}/{total_length}\r\n"
+        head += f"Content-Length: {end - start + 1}\r\n\r\n"
+        return head.encode(), []
+
+    part_heads = [
+        f"\r\n--{boundary}\r\nContent-Type: {content_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{total_length}\r\n\r\n".encode()
+        for start, end in ranges
+    ]
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    content_length = sum(len(p) for p in part_heads) + sum(e - s + 1 for s, e in ranges) + len(tail)
+    head += f"Content-Type: multipart/byteranges; boundary={boundary}\r\n"
+    head += f"Content-Length: {content_length}\r\n\r\n"
+    return head.encode(), part_heads + [tail]
+
+
+def send_ranges(client_socket, headers, ranges, total_length, read):
+    """
+    Отправка ответа 206 клиенту. read(offset, size) читает байты тела объекта,
+    так что с диска читаются только запрошенные диапазоны, а не весь объект.
+    """
+    boundary = uuid.uuid4().hex if len(ranges) > 1 else None
+    head, parts = build_range_head(headers, ranges, total_length, boundary)
+    client_socket.sendall(head)
+
+    for i, (start, end) in enumerate(ranges):
+        if boundary:
+            client_socket.sendall(parts[i])
+        offset = start
+        while offset <= end:
+            size = min(READ_CHUNK_SIZE, end - offset + 1)
+            client_socket.sendall(read(offset, size))
+            offset += size
+    if boundary:
+        client_socket.sendall(parts[-1])
+
+
+def send_not_satisfiable(client_socket, total_length):
+    response = "HTTP/1.1 416 Range Not Satisfiable\r\n"
+    response += f"Content-Range: bytes */{total_length}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+    client_socket.sendall(response.encode())
+
+
+class SparseRangeStore:
+    """
+    Хранилище фрагментов из ответов 206: для каждого URL — разреженный файл
+    полного размера и множество номеров полностью записанных блоков BLOCK_SIZE.
+    Для недописанных блоков хранятся записанные отрезки байт: блок, собранный из
+    нескольких соседних фрагментов, тоже отмечается, а диапазон внутри записанного
+    отрезка отдаётся и до этого. Проверка и чтение диапазона затрагивают только его блоки.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_file = os.path.join(directory, 'partial_index.json')
+        self.lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.index = self.load_index()
+
+    def load_index(self):
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r') as f:
+                    index = json.load(f)
+                for info in index.values():
+                    info['blocks'] = set(info['blocks'])
+                    info['partial'] = {int(block): spans for block, spans in info.get('partial', {}).items()}
+                return index
+            except (json.JSONDecodeError, KeyError):
+                print("Ошибка чтения индекса частичного кэша. Создаем новый.")
+        return {}
+
+    def save_index(self):
+        data = {url: dict(info, blocks=sorted(info['blocks'])) for url, info in self.index.items()}
+        with open(self.index_file, 'w') as f:
+            json.dump(data, f)
+
+    def get_path(self, url):
+        return os.path.join(self.directory, hashlib.md5(url.encode()).hexdigest() + '.part')
+
+    def get_info(self, url):
+        with self.lock:
+            return self.index.get(url)
+
+    def store(self, url, response_data):
+        """Сохранение тела ответа 206 с одним диапазоном. Возвращает True, если что-то записано"""
+        parsed = parse_response_head(response_data)
+        if not parsed or parsed[0] != 206:
+            return False
+        status_code, headers, body_offset = parsed
+        if get_header(headers, 'Transfer-Encoding'):
+            return False
+        content_range = parse_content_range(get_header(headers, 'Content-Range'))
+        if not content_range:
+            return False
+        start, end, total_length = content_range
+        body = memoryview(response_data)[body_offset:]
+        if len(body) < end - start + 1:
+            return False
+        body = body[:end - start + 1]
+
+        etag = get_header(headers, 'ETag')
+        path = self.get_path(url)
+        with self.lock:
+            info = self.index.get(url)
+            if info and (info['total_length'] != total_length or info.get('etag') != etag):
+                # Объект на сервере изменился — старые фрагменты недействительны
+                info = None
+            if info is None:
+                info = {
+                    'total_length': total_length,
+                    'etag': etag,
+                    'headers': {k: v for k, v in headers.items()
+                                if k.lower() in ('content-type', 'etag', 'last-modified')},
+                    'blocks': set(),
+                    'partial': {}
+                }
+                with open(path, 'wb') as f:
+                    f.truncate(total_length)
+
+            with open(path, 'r+b') as f:
+                f.seek(start)
+                f.write(body)
+
+            for block in range(start // BLOCK_SIZE, end // BLOCK_SIZE + 1):
+                if block not in info['blocks']:
+                    self.mark(info, block, start, end)
+
+            self.index[url] = info
+            self.save_index()
+        return True
+
+    @staticmethod
+    def mark(info, block, start, end):
+        """Добавляет к блоку записанный отрезок [start, end]; блок, покрытый целиком, отмечается"""
+        block_start = block * BLOCK_SIZE
+        block_end = min(block_start + BLOCK_SIZE, info['total_length']) - 1
+        spans = info['partial'].get(block, []) + [[max(start, block_start), min(end, block_end)]]
+
+        # Сливаем пересекающиеся и соседние отрезки
+        spans.sort()
+        merged = [spans[0]]
+        for span_start, span_end in spans[1:]:
+            if span_start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], span_end)
+            else:
+                merged.append([span_start, span_end])
+
+        if merged == [[block_start, block_end]]:
+            info['blocks'].add(block)
+            info['partial'].pop(block, None)
+        else:
+            info['partial'][block] = merged
+
+    def covers(self, info, ranges):
+        """Каждая часть диапазона лежит в записанном блоке или внутри записанного отрезка недописанного"""
+        blocks = info['blocks']
+        partial = info['partial']
+        for start, end in ranges:
+            for block in range(start // BLOCK_SIZE, end // BLOCK_SIZE + 1):
+                if block in blocks:
+                    continue
+                piece_start = max(start, block * BLOCK_SIZE)
+                piece_end = min(end, (block + 1) * BLOCK_SIZE - 1)
+                if not any(span_start <= piece_start and piece_end <= span_end
+                           for span_start, span_end in partial.get(block, ())):
+                    return False
+        return True
+
+    def serve(self, client_socket, url, range_header):
+        """Ответ на Range-запрос из фрагментов. Возвращает False, если нужных блоков нет"""
+        info = self.get_info(url)
+        if not info:
+            return False
+        ranges = parse_range_header(range_header, info['total_length'])
+        if not ranges or not self.covers(info, ranges):
+            return False
+
+        with open(self.get_path(url), 'rb') as f:
+            def read(offset, size):
+                f.seek(offset)
+                return f.read(size)
+
+            send_ranges(client_socket, info['headers'], ranges, info['total_length'], read)
+        return True
+
+    def discard(self, url):
+        with self.lock:
+            if url in self.index:
+                del self.index[url]
+                self.save_index()
+        try:
+            os.unlink(self.get_path(url))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self.lock:
+            for url in list(self.index):
+                try:
+                    os.unlink(self.get_path(url))
+                except OSError:
+                    pass
+            self.index = {}
+            self.save_index()
@@ -0,0 +1,94 @@
+import errno
+import os
+import socket
+import threading
+
+# Размер буфера для перекачки данных через туннель
+TUNNEL_BUFFER_SIZE = 256 * 1024
+
+# os.splice доступен только в Linux (Python 3.10+)
+HAS_SPLICE = hasattr(os, 'splice')
+
+
+def parse_connect_target(request):
+    """Извлечение host и port из строки запроса CONNECT host:port HTTP/1.1"""
+    try:
+        target = request.split('\r\n')[0].split(' ')[1]
+        if target.startswith('['):
+            host, _, port_str = target[1:].partition(']:')
+        else:
+            host, _, port_str = target.rpartition(':')
+        if not host:
+            return None, None
+        return host, int(port_str) if port_str else 443
+    except (IndexError, ValueError):
+        return None, None
+
+
+def _pump_splice(src, dst, buffer_size):
+    """
+    Перекачка src -> dst через pipe в ядре, без копирования в пространство пользователя.
+    Возвращает False, если splice для этих сокетов не поддерживается и перекачку нужно
+    продолжить через буфер; байты, уже попавшие в pipe, перед этим дописываются в dst.
+    """
+    pipe_r, pipe_w = os.pipe()
+    n = 0
+    try:
+        src_fd = src.fileno()
+        dst_fd = dst.fileno()
+        while True:
+            n = os.splice(src_fd, pipe_w, buffer_size)
+            if n == 0:
+                return True
+            while n > 0:
+                n -= os.splice(pipe_r, dst_fd, n)
+    except OSError as e:
+        # Например, EINVAL для сокетов с TLS на уровне ядра
+        if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+            raise
+        while n > 0:
+            data = os.read(pipe_r, n)
+            dst.sendall(data)
+            n -= len(data)
+        return False
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+
+
+def _pump_buffer(src, dst, buffer_size):
+    """Перекачка src -> dst через один заранее выделенный буфер"""
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        n = src.recv_into(buffer)
+        if n == 0:
+            break
+        dst.sendall(view[:n])
+
+
+def _pump(src, dst, buffer_size, use_splice):
+    try:
+        if not (use_splice and _pump_splice(src, dst, buffer_size)):
+            _pump_buffer(src, dst, buffer_size)
+    except OSError:
+        pass
+    finally:
+        # Сообщаем другой стороне, что данных в этом направлении больше не будет
+        try:
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+def relay(client_socket, server_socket, buffer_size=TUNNEL_BUFFER_SIZE, use_splice=HAS_SPLICE):
+    """Двунаправленная перекачка байтов между клиентом и сервером до закрытия обеих сторон"""
+    client_socket.settimeout(None)
+    server_socket.settimeout(None)
+
+    upstream = threading.Thread(target=_pump, args=(client_socket, server_socket, buffer_size, use_splice))
+    upstream.daemon = True
+    upstream.start()
+
+    _pump(server_socket, client_socket, buffer_size, use_splice)
+    upstream.join()
@@ -0,0 +1,53 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from mail_client_3 import iter_mime_message
+from smtp_session import SMTPSession
+
+
+def main(size_mb, count, port):
+    # Заглушка в отдельном процессе: её память не попадает в замер клиента
+    stub = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'smtp_stub.py'),
+                             '--port', str(port)], stdout=subprocess.DEVNULL)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(count):
+            path = os.path.join(directory, f'attachment{i}.bin')
+            with open(path, 'wb') as f:
+                for _ in range(size_mb):
+                    f.write(os.urandom(1 << 20))
+            paths.append(path)
+
+        time.sleep(0.5)
+        try:
+            tracemalloc.start()
+            start = time.perf_counter()
+            with SMTPSession('127.0.0.1', port, 'example.com', use_tls=False) as session:
+                session.send_message('bench@example.com', ['user@example.com'],
+                                     iter_mime_message('bench@example.com', ['user@example.com'], 'Вложения',
+                                                       'Письмо с большими вложениями', paths))
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        finally:
+            stub.terminate()
+
+    total = size_mb * count
+    print(f"{count} вложений по {size_mb} МБ: {elapsed:.2f} с, {total / elapsed:.1f} МБ/с исходных данных, "
+          f"пик памяти клиента {peak / 2 ** 20:.2f} МБ")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Потоковая отправка больших вложений: скорость и пик памяти')
+    parser.add_argument('--size', type=int, default=100, help='Размер одного вложения в мегабайтах')
+    parser.add_argument('--count', type=int, default=2, help='Количество вложений')
+    parser.add_argument('--port', type=int, default=2526, help='Порт для локальной заглушки SMTP')
+
+    args = parser.parse_args()
+
+    main(args.size, args.count, args.port)
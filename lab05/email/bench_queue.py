@@ -0,0 +1,57 @@
+import argparse
+import json
+import shutil
+import time
+
+from bench_smtp import start_stub
+from mail_queue import MailQueue
+from smtp_session import SMTPSession
+
+
+def main(count, domains, workers, per_domain, latency, fail_rate, spool):
+    shutil.rmtree(spool, ignore_errors=True)
+    stub, port = start_stub(latency, pipelining=True)
+    stub.fail_rate = fail_rate
+
+    def session_factory():
+        return SMTPSession('127.0.0.1', port, 'example.com', use_tls=False)
+
+    # Часть писем ставится до запуска и подхватывается новым экземпляром очереди, как после перезапуска
+    MailQueue(spool, session_factory).enqueue('bench@example.com', ['early@domain0.test'], 'Subject: early\r\n\r\nx\r\n')
+
+    queue = MailQueue(spool, session_factory, workers=workers, per_domain=per_domain, base_delay=0.2, max_delay=2)
+    queue.start()
+
+    start = time.perf_counter()
+    for i in range(count):
+        recipients = [f"user{i}@domain{i % domains}.test"]
+        if i % 100 == 0:
+            # Письмо сразу в два домена, один из них отклоняет получателя навсегда
+            recipients += [f"user{i}@domain{(i + 1) % domains}.test", f"user{i}@reject.test"]
+        queue.enqueue('bench@example.com', recipients, f"Subject: notification {i}\r\n\r\nHello {i}\r\n")
+    enqueue_time = time.perf_counter() - start
+
+    queue.wait_idle()
+    elapsed = time.perf_counter() - start
+    queue.stop()
+
+    stats = queue.stats()
+    print(f"Постановка {count} писем: {enqueue_time:.2f} с ({count / enqueue_time:.0f} писем/с, без ожидания SMTP)")
+    print(f"Доставка: {elapsed:.2f} с, {stats['sent'] / elapsed * 60:.0f} писем/мин, "
+          f"временных отказов сервера: {stub.stats.temp_failures}")
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Пропускная способность очереди почты на локальной заглушке SMTP')
+    parser.add_argument('--count', type=int, default=3000, help='Количество писем')
+    parser.add_argument('--domains', type=int, default=10, help='Количество доменов получателей')
+    parser.add_argument('--workers', type=int, default=32, help='Одновременных SMTP-соединений')
+    parser.add_argument('--per-domain', type=int, default=4, help='Одновременных писем в один домен')
+    parser.add_argument('--latency', type=float, default=20, help='Задержка ответа сервера в миллисекундах')
+    parser.add_argument('--fail-rate', type=float, default=0.05, help='Доля временных отказов сервера')
+    parser.add_argument('--spool', default='bench_spool', help='Каталог очереди (очищается)')
+
+    args = parser.parse_args()
+
+    main(args.count, args.domains, args.workers, args.per_domain, args.latency / 1000, args.fail_rate, args.spool)
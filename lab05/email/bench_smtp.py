@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import threading
+import time
+
+from smtp_session import SMTPSession, SMTPError
+from smtp_stub import SMTPStub
+
+
+def start_stub(latency, pipelining):
+    """Запускает заглушку в отдельном потоке и возвращает (stub, порт)"""
+    stub = SMTPStub(latency, pipelining)
+    ready = threading.Event()
+    port = []
+
+    def on_ready(value):
+        port.append(value)
+        ready.set()
+
+    threading.Thread(target=lambda: asyncio.run(stub.serve('127.0.0.1', 0, on_ready)), daemon=True).start()
+    ready.wait()
+    return stub, port[0]
+
+
+def make_message(i, recipients):
+    return (f"From: bench@example.com\r\nTo: {', '.join(recipients)}\r\nSubject: bench {i}\r\n\r\n"
+            f"Message {i}\r\n.line starting with a dot\r\n")
+
+
+def check_session(port):
+    """Проверка протокола: несколько получателей, частичный отказ, точка в начале строки, RSET после ошибки"""
+    with SMTPSession('127.0.0.1', port, 'example.com', use_tls=False, username='user', password='secret') as session:
+        rejected = session.send_message('bench@example.com', ['a@example.com', 'b@reject.test', 'c@example.com'],
+                                        make_message(0, ['a', 'b', 'c']))
+        assert list(rejected) == ['b@reject.test'], rejected
+        try:
+            session.send_message('bench@example.com', ['x@reject.test'], 'body')
+            raise AssertionError('all recipients rejected, expected SMTPError')
+        except SMTPError as e:
+            assert e.code == 550, e
+        session.send_message('bench@example.com', ['a@example.com'], [b'.first', b' line\r\n.', b'second\r\n'])
+
+
+def run(name, port, count, recipients, reuse):
+    start = time.perf_counter()
+    if reuse:
+        with SMTPSession('127.0.0.1', port, 'example.com', use_tls=False) as session:
+            for i in range(count):
+                session.send_message('bench@example.com', recipients, make_message(i, recipients))
+    else:
+        for i in range(count):
+            with SMTPSession('127.0.0.1', port, 'example.com', use_tls=False) as session:
+                session.send_message('bench@example.com', recipients, make_message(i, recipients))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {count / elapsed:8.1f} писем/с  {elapsed / count * 1000:7.2f} мс на письмо")
+
+
+def main(latency, count, recipient_count):
+    recipients = [f"user{i}@example.com" for i in range(recipient_count)]
+
+    stub, port = start_stub(latency, pipelining=True)
+    check_session(port)
+    print(f"Задержка ответа {latency * 1000:.0f} мс, {count} писем по {recipient_count} получателей")
+
+    plain_stub, plain_port = start_stub(latency, pipelining=False)
+    run("новое соединение на письмо", plain_port, count, recipients, reuse=False)
+    run("одно соединение, без PIPELINING", plain_port, count, recipients, reuse=True)
+    run("одно соединение, PIPELINING", port, count, recipients, reuse=True)
+    print(f"Заглушка приняла {stub.stats.messages + plain_stub.stats.messages} писем")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сравнение отправки писем через SMTPSession на локальной заглушке')
+    parser.add_argument('--latency', type=float, default=20, help='Задержка ответа сервера в миллисекундах')
+    parser.add_argument('--count', type=int, default=50, help='Количество писем в каждом режиме')
+    parser.add_argument('--recipients', type=int, default=3, help='Получателей в одном письме')
+
+    args = parser.parse_args()
+
+    main(args.latency / 1000, args.count, args.recipients)
@@ -1,89 +1,40 @@
-import socket
-import ssl
-import base64
 import argparse
 import sys
 import time
 from getpass import getpass
 
-
-def send_command(sock, command, expected_code):
-    """Отправляет команду на сервер и проверяет код ответа"""
-    print(f">> {command}")
-    sock.send((command + '\r\n').encode())
-
-    response = sock.recv(1024).decode()
-    print(f"<< {response}")
-
-    response_code = response[:3]
-    if response_code != expected_code:
-        raise Exception(f"Ожидался код {expected_code}, получен: {response}")
-
-    return response
-
-
-def send_email_via_socket(server, port, sender, recipient, subject, message, use_tls=True, username=None,
-                          password=None):
-    """Отправляет email через SMTP используя сокеты напрямую"""
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+from smtp_session import SMTPSession
+
+
+def create_text_message(sender, recipients, subject, message):
+    """Создает текстовое письмо с заголовками"""
+    date = time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime())
+    email_content = f"From: {sender}\r\n"
+    email_content += f"To: {', '.join(recipients)}\r\n"
+    email_content += f"Subject: {subject}\r\n"
+    email_content += f"Date: {date}\r\n"
+    email_content += f"Content-Type: text/plain; charset=utf-8\r\n"
+    email_content += "\r\n"
+    email_content += message
+    return email_content
+
+
+def send_email_via_socket(server, port, sender, recipients, subject, message, use_tls=True, username=None,
+                          password=None, session=None):
+    """
+    Отправляет email через SMTP используя сокеты напрямую.
+    Если передана открытая session, письмо уходит через неё, и соединение остаётся открытым для следующих.
+    """
+    own_session = session is None
+    if own_session:
+        session = SMTPSession(server, port, sender.split('@')[1], use_tls=use_tls, username=username,
+                              password=password, verbose=True)
 
     try:
-        print(f"Соединение с {server}:{port}...")
-        sock.connect((server, port))
-
-        greeting = sock.recv(1024).decode()
-        print(f"<< {greeting}")
-
-        if not greeting.startswith('220'):
-            raise Exception(f"Неожиданный ответ от сервера: {greeting}")
-
-        domain = sender.split('@')[1]
-        send_command(sock, f"EHLO {domain}", "250")
-
-        if use_tls:
-            send_command(sock, "STARTTLS", "220")
-
-            context = ssl.create_default_context()
-            secure_sock = context.wrap_socket(sock, server_hostname=server)
-            sock = secure_sock
-
-            send_command(sock, f"EHLO {domain}", "250")
-
-        if username and password:
-            send_command(sock, "AUTH LOGIN", "334")
-
-            username_b64 = base64.b64encode(username.encode()).decode()
-            send_command(sock, username_b64, "334")
-
-            password_b64 = base64.b64encode(password.encode()).decode()
-            send_command(sock, password_b64, "235")
-
-        send_command(sock, f"MAIL FROM:<{sender}>", "250")
-
-        send_command(sock, f"RCPT TO:<{recipient}>", "250")
-
-        send_command(sock, "DATA", "354")
-
-        date = time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime())
-        email_content = f"From: {sender}\r\n"
-        email_content += f"To: {recipient}\r\n"
-        email_content += f"Subject: {subject}\r\n"
-        email_content += f"Date: {date}\r\n"
-        email_content += f"Content-Type: text/plain; charset=utf-8\r\n"
-        email_content += "\r\n"
-        email_content += message
-        email_content += "\r\n.\r\n"
-
-        print(f">> [Отправка содержимого письма]")
-        sock.send(email_content.encode())
-
-        response = sock.recv(1024).decode()
-        print(f"<< {response}")
-
-        if not response.startswith('250'):
-            raise Exception(f"Ошибка при отправке данных: {response}")
-
-        send_command(sock, "QUIT", "221")
+        email_content = create_text_message(sender, recipients, subject, message)
+        rejected = session.send_message(sender, recipients, email_content)
+        for recipient, (code, text) in rejected.items():
+            print(f"Получатель {recipient} отклонён: {code} {text}")
 
         print("Сообщение успешно отправлено!")
         return True
@@ -92,10 +43,8 @@ def send_email_via_socket(server, port, sender, recipient, subject, message, use
         print(f"Ошибка при отправке почты: {e}")
         return False
     finally:
-        try:
-            sock.close()
-        except:
-            pass
+        if own_session:
+            session.close()
 
 
 def main():
@@ -103,7 +52,7 @@ def main():
     parser.add_argument('--server', '-s', required=True, help='SMTP сервер')
     parser.add_argument('--port', '-p', type=int, default=587, help='Порт сервера (по умолчанию 587)')
     parser.add_argument('--sender', '-f', required=True, help='Email отправителя')
-    parser.add_argument('--recipient', '-r', required=True, help='Email получателя')
+    parser.add_argument('--recipient', '-r', required=True, nargs='+', help='Email получателей (можно несколько)')
     parser.add_argument('--subject', '-j', default='Тестовое сообщение', help='Тема сообщения')
     parser.add_argument('--message', '-m', help='Текст сообщения')
     parser.add_argument('--no-tls', action='store_true', help='Отключить использование TLS')
@@ -1,5 +1,3 @@
-import socket
-import ssl
 import base64
 import argparse
 import sys
@@ -7,22 +5,12 @@ import time
 import os
 import uuid
 from getpass import getpass
-from email.utils import formatdate
+from email.utils import encode_rfc2231, formatdate
 
+from smtp_session import SMTPSession
 
-def send_command(sock, command, expected_code):
-    """Отправляет команду на сервер и проверяет код ответа"""
-    print(f">> {command}")
-    sock.send((command + '\r\n').encode())
-
-    response = sock.recv(1024).decode()
-    print(f"<< {response}")
-
-    response_code = response[:3]
-    if response_code != expected_code:
-        raise Exception(f"Ожидался код {expected_code}, получен: {response}")
-
-    return response
+# Сколько байт вложения кодировать за раз: 1024 строки Base64 по 57 исходных байт
+BASE64_CHUNK_SIZE = 57 * 1024
 
 
 def generate_boundary():
@@ -30,15 +18,19 @@ def generate_boundary():
     return f"------------{uuid.uuid4().hex}"
 
 
-def encode_image_base64(image_path):
-    """Кодирует изображение в Base64"""
-    try:
-        with open(image_path, 'rb') as f:
-            image_data = f.read()
-            return base64.b64encode(image_data).decode()
-    except Exception as e:
-        print(f"Ошибка при чтении файла {image_path}: {e}")
-        sys.exit(1)
+def iter_base64_file(path):
+    """
+    Кодирует файл в Base64 по кускам, строками по 76 символов.
+    Кусок кратен 57 байтам — ровно одной строке, поэтому строки не рвутся на границах
+    и в памяти одновременно только один кусок.
+    """
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(BASE64_CHUNK_SIZE)
+            if not chunk:
+                return
+            encoded = base64.b64encode(chunk)
+            yield b''.join(encoded[i:i + 76] + b'\r\n' for i in range(0, len(encoded), 76))
 
 
 def get_content_type(filename):
@@ -54,107 +46,76 @@ def get_content_type(filename):
         return 'application/octet-stream'
 
 
-def create_mime_message(sender, recipient, subject, text_message, image_path=None):
-    """Создает MIME сообщение с текстом и изображением"""
+def encode_filename(filename):
+    """Параметр filename для Content-Disposition; не-ASCII имена кодируются по RFC 2231"""
+    if filename.isascii():
+        return f'filename="{filename}"'
+    return f"filename*={encode_rfc2231(filename, 'utf-8')}"
+
+
+def iter_mime_message(sender, recipients, subject, text_message, attachments=()):
+    """
+    Генератор MIME сообщения с текстом и вложениями: отдаёт куски bytes по мере готовности.
+    Вложения читаются и кодируются прямо во время отправки, так что расход памяти
+    не зависит ни от их размера, ни от количества.
+    """
     boundary = generate_boundary()
+    # В SMTP строки разделяются только CRLF
+    text_message = text_message.replace('\r\n', '\n').replace('\n', '\r\n')
 
     headers = f"From: {sender}\r\n"
-    headers += f"To: {recipient}\r\n"
+    headers += f"To: {', '.join(recipients)}\r\n"
     headers += f"Subject: {subject}\r\n"
     headers += f"Date: {formatdate(localtime=True)}\r\n"
     headers += f"MIME-Version: 1.0\r\n"
 
-    if image_path:
-        headers += f"Content-Type: multipart/mixed; boundary=\"{boundary}\"\r\n"
-        headers += "\r\n"
-
-        message = f"--{boundary}\r\n"
-        message += "Content-Type: text/plain; charset=utf-8\r\n"
-        message += "Content-Transfer-Encoding: 7bit\r\n"
-        message += "\r\n"
-        message += text_message
-        message += "\r\n"
-
-        if image_path:
-            image_filename = os.path.basename(image_path)
-            content_type = get_content_type(image_filename)
-            image_data = encode_image_base64(image_path)
-
-            message += f"--{boundary}\r\n"
-            message += f"Content-Type: {content_type}\r\n"
-            message += f"Content-Transfer-Encoding: base64\r\n"
-            message += f"Content-Disposition: attachment; filename=\"{image_filename}\"\r\n"
-            message += "\r\n"
-
-            for i in range(0, len(image_data), 76):
-                message += image_data[i:i + 76] + "\r\n"
-
-        message += f"--{boundary}--\r\n"
-    else:
+    if not attachments:
         headers += "Content-Type: text/plain; charset=utf-8\r\n"
+        headers += "Content-Transfer-Encoding: 8bit\r\n"
         headers += "\r\n"
-        message = text_message
-
-    return headers + message
-
-
-def send_email_via_socket(server, port, sender, recipient, subject, message, image_path=None, use_tls=True,
-                          username=None, password=None):
-    """Отправляет email через SMTP используя сокеты напрямую"""
-    # Создаем TCP сокет
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        yield (headers + text_message).encode()
+        return
+
+    headers += f"Content-Type: multipart/mixed; boundary=\"{boundary}\"\r\n"
+    headers += "\r\n"
+
+    part = f"--{boundary}\r\n"
+    part += "Content-Type: text/plain; charset=utf-8\r\n"
+    part += "Content-Transfer-Encoding: 8bit\r\n"
+    part += "\r\n"
+    part += text_message
+    part += "\r\n"
+    yield (headers + part).encode()
+
+    for path in attachments:
+        filename = os.path.basename(path)
+        part = f"--{boundary}\r\n"
+        part += f"Content-Type: {get_content_type(filename)}\r\n"
+        part += f"Content-Transfer-Encoding: base64\r\n"
+        part += f"Content-Disposition: attachment; {encode_filename(filename)}\r\n"
+        part += "\r\n"
+        yield part.encode()
+        yield from iter_base64_file(path)
+
+    yield f"--{boundary}--\r\n".encode()
+
+
+def send_email_via_socket(server, port, sender, recipients, subject, message, attachments=(), use_tls=True,
+                          username=None, password=None, session=None):
+    """
+    Отправляет email через SMTP используя сокеты напрямую.
+    Если передана открытая session, письмо уходит через неё, и соединение остаётся открытым для следующих.
+    """
+    own_session = session is None
+    if own_session:
+        session = SMTPSession(server, port, sender.split('@')[1], use_tls=use_tls, username=username,
+                              password=password, verbose=True)
 
     try:
-        print(f"Соединение с {server}:{port}...")
-        sock.connect((server, port))
-
-        greeting = sock.recv(1024).decode()
-        print(f"<< {greeting}")
-
-        if not greeting.startswith('220'):
-            raise Exception(f"Неожиданный ответ от сервера: {greeting}")
-
-        domain = sender.split('@')[1]
-        send_command(sock, f"EHLO {domain}", "250")
-
-        if use_tls:
-            send_command(sock, "STARTTLS", "220")
-
-            context = ssl.create_default_context()
-            secure_sock = context.wrap_socket(sock, server_hostname=server)
-            sock = secure_sock
-
-            send_command(sock, f"EHLO {domain}", "250")
-
-        if username and password:
-            send_command(sock, "AUTH LOGIN", "334")
-
-            username_b64 = base64.b64encode(username.encode()).decode()
-            send_command(sock, username_b64, "334")
-
-            password_b64 = base64.b64encode(password.encode()).decode()
-            send_command(sock, password_b64, "235")
-
-        send_command(sock, f"MAIL FROM:<{sender}>", "250")
-
-        send_command(sock, f"RCPT TO:<{recipient}>", "250")
-
-        send_command(sock, "DATA", "354")
-
-        email_content = create_mime_message(sender, recipient, subject, message, image_path)
-
-        email_content += "\r\n.\r\n"
-
-        print(f">> [Отправка содержимого письма]")
-        sock.send(email_content.encode())
-
-        response = sock.recv(1024).decode()
-        print(f"<< {response}")
-
-        if not response.startswith('250'):
-            raise Exception(f"Ошибка при отправке данных: {response}")
-
-        send_command(sock, "QUIT", "221")
+        email_content = iter_mime_message(sender, recipients, subject, message, attachments)
+        rejected = session.send_message(sender, recipients, email_content)
+        for recipient, (code, text) in rejected.items():
+            print(f"Получатель {recipient} отклонён: {code} {text}")
 
         print("Сообщение успешно отправлено!")
         return True
@@ -163,10 +124,8 @@ def send_email_via_socket(server, port, sender, recipient, subject, message, ima
         print(f"Ошибка при отправке почты: {e}")
         return False
     finally:
-        try:
-            sock.close()
-        except:
-            pass
+        if own_session:
+            session.close()
 
 
 def main():
@@ -174,18 +133,19 @@ def main():
     parser.add_argument('--server', '-s', required=True, help='SMTP сервер')
     parser.add_argument('--port', '-p', type=int, default=587, help='Порт сервера (по умолчанию 587)')
     parser.add_argument('--sender', '-f', required=True, help='Email отправителя')
-    parser.add_argument('--recipient', '-r', required=True, help='Email получателя')
+    parser.add_argument('--recipient', '-r', required=True, nargs='+', help='Email получателей (можно несколько)')
     parser.add_argument('--subject', '-j', default='Тестовое сообщение с изображением', help='Тема сообщения')
     parser.add_argument('--message', '-m', help='Текст сообщения')
-    parser.add_argument('--image', '-i', help='Путь к изображению для вложения')
+    parser.add_argument('--image', '-i', nargs='+', default=[], help='Пути к файлам для вложения (можно несколько)')
     parser.add_argument('--no-tls', action='store_true', help='Отключить использование TLS')
     parser.add_argument('--username', '-u', help='Имя пользователя для авторизации')
 
     args = parser.parse_args()
 
-    if args.image and not os.path.exists(args.image):
-        print(f"Ошибка: файл {args.image} не найден")
-        sys.exit(1)
+    for path in args.image:
+        if not os.path.exists(path):
+            print(f"Ошибка: файл {path} не найден")
+            sys.exit(1)
 
     password = None
     if args.username:
@@ -211,7 +171,7 @@ def main():
         args.recipient,
         args.subject,
         message,
-        image_path=args.image,
+        attachments=args.image,
         use_tls=not args.no_tls,
         username=args.username,
         password=password
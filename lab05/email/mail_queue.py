@@ -0,0 +1,492 @@
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from getpass import getpass
+
+from smtp_session import SMTPSession, SMTPError
+
+# Блок чтения письма из очереди при отправке
+READ_SIZE = 64 * 1024
+
+# Через сколько секунд недописанный файл в tmp/ считается брошенным
+STALE_TMP_AGE = 3600
+
+# Как часто команда run ищет письма, поставленные в очередь другими процессами
+SCAN_INTERVAL = 1.0
+
+# По скольким последним доставкам считаются перцентили задержки
+DELAY_SAMPLES = 10000
+
+
+class SpoolError(Exception):
+    """Не удалось прочитать или изменить файлы очереди: это ошибка диска, а не доставки"""
+
+
+@contextmanager
+def spool_io(action):
+    try:
+        yield
+    except OSError as e:
+        raise SpoolError(f"{action}: {type(e).__name__}: {e}") from e
+
+
+class Job:
+    """Одно письмо в очереди: все его получатели из одного домена"""
+
+    def __init__(self, id, sender, recipients, created, attempts=0, next_attempt=0.0, last_error=None):
+        self.id = id
+        self.sender = sender
+        self.recipients = recipients
+        self.created = created
+        self.attempts = attempts
+        self.next_attempt = next_attempt
+        self.last_error = last_error
+
+    @property
+    def domain(self):
+        return self.recipients[0].rsplit('@', 1)[-1].lower()
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class QueueMetrics:
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected_recipients = 0
+        self.session_errors = 0
+        self.spool_errors = 0
+        self.delays = deque(maxlen=DELAY_SAMPLES)
+        self.lock = threading.Lock()
+
+    def record_sent(self, created):
+        with self.lock:
+            self.sent += 1
+            self.delays.append(time.time() - created)
+
+    def add(self, name, value=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self, queued, in_flight):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            delays = sorted(self.delays)
+            return {
+                'enqueued': self.enqueued,
+                'sent': self.sent,
+                'retried': self.retried,
+                'failed': self.failed,
+                'rejected_recipients': self.rejected_recipients,
+                'session_errors': self.session_errors,
+                'spool_errors': self.spool_errors,
+                'queued': queued,
+                'in_flight': in_flight,
+                'sent_per_minute': round(self.sent / elapsed * 60, 1) if elapsed else 0.0,
+                'delay_p50_s': round(delays[len(delays) // 2], 3) if delays else None,
+                'delay_p99_s': round(delays[min(len(delays) - 1, int(len(delays) * 0.99))], 3) if delays else None,
+            }
+
+
+class MailQueue:
+    """
+    Очередь исходящей почты в каталоге spool:
+      queue/<id>.eml и queue/<id>.json — письмо и его конверт со счётчиком попыток;
+      failed/ — письма, от которых пришлось отказаться;
+      tmp/ — недописанные файлы, в queue/ они попадают атомарным переименованием.
+    enqueue только пишет файлы и будит рабочие потоки, поэтому вызывающий не ждёт SMTP.
+    Каждый рабочий поток держит свою SMTPSession и переиспользует её между письмами;
+    одновременно в один домен получателей уходит не больше per_domain писем.
+    Временные ошибки (4xx, обрыв соединения) повторяются с экспоненциальной задержкой,
+    постоянные (5xx) или исчерпание попыток переносят письмо в failed/. Ошибки подключения
+    и авторизации — ошибки сессии, а не письма: поток выжидает и подключается снова, письмо
+    возвращается в очередь без траты попытки. Ошибка файлов самой очереди не считается ни той,
+    ни другой: письмо могло уже уйти, поэтому до перезапуска оно не берётся снова.
+    Команда run должна работать в одном экземпляре на каталог; ставить письма можно из любого числа процессов.
+    """
+
+    def __init__(self, spool_dir, session_factory, workers=8, per_domain=4, max_attempts=8,
+                 base_delay=30.0, max_delay=3600.0):
+        self.spool_dir = spool_dir
+        self.session_factory = session_factory
+        self.workers = workers
+        self.per_domain = per_domain
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.metrics = QueueMetrics()
+
+        self.queue_dir = os.path.join(spool_dir, 'queue')
+        self.failed_dir = os.path.join(spool_dir, 'failed')
+        self.tmp_dir = os.path.join(spool_dir, 'tmp')
+        for directory in (self.queue_dir, self.failed_dir, self.tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+
+        self.jobs = {}
+        self.schedule = []
+        # Готовые письма доменов, упёршихся в per_domain: лежат вне кучи до освобождения слота
+        self.waiting = {}
+        self.active = {}
+        # Письма, файлы которых не удалось прочитать или изменить: scan их не подхватывает
+        self.spool_failed = set()
+        self.in_flight = 0
+        self.sequence = 0
+        self.running = False
+        self.threads = []
+        self.condition = threading.Condition()
+        self.scan()
+
+    def path(self, directory, id, extension):
+        return os.path.join(directory, f"{id}.{extension}")
+
+    def write_atomic(self, path, chunks):
+        tmp_path = os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk.encode() if isinstance(chunk, str) else chunk)
+        os.replace(tmp_path, path)
+
+    def save(self, job):
+        self.write_atomic(self.path(self.queue_dir, job.id, 'json'), [json.dumps(job.to_dict())])
+
+    def scan(self):
+        """
+        Подхватывает письма из queue/, о которых очередь ещё не знает: оставшиеся с прошлого
+        запуска и поставленные другим процессом (например, командой enqueue).
+        Конверт пишется после письма, так что найденный .json всегда уже с готовым .eml.
+        """
+        found = 0
+        for name in os.listdir(self.queue_dir):
+            if not name.endswith('.json'):
+                continue
+            id = name[:-5]
+            with self.condition:
+                if id in self.jobs or id in self.spool_failed:
+                    continue
+            try:
+                with open(self.path(self.queue_dir, id, 'json')) as f:
+                    job = Job(**json.load(f))
+            except FileNotFoundError:
+                continue
+            with self.condition:
+                if id not in self.jobs and id not in self.spool_failed:
+                    self.push(job)
+                    found += 1
+                    self.condition.notify()
+        # Недописанные файлы упавших процессов; свежие могут принадлежать идущему сейчас enqueue
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            if time.time() - os.path.getmtime(path) > STALE_TMP_AGE:
+                os.remove(path)
+        return found
+
+    def push(self, job):
+        # Вызывается под self.condition
+        self.jobs[job.id] = job
+        self.sequence += 1
+        heapq.heappush(self.schedule, (job.next_attempt, self.sequence, job.id))
+
+    def enqueue(self, sender, recipients, content):
+        """
+        Ставит письмо в очередь и сразу возвращает список id — по одному на домен получателей.
+        content — bytes, str или итератор кусков; на диск пишется по мере получения.
+        """
+        by_domain = {}
+        for recipient in recipients:
+            by_domain.setdefault(recipient.rsplit('@', 1)[-1].lower(), []).append(recipient)
+        if isinstance(content, (bytes, str)):
+            content = [content]
+
+        jobs = [Job(uuid.uuid4().hex, sender, domain_recipients, time.time()) for domain_recipients in by_domain.values()]
+        with self.condition:
+            # Резерв id до записи конверта: параллельный scan не поставит письмо второй раз
+            for job in jobs:
+                self.jobs[job.id] = job
+
+        for number, job in enumerate(jobs):
+            eml_path = self.path(self.queue_dir, job.id, 'eml')
+            if number == 0:
+                self.write_atomic(eml_path, content)
+            else:
+                # Письмо в несколько доменов: копия через жёсткую ссылку, без повторной записи
+                os.link(self.path(self.queue_dir, jobs[0].id, 'eml'), eml_path)
+            self.save(job)
+
+        with self.condition:
+            for job in jobs:
+                self.push(job)
+            self.condition.notify(len(jobs))
+        ids = [job.id for job in jobs]
+        self.metrics.add('enqueued', len(ids))
+        return ids
+
+    def start(self):
+        self.running = True
+        for number in range(self.workers):
+            thread = threading.Thread(target=self.worker, name=f"mail-worker-{number}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def wait_idle(self, timeout=None):
+        """Ждёт, пока очередь опустеет; True, если дождались"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.jobs:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self.condition.wait(left)
+        return True
+
+    def take(self):
+        """Следующее готовое письмо, домен которого не упёрся в ограничение, либо None при остановке"""
+        with self.condition:
+            while self.running:
+                now = time.time()
+                job = None
+                while self.schedule and self.schedule[0][0] <= now:
+                    entry = heapq.heappop(self.schedule)
+                    candidate = self.jobs.get(entry[2])
+                    if candidate is None:
+                        continue
+                    if self.active.get(candidate.domain, 0) >= self.per_domain:
+                        # Каждое письмо снимается с кучи один раз, а не перебирается при каждом take
+                        self.waiting.setdefault(candidate.domain, deque()).append(entry)
+                        continue
+                    job = candidate
+                    break
+                if job is not None:
+                    self.active[job.domain] = self.active.get(job.domain, 0) + 1
+                    self.in_flight += 1
+                    return job
+                # Ждём новое письмо, освобождение домена или срок ближайшей повторной попытки
+                timeout = None
+                if self.schedule:
+                    timeout = max(0.0, self.schedule[0][0] - now)
+                self.condition.wait(timeout)
+            return None
+
+    def release(self, job, retry):
+        with self.condition:
+            self.active[job.domain] -= 1
+            self.in_flight -= 1
+            if retry:
+                self.push(job)
+            else:
+                self.jobs.pop(job.id, None)
+            # Освободился слот домена: одно ожидавшее письмо возвращается в кучу
+            waiting = self.waiting.get(job.domain)
+            while waiting:
+                entry = waiting.popleft()
+                if entry[2] in self.jobs:
+                    heapq.heappush(self.schedule, entry)
+                    break
+            if waiting is not None and not waiting:
+                del self.waiting[job.domain]
+            self.condition.notify_all()
+
+    def read_content(self, job):
+        with spool_io("read message"), open(self.path(self.queue_dir, job.id, 'eml'), 'rb') as f:
+            while True:
+                chunk = f.read(READ_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def worker(self):
+        session = self.session_factory()
+        session_failures = 0
+        try:
+            while True:
+                job = self.take()
+                if job is None:
+                    return
+                retry = True
+                session_error = False
+                try:
+                    try:
+                        if session.sock is None:
+                            session.connect()
+                    except (SMTPError, OSError) as e:
+                        # Не удалось подключиться или авторизоваться: письмо не виновато и вернётся в очередь как было
+                        session_error = True
+                        session_failures += 1
+                        self.metrics.add('session_errors')
+                        job.last_error = f"session: {type(e).__name__}: {e}"
+                    else:
+                        session_failures = 0
+                        retry = self.deliver(session, job)
+                except SpoolError as e:
+                    retry = False
+                    self.spool_error(job, e)
+                except Exception as e:
+                    # Непредвиденная ошибка не должна уносить поток и занятый слот домена
+                    try:
+                        retry = self.retry(job, f"{type(e).__name__}: {e}")
+                    except SpoolError as spool_e:
+                        retry = False
+                        self.spool_error(job, spool_e)
+                    except Exception:
+                        retry = False
+                finally:
+                    self.release(job, retry)
+                if session_error:
+                    delay = min(self.max_delay, self.base_delay * 2 ** (session_failures - 1))
+                    self.pause(delay * random.uniform(0.5, 1.0))
+        finally:
+            session.close()
+
+    def spool_error(self, job, error):
+        """Файлы письма остаются в queue/ как есть и ждут перезапуска: повтор сейчас мог бы отправить его дважды"""
+        with self.condition:
+            self.spool_failed.add(job.id)
+        self.metrics.add('spool_errors')
+        print(f"Письмо {job.id} отложено до перезапуска, ошибка каталога очереди: {error}", file=sys.stderr)
+
+    def pause(self, delay):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.running, delay)
+
+    def deliver(self, session, job):
+        """Одна попытка доставки; возвращает True, если письмо нужно повторить позже"""
+        try:
+            rejected = session.send_message(job.sender, job.recipients, self.read_content(job))
+        except SMTPError as e:
+            if 500 <= e.code < 600:
+                self.fail(job, str(e))
+                return False
+            return self.retry(job, str(e))
+        except OSError as e:
+            return self.retry(job, f"{type(e).__name__}: {e}")
+
+        temporary = [r for r, (code, _) in rejected.items() if 400 <= code < 500]
+        permanent = [r for r, (code, _) in rejected.items() if not 400 <= code < 500]
+        if permanent:
+            self.metrics.add('rejected_recipients', len(permanent))
+            with spool_io("save rejected recipients"):
+                self.write_atomic(self.path(self.failed_dir, f"{job.id}-rejected", 'json'),
+                                  [json.dumps({r: rejected[r] for r in permanent})])
+        if temporary:
+            # Остальным письмо уже доставлено: повторяем только для временно отклонённых
+            job.recipients = temporary
+            return self.retry(job, f"{len(temporary)} recipients temporarily rejected")
+
+        self.metrics.record_sent(job.created)
+        with spool_io("remove sent message"):
+            os.remove(self.path(self.queue_dir, job.id, 'json'))
+            os.remove(self.path(self.queue_dir, job.id, 'eml'))
+        return False
+
+    def retry(self, job, error):
+        job.attempts += 1
+        job.last_error = error
+        if job.attempts >= self.max_attempts:
+            self.fail(job, error)
+            return False
+        # Полная задержка растёт вдвое с каждой попыткой; случайная доля не даёт всем повторам совпасть
+        delay = min(self.max_delay, self.base_delay * 2 ** (job.attempts - 1))
+        job.next_attempt = time.time() + delay * random.uniform(0.5, 1.0)
+        with spool_io("save retry"):
+            self.save(job)
+        self.metrics.add('retried')
+        return True
+
+    def fail(self, job, error):
+        job.last_error = error
+        with spool_io("move to failed"):
+            self.write_atomic(self.path(self.failed_dir, job.id, 'json'), [json.dumps(job.to_dict())])
+            os.replace(self.path(self.queue_dir, job.id, 'eml'), self.path(self.failed_dir, job.id, 'eml'))
+            os.remove(self.path(self.queue_dir, job.id, 'json'))
+        self.metrics.add('failed')
+
+    def stats(self):
+        with self.condition:
+            queued = len(self.jobs) - self.in_flight
+            in_flight = self.in_flight
+        return self.metrics.snapshot(queued, in_flight)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Очередь исходящей почты с пулом SMTP-соединений')
+    parser.add_argument('--spool', default='spool', help='Каталог очереди (по умолчанию spool)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = subparsers.add_parser('enqueue', help='Поставить письмо в очередь')
+    enqueue_parser.add_argument('--sender', '-f', required=True, help='Email отправителя')
+    enqueue_parser.add_argument('--recipient', '-r', required=True, nargs='+', help='Email получателей')
+    enqueue_parser.add_argument('--file', help='Готовое письмо с заголовками (по умолчанию читается stdin)')
+
+    run_parser = subparsers.add_parser('run', help='Отправлять письма из очереди')
+    run_parser.add_argument('--server', '-s', required=True, help='SMTP сервер')
+    run_parser.add_argument('--port', '-p', type=int, default=587, help='Порт сервера (по умолчанию 587)')
+    run_parser.add_argument('--domain', default='localhost', help='Имя для EHLO')
+    run_parser.add_argument('--no-tls', action='store_true', help='Отключить использование TLS')
+    run_parser.add_argument('--username', '-u', help='Имя пользователя для авторизации')
+    run_parser.add_argument('--workers', type=int, default=8, help='Одновременных SMTP-соединений')
+    run_parser.add_argument('--per-domain', type=int, default=4, help='Одновременных писем в один домен')
+    run_parser.add_argument('--max-attempts', type=int, default=8, help='Попыток до отказа от письма')
+    run_parser.add_argument('--base-delay', type=float, default=30, help='Задержка перед первым повтором, с')
+    run_parser.add_argument('--until-empty', action='store_true', help='Завершиться, когда очередь опустеет')
+    run_parser.add_argument('--report-interval', type=float, default=10, help='Период вывода метрик, с')
+
+    args = parser.parse_args()
+
+    if args.command == 'enqueue':
+        queue = MailQueue(args.spool, session_factory=None)
+        if args.file:
+            with open(args.file, 'rb') as f:
+                ids = queue.enqueue(args.sender, args.recipient, iter(lambda: f.read(READ_SIZE), b''))
+        else:
+            ids = queue.enqueue(args.sender, args.recipient, iter(lambda: sys.stdin.buffer.read(READ_SIZE), b''))
+        print(f"В очереди: {', '.join(ids)}")
+        return
+
+    password = getpass("Введите пароль: ") if args.username else None
+
+    def session_factory():
+        return SMTPSession(args.server, args.port, args.domain, use_tls=not args.no_tls, username=args.username,
+                           password=password)
+
+    queue = MailQueue(args.spool, session_factory, workers=args.workers, per_domain=args.per_domain,
+                      max_attempts=args.max_attempts, base_delay=args.base_delay)
+    queue.start()
+    last_report = time.monotonic()
+    try:
+        while True:
+            idle = queue.wait_idle(SCAN_INTERVAL)
+            queue.scan()
+            if time.monotonic() - last_report >= args.report_interval:
+                print(json.dumps(queue.stats(), ensure_ascii=False))
+                last_report = time.monotonic()
+            if idle and args.until_empty and not queue.stats()['queued']:
+                print(json.dumps(queue.stats(), ensure_ascii=False))
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import base64
+import socket
+import ssl
+
+# Сколько байт письма накапливать перед sendall: мелкие куски не превращаются в отдельные сегменты
+DATA_BUFFER_SIZE = 64 * 1024
+
+
+class SMTPError(Exception):
+    """Сервер ответил кодом, которого не ждали"""
+
+    def __init__(self, code, text):
+        super().__init__(f"{code} {text}")
+        self.code = code
+        self.text = text
+
+
+def dot_stuff(chunks):
+    """
+    Экранирует точку в начале строки (RFC 5321, 4.5.2) и добавляет завершающую
+    последовательность CRLF.CRLF. Работает по кускам: состояние «начало строки»
+    переносится через границы, поэтому письмо не нужно собирать целиком.
+    """
+    at_line_start = True
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if not chunk:
+            continue
+        if at_line_start and chunk[:1] == b'.':
+            chunk = b'.' + chunk
+        chunk = chunk.replace(b'\n.', b'\n..')
+        at_line_start = chunk.endswith(b'\n')
+        yield chunk
+    yield b'.\r\n' if at_line_start else b'\r\n.\r\n'
+
+
+class SMTPSession:
+    """
+    Одно соединение с SMTP-сервером на много писем: EHLO, STARTTLS и AUTH
+    выполняются один раз. Если сервер объявил PIPELINING, команды MAIL, RCPT
+    и DATA уходят одной записью, и на конверт тратится один обмен вместо 2 + N.
+    """
+
+    def __init__(self, server, port, domain, use_tls=True, username=None, password=None, timeout=30,
+                 verbose=False):
+        self.server = server
+        self.port = port
+        self.domain = domain
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.verbose = verbose
+        self.sock = None
+        self.file = None
+        self.extensions = {}
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def pipelining(self):
+        return 'PIPELINING' in self.extensions
+
+    def log(self, text):
+        if self.verbose:
+            print(text)
+
+    def attach(self, sock):
+        self.sock = sock
+        # Ответы читаются через буфер построчно: recv(1024) мог вернуть половину или сразу несколько ответов
+        self.file = sock.makefile('rb')
+
+    def connect(self):
+        self.log(f"Соединение с {self.server}:{self.port}...")
+        self.attach(socket.create_connection((self.server, self.port), timeout=self.timeout))
+        try:
+            self.expect(self.read_reply(), 220)
+            self.ehlo()
+
+            if self.use_tls:
+                self.command("STARTTLS", 220)
+                context = ssl.create_default_context()
+                self.attach(context.wrap_socket(self.sock, server_hostname=self.server))
+                self.ehlo()
+
+            if self.username and self.password:
+                self.command("AUTH LOGIN", 334)
+                self.command(base64.b64encode(self.username.encode()).decode(), 334, secret=True)
+                self.command(base64.b64encode(self.password.encode()).decode(), 235, secret=True)
+        except BaseException:
+            self.abort()
+            raise
+
+    def ehlo(self):
+        code, lines = self.command_reply(f"EHLO {self.domain}")
+        self.expect((code, lines), 250)
+        self.extensions = {}
+        for line in lines[1:]:
+            name, _, params = line.partition(' ')
+            self.extensions[name.upper()] = params
+
+    def read_reply(self):
+        """Читает ответ целиком, включая многострочный (250-...), и возвращает (код, строки)"""
+        lines = []
+        while True:
+            line = self.file.readline()
+            if not line:
+                raise ConnectionError("Сервер закрыл соединение")
+            line = line.decode(errors='replace').rstrip('\r\n')
+            self.log(f"<< {line}")
+            lines.append(line[4:])
+            if line[3:4] != '-':
+                return int(line[:3]), lines
+
+    @staticmethod
+    def expect(reply, *codes):
+        code, lines = reply
+        if code not in codes:
+            raise SMTPError(code, ' '.join(lines))
+        return reply
+
+    def send_lines(self, lines, secret=False):
+        for line in lines:
+            self.log(">> [скрыто]" if secret else f">> {line}")
+        self.sock.sendall(''.join(line + '\r\n' for line in lines).encode())
+
+    def command_reply(self, line, secret=False):
+        self.send_lines([line], secret)
+        return self.read_reply()
+
+    def command(self, line, *codes, secret=False):
+        return self.expect(self.command_reply(line, secret), *codes)
+
+    def send_message(self, sender, recipients, content):
+        """
+        Отправляет одно письмо нескольким получателям в одной транзакции.
+        content — bytes, str или итератор кусков (см. dot_stuff). Возвращает словарь
+        отклонённых получателей {адрес: (код, текст)}; если отклонены все, бросает SMTPError.
+        После ошибки протокола транзакция сбрасывается RSET, и сессия годится для следующего письма.
+        """
+        if self.sock is None:
+            self.connect()
+        if isinstance(content, (bytes, str)):
+            content = [content]
+        try:
+            return self.transaction(sender, recipients, content)
+        except SMTPError:
+            try:
+                self.command("RSET", 250)
+            except (OSError, SMTPError):
+                self.abort()
+            raise
+        except BaseException:
+            # Обрыв посреди письма: состояние сервера неизвестно, соединение больше не годится
+            self.abort()
+            raise
+
+    def transaction(self, sender, recipients, content):
+        mail = f"MAIL FROM:<{sender}>"
+        rcpts = [f"RCPT TO:<{recipient}>" for recipient in recipients]
+        if self.pipelining:
+            self.send_lines([mail] + rcpts + ["DATA"])
+            mail_reply = self.read_reply()
+            rcpt_replies = [self.read_reply() for _ in rcpts]
+            data_reply = self.read_reply()
+        else:
+            mail_reply = self.expect(self.command_reply(mail), 250)
+            rcpt_replies = [self.command_reply(rcpt) for rcpt in rcpts]
+            data_reply = None
+            if any(code in (250, 251) for code, _ in rcpt_replies):
+                data_reply = self.command_reply("DATA")
+
+        rejected = {recipient: (code, ' '.join(lines))
+                    for recipient, (code, lines) in zip(recipients, rcpt_replies) if code not in (250, 251)}
+
+        if data_reply is not None and data_reply[0] == 354 and (mail_reply[0] != 250 or len(rejected) == len(rcpts)):
+            # Конвейер: сервер уже ждёт тело, хотя конверт не принят. Завершаем его пустым (RFC 2920, 3.1)
+            self.sock.sendall(b'.\r\n')
+            self.read_reply()
+        self.expect(mail_reply, 250)
+        if len(rejected) == len(rcpts):
+            code, text = rejected[recipients[0]] if recipients else (554, "Нет получателей")
+            raise SMTPError(code, text)
+        self.expect(data_reply, 354)
+
+        self.log(">> [Отправка содержимого письма]")
+        self.write_data(dot_stuff(content))
+        self.expect(self.read_reply(), 250)
+        return rejected
+
+    def write_data(self, chunks):
+        buffer = []
+        size = 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= DATA_BUFFER_SIZE:
+                self.sock.sendall(b''.join(buffer))
+                buffer = []
+                size = 0
+        if buffer:
+            self.sock.sendall(b''.join(buffer))
+
+    def noop(self):
+        self.command("NOOP", 250)
+
+    def close(self):
+        """Вежливое завершение: QUIT, затем закрытие сокета"""
+        if self.sock is None:
+            return
+        try:
+            self.command("QUIT", 221)
+        except (OSError, SMTPError):
+            pass
+        self.abort()
+
+    def abort(self):
+        for closable in (self.file, self.sock):
+            try:
+                if closable is not None:
+                    closable.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.file = None
@@ -0,0 +1,157 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+
+
+class StubStats:
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = 0
+        self.temp_failures = 0
+        self.recipients = 0
+        self.commands = 0
+
+
+class SMTPStub:
+    """
+    Локальная замена SMTP-сервера для проверки клиентов без сети.
+    Принимает любую авторизацию, не умеет STARTTLS (клиентам нужен --no-tls).
+    Получатели на домене reject.test отклоняются кодом 550, чтобы проверять частичный отказ.
+    latency — задержка каждого ответа, имитирующая время пути по сети: ответы на
+    конвейерные команды уходят вместе, а не копят задержку друг за другом.
+    fail_rate — доля писем, на которые после DATA приходит временный отказ 451.
+    """
+
+    def __init__(self, latency=0.0, pipelining=True, maildir=None, fail_rate=0.0):
+        self.latency = latency
+        self.pipelining = pipelining
+        self.maildir = maildir
+        self.fail_rate = fail_rate
+        self.stats = StubStats()
+        if maildir:
+            os.makedirs(maildir, exist_ok=True)
+
+    async def handle(self, reader, writer):
+        self.stats.connections += 1
+        loop = asyncio.get_running_loop()
+        last_send = 0.0
+
+        def reply(text):
+            # Ответ уходит не раньше, чем через latency после команды, и не раньше предыдущего ответа
+            nonlocal last_send
+            send_at = max(loop.time() + self.latency, last_send)
+            last_send = send_at
+            loop.call_at(send_at, writer.write, (text + '\r\n').encode())
+
+        reply("220 localhost SMTP stub ready")
+        sender = None
+        recipients = []
+        auth_steps = 0
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.stats.commands += 1
+                command = line.decode(errors='replace').rstrip('\r\n')
+                verb = command.split(' ', 1)[0].upper()
+
+                if auth_steps:
+                    auth_steps -= 1
+                    reply("334 UGFzc3dvcmQ6" if auth_steps else "235 Authentication succeeded")
+                elif verb in ('EHLO', 'HELO'):
+                    extensions = ["8BITMIME", "AUTH LOGIN"] + (["PIPELINING"] if self.pipelining else [])
+                    reply('\r\n'.join([f"250-localhost"] + [f"250-{e}" for e in extensions[:-1]]
+                                      + [f"250 {extensions[-1]}"]))
+                elif verb == 'AUTH':
+                    auth_steps = 2
+                    reply("334 VXNlcm5hbWU6")
+                elif verb == 'MAIL':
+                    sender = command[10:].strip()
+                    recipients = []
+                    reply("250 OK")
+                elif verb == 'RCPT':
+                    if sender is None:
+                        reply("503 Need MAIL first")
+                    elif command.lower().rstrip('>').endswith('@reject.test'):
+                        reply("550 No such user")
+                    else:
+                        recipients.append(command[8:].strip())
+                        reply("250 OK")
+                elif verb == 'DATA':
+                    if not recipients:
+                        reply("554 No valid recipients")
+                        continue
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    path = os.path.join(self.maildir, f"{time.time_ns()}.eml") if self.maildir else None
+                    with open(path if path else os.devnull, 'wb') as f:
+                        await self.read_data(reader, f)
+                    if random.random() < self.fail_rate:
+                        if path:
+                            os.remove(path)
+                        self.stats.temp_failures += 1
+                        sender = None
+                        recipients = []
+                        reply("451 Temporary local problem, try again later")
+                        continue
+                    self.stats.messages += 1
+                    self.stats.recipients += len(recipients)
+                    sender = None
+                    recipients = []
+                    reply("250 Message accepted")
+                elif verb == 'RSET':
+                    sender = None
+                    recipients = []
+                    reply("250 OK")
+                elif verb == 'NOOP':
+                    reply("250 OK")
+                elif verb == 'QUIT':
+                    # Последний ответ пишется напрямую: отложенная запись могла бы опоздать к закрытию
+                    await asyncio.sleep(max(loop.time() + self.latency, last_send) - loop.time())
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 Command not implemented")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_data(reader, f):
+        """Пишет тело письма в f до строки из одной точки, снимая экранирование точек; в памяти только строка"""
+        while True:
+            line = await reader.readline()
+            if not line or line in (b'.\r\n', b'.\n'):
+                return
+            f.write(line[1:] if line.startswith(b'..') else line)
+
+    async def serve(self, host, port, ready=None):
+        server = await asyncio.start_server(self.handle, host, port, limit=1 << 20)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Локальная заглушка SMTP-сервера с искусственной задержкой')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес (по умолчанию 127.0.0.1)')
+    parser.add_argument('--port', '-p', type=int, default=2525, help='Порт (по умолчанию 2525)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа в миллисекундах')
+    parser.add_argument('--no-pipelining', action='store_true', help='Не объявлять расширение PIPELINING')
+    parser.add_argument('--maildir', help='Сохранять принятые письма в этот каталог')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Доля писем с временным отказом 451')
+
+    args = parser.parse_args()
+
+    stub = SMTPStub(args.latency / 1000, not args.no_pipelining, args.maildir, args.fail_rate)
+    print(f"SMTP-заглушка на {args.host}:{args.port}, задержка {args.latency} мс")
+    try:
+        asyncio.run(stub.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,81 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from client import RemoteSession
+
+
+def start_server(port, workers, queue_size):
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py'),
+                               '--port', str(port), '--workers', str(workers), '--queue-size', str(queue_size),
+                               '--stats-interval', '0', '--quiet'], stdout=subprocess.DEVNULL)
+    # Ждём, пока сервер начнёт принимать соединения
+    for _ in range(50):
+        try:
+            RemoteSession('127.0.0.1', port).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Сервер не запустился")
+
+
+def report(name, count, elapsed, failed):
+    print(f"{name}: {count} команд за {elapsed:.2f} с, {count / elapsed:.0f} команд/с, "
+          f"{elapsed / count * 1000:.2f} мс на команду, с ошибкой: {failed}")
+
+
+def connection_per_command(port, commands):
+    """Как раньше: отдельное TCP-соединение на каждую команду"""
+    failed = 0
+    start = time.perf_counter()
+    for command in commands:
+        with RemoteSession('127.0.0.1', port) as session:
+            failed += not session.run(command).ok
+    return time.perf_counter() - start, failed
+
+
+def sequential_session(port, commands):
+    """Одно соединение, но следующая команда уходит только после результата предыдущей"""
+    start = time.perf_counter()
+    with RemoteSession('127.0.0.1', port) as session:
+        failed = sum(not session.run(command).ok for command in commands)
+    return time.perf_counter() - start, failed
+
+
+def batch_session(port, commands, in_flight):
+    """Одно соединение, до in_flight команд одновременно, результаты в порядке завершения"""
+    start = time.perf_counter()
+    with RemoteSession('127.0.0.1', port) as session:
+        results = session.run_batch(commands, in_flight)
+    elapsed = time.perf_counter() - start
+    wrong = sum(1 for i, result in enumerate(results) if bytes(result.stdout) != f"{i}\n".encode())
+    return elapsed, sum(not result.ok for result in results) + wrong
+
+
+def main(count, single, port, workers, in_flight):
+    server = start_server(port, workers, queue_size=in_flight * 2)
+    try:
+        commands = [f"echo {i}" for i in range(count)]
+        # Соединение на команду и последовательная сессия медленные: меряются на части команд
+        report("Соединение на команду", single, *connection_per_command(port, commands[:single]))
+        report("Сессия, по одной команде", single, *sequential_session(port, commands[:single]))
+        report(f"Сессия, пакет ({in_flight} одновременно)", count, *batch_session(port, commands, in_flight))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сравнение соединения на команду и мультиплексированной сессии')
+    parser.add_argument('--count', type=int, default=10000, help='Команд echo в пакете')
+    parser.add_argument('--single', type=int, default=1000, help='Команд для последовательных режимов')
+    parser.add_argument('--port', type=int, default=9998, help='Порт для локального сервера')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Рабочих потоков сервера')
+    parser.add_argument('--in-flight', type=int, default=32, help='Одновременных команд в пакете')
+
+    args = parser.parse_args()
+
+    main(args.count, args.single, args.port, args.workers, args.in_flight)
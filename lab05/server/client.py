@@ -1,69 +1,254 @@
 import socket
 import argparse
+import itertools
+import threading
 import sys
 
-
-def send_command(host, port, command):
-    """Отправляет команду на сервер и получает результат"""
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-    try:
-        print(f"[*] Подключение к {host}:{port}...")
-        client.connect((host, port))
-        print(f"[+] Соединение установлено")
-
-        print(f"[*] Отправка команды: {command}")
-        client.send(command.encode('utf-8'))
-
-        response_size_str = client.recv(1024).decode('utf-8')
-
+from protocol import COMMAND, STDOUT, STDERR, EXIT, ERROR, EXIT_CODE, ProtocolError, read_frame, send_frame
+
+
+class CommandResult:
+    """Результат одной команды сессии: заполняется потоком чтения по мере прихода кадров"""
+
+    def __init__(self, request_id, command, on_output=None, on_done=None):
+        self.request_id = request_id
+        self.command = command
+        self.on_output = on_output
+        self.on_done = on_done
+        self.stdout = bytearray()
+        self.stderr = bytearray()
+        self.return_code = None
+        self.error = None
+        self.done = threading.Event()
+
+    @property
+    def ok(self):
+        return self.error is None and self.return_code == 0
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"Команда #{self.request_id} не завершилась за {timeout} с")
+        return self
+
+
+class RemoteSession:
+    """
+    Одно соединение с сервером на много команд. Каждая команда получает свой id запроса,
+    несколько команд выполняются одновременно, а их кадры разбирает отдельный поток чтения:
+    результаты приходят в порядке завершения, а не отправки.
+    """
+
+    def __init__(self, host, port, timeout=None):
+        self.socket = socket.create_connection((host, port), timeout)
+        self.socket.settimeout(None)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = self.socket.makefile('rb')
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.closed = False
+        self.reader = threading.Thread(target=self.read_loop, name='session-reader', daemon=True)
+        self.reader.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, command, on_output=None, on_done=None):
+        """
+        Отправляет команду, не дожидаясь результата. on_output(тип кадра, данные) вызывается
+        из потока чтения для каждого куска вывода; без него вывод копится в результате.
+        on_done(результат) вызывается из потока чтения после последнего кадра.
+        """
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("Сессия закрыта")
+            result = CommandResult(next(self.ids), command, on_output, on_done)
+            self.pending[result.request_id] = result
+        # Отдельная блокировка на запись: кадры разных потоков не перемешаются в сокете,
+        # а поток чтения не ждёт отправителя, упёршегося в полный буфер
+        with self.send_lock:
+            send_frame(self.socket, COMMAND, result.request_id, command.encode('utf-8'))
+        return result
+
+    def run(self, command, on_output=None):
+        """Выполняет одну команду и ждёт её результат"""
+        return self.submit(command, on_output).wait()
+
+    def run_batch(self, commands, max_in_flight=16, on_result=None):
+        """
+        Выполняет список команд через одно соединение, держа в работе не больше max_in_flight
+        одновременно (больше сервер всё равно не примет сразу — лишние получат отказ
+        из-за переполненной очереди). Возвращает результаты в порядке списка команд.
+        """
+        slots = threading.BoundedSemaphore(max_in_flight)
+        results = []
+
+        def release(result):
+            slots.release()
+            if on_result is not None:
+                on_result(result)
+
+        for command in commands:
+            slots.acquire()
+            results.append(self.submit(command, on_done=release))
+
+        for result in results:
+            result.wait()
+        return results
+
+    def read_loop(self):
+        error = "Сервер закрыл соединение до завершения команды"
+        try:
+            while True:
+                frame = read_frame(self.stream)
+                if frame is None:
+                    break
+                frame_type, request_id, payload = frame
+                if frame_type not in (STDOUT, STDERR, EXIT, ERROR):
+                    raise ProtocolError(f"Неизвестный тип кадра: {frame_type}")
+                with self.lock:
+                    result = self.pending.get(request_id)
+                if result is None:
+                    continue
+
+                if frame_type in (STDOUT, STDERR):
+                    if result.on_output is not None:
+                        result.on_output(frame_type, payload)
+                    elif frame_type == STDOUT:
+                        result.stdout += payload
+                    else:
+                        result.stderr += payload
+                    continue
+
+                if frame_type == EXIT:
+                    result.return_code = EXIT_CODE.unpack(payload)[0]
+                elif frame_type == ERROR:
+                    result.error = payload.decode('utf-8', errors='replace')
+                self.complete(result)
+        except Exception as e:
+            error = f"Ошибка соединения: {str(e)}"
+        finally:
+            with self.lock:
+                self.closed = True
+                unfinished = list(self.pending.values())
+            for result in unfinished:
+                result.error = error
+                self.complete(result)
+
+    def complete(self, result):
+        with self.lock:
+            self.pending.pop(result.request_id, None)
+        result.done.set()
+        if result.on_done is not None:
+            result.on_done(result)
+
+    def close(self):
+        """Закрывает свою сторону соединения и дожидается результатов уже отправленных команд"""
+        with self.lock:
+            self.closed = True
         try:
-            response_size = int(response_size_str)
+            self.socket.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        self.reader.join()
+        self.stream.close()
+        self.socket.close()
 
-            client.send("ACK".encode('utf-8'))
 
-            print(f"[*] Ожидание результата ({response_size} байт)...")
+def write_output(frame_type, payload):
+    # Байты пишутся как есть: символ UTF-8, разрезанный между кадрами, склеится в терминале
+    output = sys.stdout.buffer if frame_type == STDOUT else sys.stderr.buffer
+    output.write(payload)
+    output.flush()
 
-            result = ""
-            bytes_received = 0
 
-            while bytes_received < response_size:
-                chunk = client.recv(min(response_size - bytes_received, 4096)).decode('utf-8')
-                if not chunk:
-                    break
+def print_result(result):
+    if result.error is not None:
+        print(f"[!] {result.error}")
+    else:
+        print(f"\n[*] Код возврата: {result.return_code}")
 
-                result += chunk
-                bytes_received += len(chunk.encode('utf-8'))
 
+def send_command(host, port, command):
+    """Отправляет команду на сервер и выводит результат по мере поступления; возвращает код возврата"""
+    try:
+        print(f"[*] Подключение к {host}:{port}...")
+        with RemoteSession(host, port) as session:
+            print(f"[+] Соединение установлено")
+
+            print(f"[*] Отправка команды: {command}")
             print("\n" + "=" * 50)
             print("РЕЗУЛЬТАТ ВЫПОЛНЕНИЯ КОМАНДЫ:")
-            print("=" * 50)
-            print(result)
+            print("=" * 50, flush=True)
 
-        except ValueError:
-            print(f"[!] Получен некорректный размер ответа: {response_size_str}")
+            result = session.run(command, write_output)
+            print_result(result)
+            return result.return_code
 
     except Exception as e:
         print(f"[!] Ошибка: {str(e)}")
     finally:
-        client.close()
         print("[-] Соединение закрыто")
 
 
+def interactive(host, port):
+    """Читает команды с клавиатуры и выполняет их в одном соединении, пока не введена пустая строка"""
+    print(f"[*] Подключение к {host}:{port}...")
+    with RemoteSession(host, port) as session:
+        print(f"[+] Соединение установлено, пустая строка — выход")
+        while True:
+            try:
+                command = input("> ")
+            except EOFError:
+                break
+            if not command.strip():
+                break
+            print_result(session.run(command, write_output))
+    print("[-] Соединение закрыто")
+
+
+def run_batch_file(host, port, path, max_in_flight):
+    """Выполняет команды из файла (по одной в строке) и печатает результаты по мере завершения"""
+    source = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    with source:
+        commands = [line.strip() for line in source if line.strip()]
+
+    def report(result):
+        status = result.error if result.error is not None else f"код возврата {result.return_code}"
+        print(f"[{'+' if result.ok else '!'}] #{result.request_id} {result.command}: {status}")
+        sys.stdout.buffer.write(result.stdout)
+        sys.stderr.buffer.write(result.stderr)
+        sys.stdout.flush()
+
+    with RemoteSession(host, port) as session:
+        results = session.run_batch(commands, max_in_flight, on_result=report)
+    failed = sum(1 for result in results if not result.ok)
+    print(f"[*] Выполнено команд: {len(results)}, с ошибкой: {failed}")
+    return failed
+
+
 def main():
     parser = argparse.ArgumentParser(description='Клиент для удаленного запуска команд')
     parser.add_argument('--host', required=True, help='IP-адрес сервера')
     parser.add_argument('--port', type=int, default=9999, help='Порт сервера (по умолчанию: 9999)')
     parser.add_argument('--command', '-c', help='Команда для выполнения')
+    parser.add_argument('--batch', '-b', help='Файл с командами по одной в строке ("-" — стандартный ввод)')
+    parser.add_argument('--in-flight', type=int, default=16,
+                        help='Сколько команд пакета выполняется одновременно (по умолчанию: 16)')
 
     args = parser.parse_args()
 
-    command = args.command
-    if not command:
-        command = input("Введите команду для выполнения: ")
-
-    send_command(args.host, args.port, command)
+    if args.batch:
+        sys.exit(1 if run_batch_file(args.host, args.port, args.batch, args.in_flight) else 0)
+    elif args.command:
+        send_command(args.host, args.port, args.command)
+    else:
+        interactive(args.host, args.port)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
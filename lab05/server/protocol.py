@@ -0,0 +1,52 @@
+import struct
+
+# Заголовок кадра: тип, id запроса, длина данных (сетевой порядок байт)
+FRAME_HEADER = struct.Struct('!BII')
+EXIT_CODE = struct.Struct('!i')
+
+# Типы кадров
+COMMAND = 1   # клиент -> сервер: текст команды в UTF-8
+STDOUT = 2    # сервер -> клиент: очередной кусок стандартного вывода
+STDERR = 3    # сервер -> клиент: очередной кусок потока ошибок
+EXIT = 4      # сервер -> клиент: код возврата, последний кадр запроса
+ERROR = 5     # сервер -> клиент: команду не удалось выполнить, последний кадр запроса
+
+# Верхняя граница данных в одном кадре: больше не бывает, значит это мусор, а не протокол
+MAX_FRAME_SIZE = 1 << 20
+
+
+class ProtocolError(Exception):
+    """Поток байт не похож на кадры протокола"""
+
+
+def pack_frame(frame_type, request_id, payload=b''):
+    return FRAME_HEADER.pack(frame_type, request_id, len(payload)) + payload
+
+
+def send_frame(sock, frame_type, request_id, payload=b''):
+    # sendall: частичная запись не оборвёт кадр посередине
+    sock.sendall(pack_frame(frame_type, request_id, payload))
+
+
+def read_exact(stream, size):
+    """Читает ровно size байт из файла сокета; None, если соединение закрыто до начала кадра"""
+    data = stream.read(size)
+    if not data:
+        return None
+    if len(data) < size:
+        raise ProtocolError("Соединение закрыто посреди кадра")
+    return data
+
+
+def read_frame(stream):
+    """Следующий кадр (тип, id запроса, данные) или None при закрытом соединении"""
+    header = read_exact(stream, FRAME_HEADER.size)
+    if header is None:
+        return None
+    frame_type, request_id, length = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Слишком большой кадр: {length} байт")
+    payload = read_exact(stream, length) if length else b''
+    if payload is None:
+        raise ProtocolError("Соединение закрыто посреди кадра")
+    return frame_type, request_id, payload
@@ -2,73 +2,294 @@ import socket
 import subprocess
 import threading
 import argparse
+import selectors
+import signal
+import struct
+import queue
+import time
 import sys
 import os
-
-
-def execute_command(command):
-    """Выполняет команду и возвращает её вывод"""
+from collections import deque
+
+from protocol import COMMAND, STDOUT, STDERR, EXIT, ERROR, EXIT_CODE, ProtocolError, read_frame, pack_frame
+
+# Сколько байт читать из канала процесса за раз: это же верхняя граница кадра вывода
+READ_SIZE = 64 * 1024
+
+# По скольким последним командам считаются перцентили времени ожидания и выполнения
+METRICS_WINDOW = 10000
+
+
+class Connection:
+    """Сокет клиента, в который могут писать несколько рабочих потоков: кадры не перемешиваются"""
+
+    def __init__(self, client_socket, address, send_timeout):
+        self.socket = client_socket
+        self.address = address
+        self.lock = threading.Lock()
+        # Сколько команд этого клиента ещё не получили последний кадр
+        self.pending = 0
+        self.idle = threading.Condition()
+        # Таймаут только на запись: клиент, который перестал читать, не держит рабочий поток вечно
+        # struct timeval: секунды и микросекунды, иначе дробный таймаут обрезается до 0 (ждать вечно)
+        timeval = struct.pack('ll', int(send_timeout), int(send_timeout % 1 * 1e6))
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, timeval)
+        # Кадры вывода маленькие и должны уходить сразу, без ожидания алгоритма Нейгла
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send_frame(self, frame_type, request_id, payload=b''):
+        data = pack_frame(frame_type, request_id, payload)
+        with self.lock:
+            self.socket.sendall(data)
+
+    def started(self):
+        with self.idle:
+            self.pending += 1
+
+    def finished(self):
+        with self.idle:
+            self.pending -= 1
+            if not self.pending:
+                self.idle.notify_all()
+
+    def wait_idle(self):
+        """Ждёт, пока все принятые команды не отправят результат"""
+        with self.idle:
+            self.idle.wait_for(lambda: not self.pending)
+
+    def close(self):
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+
+
+class ServerMetrics:
+    """Счётчики и времена ожидания в очереди и выполнения команд"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {'accepted': 0, 'rejected': 0, 'ok': 0, 'timeout': 0, 'output_limit': 0, 'error': 0}
+        self.waits = deque(maxlen=METRICS_WINDOW)
+        self.durations = deque(maxlen=METRICS_WINDOW)
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def record(self, status, wait, duration):
+        with self.lock:
+            self.counters[status] += 1
+            self.waits.append(wait)
+            self.durations.append(duration)
+
+    @staticmethod
+    def percentiles(values):
+        if not values:
+            return "нет данных"
+        values = sorted(values)
+        p50 = values[len(values) // 2]
+        p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+        return f"p50 {p50 * 1000:.1f} мс, p99 {p99 * 1000:.1f} мс, max {values[-1] * 1000:.1f} мс"
+
+    def summary(self, running, queued):
+        with self.lock:
+            counters = ', '.join(f"{name}: {value}" for name, value in self.counters.items())
+            return (f"[*] Выполняется: {running}, в очереди: {queued}; {counters}\n"
+                    f"    ожидание в очереди: {self.percentiles(self.waits)}\n"
+                    f"    выполнение: {self.percentiles(self.durations)}")
+
+
+def kill_process_group(process):
+    """Команда идёт через shell: убивать нужно всю группу, иначе дочерние процессы останутся жить"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def execute_command(connection, request_id, command, timeout, max_output):
+    """
+    Выполняет команду и пересылает её вывод кадрами STDOUT/STDERR по мере появления,
+    затем кадр EXIT с кодом возврата. В памяти держится не больше одного куска на поток:
+    пока клиент не заберёт данные, sendall блокируется, и процесс упирается в полный канал.
+    Если команда не уложилась в timeout секунд или вывела больше max_output байт,
+    её группа процессов убивается, а клиент получает кадр ERROR.
+    Возвращает итог: 'ok', 'timeout', 'output_limit' или 'error'.
+    """
     try:
         process = subprocess.Popen(
             command,
             shell=True,
+            stdin=subprocess.DEVNULL,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True
+            bufsize=0,
+            start_new_session=True
         )
-
-        stdout, stderr = process.communicate()
-
-        return_code = process.returncode
-
-        result = f"=== ВЫПОЛНЕНИЕ КОМАНДЫ: {command} ===\n"
-        result += f"Код возврата: {return_code}\n\n"
-
-        if stdout:
-            result += f"=== СТАНДАРТНЫЙ ВЫВОД ===\n{stdout}\n"
-
-        if stderr:
-            result += f"=== ОШИБКИ ===\n{stderr}\n"
-
-        return result
-    except Exception as e:
-        return f"Ошибка при выполнении команды: {str(e)}"
-
-
-def handle_client(client_socket, address):
-    """Обрабатывает подключение клиента"""
+    except OSError as e:
+        connection.send_frame(ERROR, request_id, f"Ошибка при выполнении команды: {e}".encode('utf-8'))
+        return 'error'
+
+    deadline = time.monotonic() + timeout
+    sent = 0
+    status = 'ok'
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, STDOUT)
+    selector.register(process.stderr, selectors.EVENT_READ, STDERR)
+    try:
+        while selector.get_map() and status == 'ok':
+            left = deadline - time.monotonic()
+            if left <= 0:
+                status = 'timeout'
+                break
+            for key, _ in selector.select(left):
+                chunk = os.read(key.fd, READ_SIZE)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                if sent + len(chunk) > max_output:
+                    chunk = chunk[:max_output - sent]
+                    status = 'output_limit'
+                sent += len(chunk)
+                if chunk:
+                    connection.send_frame(key.data, request_id, chunk)
+                if status != 'ok':
+                    break
+
+        if status == 'ok':
+            # Процесс мог закрыть вывод и продолжить работу: ждём его в пределах того же срока
+            try:
+                return_code = process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                status = 'timeout'
+    except BaseException:
+        # Клиент пропал: процесс никто не дочитает, его нужно остановить
+        kill_process_group(process)
+        raise
+    finally:
+        selector.close()
+        process.stdout.close()
+        process.stderr.close()
+
+    if status == 'timeout':
+        kill_process_group(process)
+        connection.send_frame(ERROR, request_id, f"Превышено время выполнения ({timeout} с), команда остановлена".encode('utf-8'))
+    elif status == 'output_limit':
+        kill_process_group(process)
+        connection.send_frame(ERROR, request_id, f"Превышен объём вывода ({max_output} байт), команда остановлена".encode('utf-8'))
+    else:
+        connection.send_frame(EXIT, request_id, EXIT_CODE.pack(return_code))
+    return status
+
+
+class CommandPool:
+    """
+    Фиксированное число рабочих потоков и очередь ограниченной длины: одновременно
+    выполняется не больше workers процессов, ещё не больше queue_size команд ждут.
+    Остальным сразу отказывают — всплеск запросов не порождает сотни процессов.
+    """
+
+    def __init__(self, workers, queue_size, timeout, max_output, verbose=True):
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.timeout = timeout
+        self.max_output = max_output
+        self.verbose = verbose
+        self.metrics = ServerMetrics()
+        self.running = 0
+        self.lock = threading.Lock()
+        for number in range(workers):
+            threading.Thread(target=self.worker, name=f"command-worker-{number}", daemon=True).start()
+
+    def submit(self, connection, request_id, command):
+        """Ставит команду в очередь; False, если очередь заполнена"""
+        connection.started()
+        try:
+            self.jobs.put_nowait((connection, request_id, command, time.monotonic()))
+        except queue.Full:
+            connection.finished()
+            self.metrics.count('rejected')
+            return False
+        self.metrics.count('accepted')
+        return True
+
+    def worker(self):
+        while True:
+            connection, request_id, command, enqueued = self.jobs.get()
+            started = time.monotonic()
+            with self.lock:
+                self.running += 1
+            status = 'error'
+            try:
+                status = execute_command(connection, request_id, command, self.timeout, self.max_output)
+            except Exception as e:
+                print(f"[!] Ошибка при выполнении команды: {str(e)}")
+                # Кадр мог оборваться посередине: дальше этот поток байт не разобрать
+                connection.close()
+            finally:
+                with self.lock:
+                    self.running -= 1
+                self.metrics.record(status, started - enqueued, time.monotonic() - started)
+                connection.finished()
+
+    def summary(self):
+        with self.lock:
+            running = self.running
+        return self.metrics.summary(running, self.jobs.qsize())
+
+
+def handle_client(client_socket, address, pool):
+    """
+    Обрабатывает подключение клиента. Команды не ждут друг друга: каждая сразу уходит в пул,
+    а её кадры помечены id запроса, так что результаты возвращаются в порядке завершения.
+    Когда клиент закрывает свою сторону соединения, досылаются результаты уже принятых команд.
+    """
     print(f"[+] Установлено соединение с {address[0]}:{address[1]}")
+    connection = Connection(client_socket, address, pool.timeout)
+    stream = client_socket.makefile('rb')
 
     try:
-        command = client_socket.recv(1024).decode('utf-8').strip()
-        print(f"[*] Получена команда: {command}")
-
-        if not command:
-            client_socket.send("Команда не получена".encode('utf-8'))
-            return
-
-        result = execute_command(command)
-        print(f"[*] Команда выполнена. Отправка результата...")
-
-        result_size = len(result.encode('utf-8'))
-        client_socket.send(str(result_size).encode('utf-8'))
+        while True:
+            frame = read_frame(stream)
+            if frame is None:
+                break
+            frame_type, request_id, payload = frame
+            if frame_type != COMMAND:
+                raise ProtocolError(f"Неожиданный кадр типа {frame_type}")
 
-        ack = client_socket.recv(1024).decode('utf-8')
+            command = payload.decode('utf-8').strip()
+            if pool.verbose:
+                print(f"[*] Получена команда #{request_id}: {command}")
+            if not command:
+                connection.send_frame(ERROR, request_id, "Команда не получена".encode('utf-8'))
+                continue
 
-        client_socket.send(result.encode('utf-8'))
+            if not pool.submit(connection, request_id, command):
+                connection.send_frame(ERROR, request_id, "Сервер перегружен, повторите позже".encode('utf-8'))
 
-        print(f"[+] Результат отправлен клиенту.")
+        connection.wait_idle()
 
     except Exception as e:
         print(f"[!] Ошибка при обработке запроса: {str(e)}")
     finally:
-        client_socket.close()
+        stream.close()
+        connection.close()
         print(f"[-] Соединение с {address[0]}:{address[1]} закрыто")
 
 
-def start_server(host, port, max_connections=5):
+def report_metrics(pool, interval):
+    while True:
+        time.sleep(interval)
+        print(pool.summary())
+
+
+def start_server(host, port, max_connections=5, workers=4, queue_size=32, timeout=30.0, max_output=16 << 20,
+                 stats_interval=10.0, verbose=True):
     """Запускает сервер для прослушивания входящих соединений"""
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    pool = CommandPool(workers, queue_size, timeout, max_output, verbose)
 
     try:
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -76,14 +297,18 @@ def start_server(host, port, max_connections=5):
         server.bind((host, port))
 
         server.listen(max_connections)
-        print(f"[+] Сервер запущен на {host}:{port}")
+        print(f"[+] Сервер запущен на {host}:{port} ({workers} процессов, очередь {queue_size}, "
+              f"таймаут {timeout} с)")
+
+        if stats_interval > 0:
+            threading.Thread(target=report_metrics, args=(pool, stats_interval), daemon=True).start()
 
         while True:
             client_socket, address = server.accept()
 
             client_thread = threading.Thread(
                 target=handle_client,
-                args=(client_socket, address)
+                args=(client_socket, address, pool)
             )
             client_thread.daemon = True
             client_thread.start()
@@ -94,6 +319,7 @@ def start_server(host, port, max_connections=5):
         print(f"[!] Ошибка сервера: {str(e)}")
     finally:
         server.close()
+        print(pool.summary())
         print("[+] Сервер остановлен")
 
 
@@ -101,11 +327,21 @@ def main():
     parser = argparse.ArgumentParser(description='Сервер для удаленного запуска команд')
     parser.add_argument('--host', default='127.0.0.1', help='IP-адрес для прослушивания (по умолчанию: 127.0.0.1)')
     parser.add_argument('--port', type=int, default=9999, help='Порт для прослушивания (по умолчанию: 9999)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Сколько команд выполняется одновременно (по умолчанию: число ядер)')
+    parser.add_argument('--queue-size', type=int, default=32, help='Сколько команд может ждать (по умолчанию: 32)')
+    parser.add_argument('--timeout', type=float, default=30, help='Предельное время команды в секундах (по умолчанию: 30)')
+    parser.add_argument('--max-output', type=int, default=16 << 20,
+                        help='Предельный объём вывода команды в байтах (по умолчанию: 16 МБ)')
+    parser.add_argument('--stats-interval', type=float, default=10,
+                        help='Период вывода метрик в секундах, 0 — не выводить (по умолчанию: 10)')
+    parser.add_argument('--quiet', '-q', action='store_true', help='Не печатать каждую полученную команду')
 
     args = parser.parse_args()
 
-    start_server(args.host, args.port)
+    start_server(args.host, args.port, workers=args.workers, queue_size=args.queue_size, timeout=args.timeout,
+                 max_output=args.max_output, stats_interval=args.stats_interval, verbose=not args.quiet)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
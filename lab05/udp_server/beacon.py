@@ -0,0 +1,19 @@
+import struct
+
+# Маяк: метка формата, номер пакета, время отправки в наносекундах от эпохи (сетевой порядок байт)
+BEACON = struct.Struct('!HQQ')
+MAGIC = 0x5442
+
+
+def pack_beacon(sequence, timestamp_ns):
+    return BEACON.pack(MAGIC, sequence, timestamp_ns)
+
+
+def unpack_beacon(data):
+    """(номер пакета, время отправки) или None, если датаграмма не похожа на маяк"""
+    if len(data) != BEACON.size:
+        return None
+    magic, sequence, timestamp_ns = BEACON.unpack(data)
+    if magic != MAGIC:
+        return None
+    return sequence, timestamp_ns
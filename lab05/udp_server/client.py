@@ -3,39 +3,176 @@ import argparse
 import time
 import datetime
 
+from beacon import unpack_beacon
 
-def start_broadcast_client(port, bind_ip='0.0.0.0'):
+# Буфер приёма побольше: при тысячах пакетов в секунду стандартного не хватает на паузу планировщика
+RECEIVE_BUFFER = 4 << 20
+
+# Сколько последних номеров помнить для поиска повторов; более старые опоздавшие пакеты считаются потерянными
+DEDUP_WINDOW = 4096
+
+
+def delay_summary(delays):
+    delays = sorted(delays)
+    p99 = delays[min(len(delays) - 1, int(len(delays) * 0.99))]
+    return (f"задержка мин {delays[0] / 1e3:.0f} мкс, сред {sum(delays) / len(delays) / 1e3:.0f} мкс, "
+            f"p99 {p99 / 1e3:.0f} мкс, макс {delays[-1] / 1e3:.0f} мкс")
+
+
+class BeaconStats:
+    """
+    Статистика маяков: задержка в одну сторону (время приёма минус время отправки — точна,
+    только если часы сервера и клиента синхронизированы), джиттер по RFC 3550
+    (сглаженное изменение задержки между соседними пакетами) и потери по номерам пакетов.
     """
-    Запускает UDP клиент, который принимает широковещательные сообщения
-    с текущим временем от сервера.
+
+    def __init__(self):
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.restarts = 0
+        self.expected_before = 0
+        self.first = None
+        self.highest = None
+        self.highest_sent = 0
+        self.seen = set()
+        self.jitter = 0.0
+        self.last_delay = None
+        self.delay_count = 0
+        self.delay_sum = 0
+        self.delay_min = None
+        self.delay_max = None
+        self.window_delays = []
+        self.mark = self.counters()
+
+    def add(self, sequence, sent_ns, delay_ns):
+        if self.highest is not None and sequence < self.highest and sent_ns > self.highest_sent:
+            # Номер меньше, а отправлен позже: сервер перезапущен, счёт начинается заново
+            self.restarts += 1
+            self.expected_before += self.highest - self.first + 1
+            self.first = self.highest = None
+            self.seen.clear()
+
+        if self.highest is not None and sequence <= self.highest - DEDUP_WINDOW:
+            return
+        if sequence in self.seen:
+            self.duplicates += 1
+            return
+        self.seen.add(sequence)
+        self.received += 1
+
+        if self.first is None:
+            self.first = self.highest = sequence
+            self.highest_sent = sent_ns
+        elif sequence > self.highest:
+            self.highest = sequence
+            self.highest_sent = sent_ns
+        else:
+            self.reordered += 1
+            self.first = min(self.first, sequence)
+        if len(self.seen) > 2 * DEDUP_WINDOW:
+            self.seen = {number for number in self.seen if number > self.highest - DEDUP_WINDOW}
+
+        if self.last_delay is not None:
+            self.jitter += (abs(delay_ns - self.last_delay) - self.jitter) / 16
+        self.last_delay = delay_ns
+        self.delay_count += 1
+        self.delay_sum += delay_ns
+        self.delay_min = delay_ns if self.delay_min is None else min(self.delay_min, delay_ns)
+        self.delay_max = delay_ns if self.delay_max is None else max(self.delay_max, delay_ns)
+        self.window_delays.append(delay_ns)
+
+    @property
+    def expected(self):
+        current = 0 if self.first is None else self.highest - self.first + 1
+        return self.expected_before + current
+
+    def counters(self):
+        return self.received, self.expected, self.reordered, self.duplicates
+
+    @staticmethod
+    def describe(received, expected, reordered, duplicates):
+        lost = max(0, expected - received)
+        loss = lost / expected * 100 if expected else 0.0
+        return (f"принято {received}, потеряно {lost} ({loss:.2f}%), не по порядку {reordered}, "
+                f"повторов {duplicates}")
+
+    def window_summary(self):
+        """Сводка с прошлого вызова; задержки окна забываются, джиттер копится дальше"""
+        counters = self.counters()
+        delta = [now - before for now, before in zip(counters, self.mark)]
+        self.mark = counters
+        if not self.window_delays:
+            return "пакетов нет"
+        text = f"{self.describe(*delta)}; {delay_summary(self.window_delays)}; джиттер {self.jitter / 1e3:.1f} мкс"
+        self.window_delays = []
+        return text
+
+    def total_summary(self):
+        if not self.delay_count:
+            return "пакетов нет"
+        return (f"{self.describe(*self.counters())}; задержка мин {self.delay_min / 1e3:.0f} мкс, "
+                f"сред {self.delay_sum / self.delay_count / 1e3:.0f} мкс, макс {self.delay_max / 1e3:.0f} мкс; "
+                f"джиттер {self.jitter / 1e3:.1f} мкс")
+
+
+def start_broadcast_client(port, bind_ip='0.0.0.0', quiet=False, report_interval=5.0):
+    """
+    Запускает UDP клиент, который принимает широковещательные маяки сервера
+    и считает задержку, джиттер и потери.
 
     Args:
         port (int): Порт для приема широковещательных сообщений
         bind_ip (str): IP-адрес для привязки (0.0.0.0 принимает со всех интерфейсов)
+        quiet (bool): Не печатать каждый пакет, только периодическую сводку
+        report_interval (float): Период сводки в секундах
     """
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
     client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
 
     client_socket.bind((bind_ip, port))
+    client_socket.settimeout(report_interval)
 
     print(f"[+] UDP клиент запущен. Ожидание сообщений на {bind_ip}:{port}")
     print("[*] Для остановки клиента нажмите Ctrl+C")
 
+    stats = BeaconStats()
+    invalid = 0
+    next_report = time.monotonic() + report_interval
     try:
-        message_count = 0
         while True:
-            data, addr = client_socket.recvfrom(1024)
-
-            local_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-
-            message = data.decode('utf-8')
-
-            message_count += 1
-            print(f"[+] Сообщение #{message_count} от {addr[0]}:{addr[1]}")
-            print(f"[+] Время сервера: {message}")
-            print(f"[+] Локальное время: {local_time}")
-            print("-" * 50)
+            try:
+                data, addr = client_socket.recvfrom(1024)
+            except socket.timeout:
+                data = None
+            received_at = time.time_ns()
+
+            if data is not None:
+                beacon = unpack_beacon(data)
+                if beacon is None:
+                    invalid += 1
+                    continue
+                sequence, sent_at = beacon
+                delay = received_at - sent_at
+                stats.add(sequence, sent_at, delay)
+
+                if not quiet:
+                    server_time = datetime.datetime.fromtimestamp(sent_at / 1e9).strftime('%Y-%m-%d %H:%M:%S.%f')
+                    local_time = datetime.datetime.fromtimestamp(received_at / 1e9).strftime('%Y-%m-%d %H:%M:%S.%f')
+                    print(f"[+] Сообщение #{sequence} от {addr[0]}:{addr[1]}")
+                    print(f"[+] Время сервера: {server_time}")
+                    print(f"[+] Локальное время: {local_time}")
+                    print(f"[+] Задержка: {delay / 1e3:.0f} мкс, джиттер: {stats.jitter / 1e3:.1f} мкс")
+                    print("-" * 50)
+
+            # Окно закрывается в любом режиме, иначе window_delays растёт без ограничений
+            if time.monotonic() >= next_report:
+                summary = stats.window_summary()
+                if quiet:
+                    print(f"[*] За {report_interval:g} с: {summary}")
+                next_report = time.monotonic() + report_interval
 
     except KeyboardInterrupt:
         print("\n[!] Клиент остановлен пользователем")
@@ -43,6 +180,9 @@ def start_broadcast_client(port, bind_ip='0.0.0.0'):
         print(f"[!] Ошибка: {e}")
     finally:
         client_socket.close()
+        print(f"[*] Итого: {stats.total_summary()}")
+        if stats.restarts or invalid:
+            print(f"[*] Перезапусков сервера: {stats.restarts}, посторонних датаграмм: {invalid}")
         print("[+] Клиент завершил работу")
 
 
@@ -52,11 +192,15 @@ def main():
                         help='Порт для приема широковещательных сообщений (по умолчанию: 12345)')
     parser.add_argument('--bind', '-b', default='0.0.0.0',
                         help='IP-адрес для привязки (по умолчанию: 0.0.0.0)')
+    parser.add_argument('--quiet', '-q', action='store_true',
+                        help='Не печатать каждый пакет, выводить периодическую сводку')
+    parser.add_argument('--report', type=float, default=5.0,
+                        help='Период сводки в тихом режиме, секунд (по умолчанию: 5)')
 
     args = parser.parse_args()
 
-    start_broadcast_client(args.port, args.bind)
+    start_broadcast_client(args.port, args.bind, args.quiet, args.report)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
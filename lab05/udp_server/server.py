@@ -3,16 +3,46 @@ import time
 import datetime
 import argparse
 
+from beacon import pack_beacon
 
-def start_broadcast_server(port, broadcast_ip='255.255.255.255', interval=1):
+# Последний отрезок ожидания проходит в активном цикле: sleep просыпается с опозданием
+# до миллисекунды, и при интервалах меньше неё рассылка шла бы заметно реже заданной
+SPIN_NS = 1_000_000
+
+
+def wait_until(deadline_ns):
+    """Ждёт момента deadline_ns по монотонным часам"""
+    remaining = deadline_ns - time.monotonic_ns()
+    if remaining > SPIN_NS:
+        time.sleep((remaining - SPIN_NS) / 1e9)
+    while time.monotonic_ns() < deadline_ns:
+        pass
+
+
+def lateness_summary(values):
+    if not values:
+        return "нет данных"
+    values = sorted(values)
+    p50 = values[len(values) // 2]
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+    return f"p50 {p50 / 1000:.0f} мкс, p99 {p99 / 1000:.0f} мкс, max {values[-1] / 1000:.0f} мкс"
+
+
+def start_broadcast_server(port, broadcast_ip='255.255.255.255', interval=1, quiet=False, report_interval=5.0):
     """
-    Запускает UDP сервер, который каждую секунду рассылает текущее время
-    всем клиентам в сети через широковещательную рассылку.
+    Запускает UDP сервер, который через равные промежутки рассылает маяк с номером
+    пакета и текущим временем всем клиентам в сети через широковещательную рассылку.
+
+    Моменты отправки считаются от старта (start + n * interval), а не от предыдущей
+    отправки, поэтому опоздания не накапливаются. Если сервер отстал больше чем на
+    интервал, пропущенные моменты не догоняются пачкой, а считаются пропущенными.
 
     Args:
         port (int): Порт для широковещательной рассылки
         broadcast_ip (str): IP-адрес для широковещательной рассылки
-        interval (float): Интервал между рассылками в секундах
+        interval (float): Интервал между рассылками в секундах, можно меньше миллисекунды
+        quiet (bool): Не печатать каждый пакет, только периодическую сводку
+        report_interval (float): Период сводки в секундах
     """
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
@@ -22,19 +52,53 @@ def start_broadcast_server(port, broadcast_ip='255.255.255.255', interval=1):
     print(f"[*] Интервал рассылки: {interval} секунд")
     print("[*] Для остановки сервера нажмите Ctrl+C")
 
+    interval_ns = max(1, int(interval * 1e9))
+    report_ns = int(report_interval * 1e9)
+    address = (broadcast_ip, port)
+
+    message_count = 0
+    missed = 0
+    errors = 0
+    lateness = []
+    window_count = 0
     try:
-        message_count = 0
+        start = time.monotonic_ns()
+        slot = 0
+        window_start = start
         while True:
-            current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-
-            message = f"SERVER_TIME: {current_time}"
-
-            server_socket.sendto(message.encode('utf-8'), (broadcast_ip, port))
-
+            deadline = start + slot * interval_ns
+            wait_until(deadline)
+
+            sent_at = time.monotonic_ns()
+            try:
+                server_socket.sendto(pack_beacon(message_count, time.time_ns()), address)
+            except OSError:
+                # Переполненный буфер отправки — это потерянный пакет, а не повод остановить рассылку
+                errors += 1
             message_count += 1
-            print(f"[+] Отправлено сообщение #{message_count}: {message}")
-
-            time.sleep(interval)
+            window_count += 1
+            lateness.append(sent_at - deadline)
+
+            if not quiet:
+                current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+                print(f"[+] Отправлено сообщение #{message_count}: {current_time}")
+
+            slot += 1
+            behind = (time.monotonic_ns() - start) // interval_ns - slot
+            if behind > 0:
+                missed += behind
+                slot += behind
+
+            # Окно закрывается в любом режиме, иначе lateness растёт без ограничений
+            if sent_at - window_start >= report_ns:
+                if quiet:
+                    elapsed = (sent_at - window_start) / 1e9
+                    print(f"[*] Отправлено: {message_count} ({window_count / elapsed:.0f} пакетов/с), "
+                          f"пропущено моментов: {missed}, ошибок отправки: {errors}, "
+                          f"опоздание: {lateness_summary(lateness)}")
+                lateness = []
+                window_start = sent_at
+                window_count = 0
 
     except KeyboardInterrupt:
         print("\n[!] Сервер остановлен пользователем")
@@ -42,6 +106,7 @@ def start_broadcast_server(port, broadcast_ip='255.255.255.255', interval=1):
         print(f"[!] Ошибка: {e}")
     finally:
         server_socket.close()
+        print(f"[*] Всего отправлено: {message_count}, пропущено моментов: {missed}, ошибок отправки: {errors}")
         print("[+] Сервер завершил работу")
 
 
@@ -53,11 +118,18 @@ def main():
                         help='IP-адрес для широковещательной рассылки (по умолчанию: 127.0.0.1)')
     parser.add_argument('--interval', '-i', type=float, default=1.0,
                         help='Интервал между рассылками в секундах (по умолчанию: 1.0)')
+    parser.add_argument('--rate', '-r', type=float,
+                        help='Пакетов в секунду; заменяет --interval')
+    parser.add_argument('--quiet', '-q', action='store_true',
+                        help='Не печатать каждый пакет, выводить периодическую сводку')
+    parser.add_argument('--report', type=float, default=5.0,
+                        help='Период сводки в тихом режиме, секунд (по умолчанию: 5)')
 
     args = parser.parse_args()
 
-    start_broadcast_server(args.port, args.broadcast, args.interval)
+    interval = 1 / args.rate if args.rate else args.interval
+    start_broadcast_server(args.port, args.broadcast, interval, args.quiet, args.report)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from ftplib import FTP
+
+from transfer import SessionPool, TransferEngine
+
+
+def start_stub(root, port, rate, latency):
+    stub = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ftp_stub.py'),
+                             '--root', root, '--port', str(port), '--rate', str(rate), '--latency', str(latency)],
+                            stdout=subprocess.DEVNULL)
+    for _ in range(50):
+        try:
+            FTP().connect('127.0.0.1', port)
+            return stub
+        except OSError:
+            time.sleep(0.1)
+    stub.terminate()
+    raise RuntimeError('FTP stand-in did not start')
+
+
+def baseline(port, pairs):
+    # What FTPClient did before: one session, default retrbinary block size, one file after another
+    ftp = FTP()
+    ftp.connect('127.0.0.1', port)
+    ftp.login('TestUser', '12345678')
+    for remote, local in pairs:
+        with open(local, 'wb') as f:
+            ftp.retrbinary('RETR ' + remote, f.write)
+    ftp.quit()
+
+
+def engine(port, pairs, connections, block_size):
+    pool = SessionPool('127.0.0.1', port, 'TestUser', '12345678', connections)
+    results = TransferEngine(pool, block_size).download_many(pairs)
+    pool.close()
+    for pair, error in results:
+        if error is not None:
+            raise error
+
+
+def measure(name, size, run):
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    print(f'{name}: {elapsed:.2f} s, {size / elapsed / 2 ** 20:.1f} MB/s')
+
+
+def main(size_mb, small, connections, block_kb, rate, latency, port):
+    root = tempfile.mkdtemp()
+    target = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(root, 'large.bin'), 'wb') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(2 ** 20))
+        for i in range(small):
+            with open(os.path.join(root, f'small{i}.txt'), 'wb') as f:
+                f.write(os.urandom(16 * 1024))
+
+        stub = start_stub(root, port, rate, latency)
+        try:
+            large = [('/large.bin', os.path.join(target, 'large.bin'))]
+            smalls = [(f'/small{i}.txt', os.path.join(target, f'small{i}.txt')) for i in range(small)]
+            print(f'Stand-in: {rate} MB/s per data connection, {latency} ms per reply')
+
+            measure(f'Large file {size_mb} MB, one connection', size_mb * 2 ** 20, lambda: baseline(port, large))
+            measure(f'Large file {size_mb} MB, {connections} segments', size_mb * 2 ** 20,
+                    lambda: engine(port, large, connections, block_kb * 1024))
+            with open(os.path.join(target, 'large.bin'), 'rb') as a, open(os.path.join(root, 'large.bin'), 'rb') as b:
+                assert a.read() == b.read(), 'segmented download is corrupted'
+
+            measure(f'{small} small files, one connection', small * 16 * 1024, lambda: baseline(port, smalls))
+            measure(f'{small} small files, {connections} sessions', small * 16 * 1024,
+                    lambda: engine(port, smalls, connections, block_kb * 1024))
+        finally:
+            stub.terminate()
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(target)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='FTP transfer engine throughput against a local FTP stand-in')
+    parser.add_argument('--size', type=int, default=64, help='Large file size, MB')
+    parser.add_argument('--small', type=int, default=200, help='Number of 16 KB files')
+    parser.add_argument('--connections', type=int, default=4, help='Parallel sessions')
+    parser.add_argument('--block-size', type=int, default=256, help='Block size, KB')
+    parser.add_argument('--rate', type=float, default=20, help='Stand-in limit per data connection, MB/s')
+    parser.add_argument('--latency', type=float, default=5, help='Stand-in delay per reply, ms')
+    parser.add_argument('--port', type=int, default=2121, help='Stand-in port')
+
+    args = parser.parse_args()
+
+    main(args.size, args.small, args.connections, args.block_size, args.rate, args.latency, args.port)
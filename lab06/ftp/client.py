@@ -1,21 +1,32 @@
 import argparse
+import posixpath
+import sys
+import time
 from ftplib import FTP
 
+from sync import mirror, print_summary, push
+from transfer import DEFAULT_BLOCK_SIZE, Progress, RetryPolicy, SessionPool, TransferEngine, format_progress
+
 class FTPClient:
 
-    def __init__(self, host, port, username, password):
+    def __init__(self, host, port, username, password, connections=4, block_size=DEFAULT_BLOCK_SIZE, retries=5):
         self.ftp = FTP()
         self.host = host
         self.port = port
         self.username = username
         self.password = password
+        self.cwd = '/'
+        self.pool = SessionPool(host, port, username, password, connections)
+        self.engine = TransferEngine(self.pool, block_size, retry=RetryPolicy(retries))
 
     def connect(self):
         self.ftp.connect(self.host, self.port)
         self.ftp.login(self.username, self.password)
+        self.cwd = self.ftp.pwd()
 
     def go_to_folder(self, folder):
         self.ftp.cwd(folder)
+        self.cwd = self.ftp.pwd()
 
     def create_folder(self, folder):
         self.ftp.mkd(folder)
@@ -32,36 +43,69 @@ class FTPClient:
         return files
 
     def download_file(self, file):
-        with open(file, 'wb') as f:
-            self.ftp.retrbinary('RETR ' + file, f.write)
+        self.engine.download(posixpath.join(self.cwd, file), file)
 
     def upload_file(self, file):
-        with open(file, 'rb') as f:
-            self.ftp.storbinary('STOR ' + file, f)
+        self.engine.upload(file, posixpath.join(self.cwd, file))
+
+    def download_files(self, files, progress=None):
+        self.engine.progress = Progress(progress)
+        return self.engine.download_many([(posixpath.join(self.cwd, file), file) for file in files])
+
+    def upload_files(self, files, progress=None):
+        self.engine.progress = Progress(progress)
+        return self.engine.upload_many([(file, posixpath.join(self.cwd, file)) for file in files])
+
+    def mirror(self, remote, local, progress=None, full=False, delete=False):
+        self.engine.progress = Progress(progress)
+        return mirror(self.engine, posixpath.join(self.cwd, remote), local, full, delete)
+
+    def push(self, local, remote, progress=None):
+        self.engine.progress = Progress(progress)
+        return push(self.engine, local, posixpath.join(self.cwd, remote))
 
     def quit(self):
+        self.pool.close()
         self.ftp.quit()
 
+def show_progress(progress):
+    sys.stdout.write('\r' + format_progress(progress) + ' ' * 8)
+    sys.stdout.flush()
+
+def report_transfers(files, results, done):
+    print()
+    for file, (_, error) in zip(files, results):
+        if error is None:
+            print(f'File {file} {done} successfully')
+        else:
+            print(f'File {file} failed: {error}')
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--host', type=str, help='FTP host', default='127.0.0.1')
     parser.add_argument('--port', type=int, help='FTP port', default=21)
     parser.add_argument('--username', type=str, help='FTP username', default='TestUser')
     parser.add_argument('--password', type=str, help='FTP password', default='12345678')
+    parser.add_argument('--connections', type=int, help='Parallel FTP sessions for transfers', default=4)
+    parser.add_argument('--block-size', type=int, help='Transfer block size, KB', default=DEFAULT_BLOCK_SIZE // 1024)
+    parser.add_argument('--retries', type=int, help='Attempts per file before giving up', default=5)
 
     args = parser.parse_args()
-    client = FTPClient(args.host, args.port, args.username, args.password)
+    client = FTPClient(args.host, args.port, args.username, args.password, args.connections, args.block_size * 1024,
+                       args.retries)
     client.connect()
 
     print('Available actions:')
     print('exit')
     print('ls')
-    print('get <filename>')
-    print('send <filename>')
+    print('get <filename> [<filename> ...]')
+    print('send <filename> [<filename> ...]')
     print('rm <filename>')
     print('cd <foldername>')
     print('rmd <foldername>')
     print('mkdir <foldername>')
+    print('mirror <remote folder> <local folder> [--full]')
+    print('push <local folder> <remote folder>')
 
     while True:
         action = input('> ').split()
@@ -72,7 +116,7 @@ def main():
 
         if len(action) > 1:
             args = action[1:]
-            if len(args) > 1:
+            if len(args) > 1 and cmd not in ('get', 'send', 'mirror', 'push'):
                 print(args)
                 print('Unknown command')
                 continue
@@ -82,19 +126,29 @@ def main():
         elif cmd == 'ls':
             print(*client.list_files(), end='\n')
         elif cmd == 'get':
-            if not arg:
+            if not args:
                 print('Unknown command')
                 continue
-            file = arg
-            client.download_file(file)
-            print(f'File {file} downloaded successfully')
+            report_transfers(args, client.download_files(args, show_progress), 'downloaded')
         elif cmd == 'send':
-            if not arg:
+            if not args:
                 print('Unknown command')
                 continue
-            file = arg
-            client.upload_file(file)
-            print(f'File {file} uploaded successfully')
+            report_transfers(args, client.upload_files(args, show_progress), 'uploaded')
+        elif cmd in ('mirror', 'push'):
+            # mirror --full lists every directory: picks up files rewritten in place before the index expires
+            full = cmd == 'mirror' and args is not None and args[-1] == '--full'
+            if full:
+                args = args[:-1]
+            if not args or len(args) != 2:
+                print('Unknown command')
+                continue
+            start = time.monotonic()
+            if full:
+                summary = client.mirror(args[0], args[1], show_progress, full=True)
+            else:
+                summary = getattr(client, cmd)(args[0], args[1], show_progress)
+            print_summary(summary, time.monotonic() - start)
         elif cmd == 'rm':
             if not arg:
                 print('Unknown command')
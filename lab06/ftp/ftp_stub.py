@@ -0,0 +1,363 @@
+import argparse
+import hashlib
+import os
+import posixpath
+import random
+import socket
+import socketserver
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+# Local FTP stand-in for benchmarks: serves a directory, one thread per session.
+# --rate limits every data connection (like a long fat link where one TCP stream
+# cannot fill the pipe), --latency delays every control reply (round trip time),
+# --fail-rate breaks that share of transfers midway (a flaky link).
+
+
+class Throttle:
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.start = time.monotonic()
+        self.sent = 0
+
+    def wait(self, size):
+        if not self.rate:
+            return
+        self.sent += size
+        delay = self.sent / self.rate - (time.monotonic() - self.start)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FTPHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        # Replies are small and follow each other (150, then 226): without this Nagle holds the second
+        # one until the client's delayed ACK for the first, ~40 ms per transfer
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.cwd = '/'
+        self.rest = 0
+        self.hash = 'SHA-256'
+        self.passive = None
+
+    def reply(self, text):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write((text + '\r\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def handle(self):
+        self.reply('220 FTP stand-in ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            line = line.decode('utf-8', errors='replace').rstrip('\r\n')
+            cmd, _, arg = line.partition(' ')
+            handler = getattr(self, 'ftp_' + cmd.upper(), None)
+            if handler is None:
+                self.reply('502 Command not implemented')
+                continue
+            try:
+                if handler(arg) is False:
+                    break
+            except FileNotFoundError:
+                self.reply('550 No such file or directory')
+            except OSError as e:
+                self.reply(f'550 {e.strerror or e}')
+        if self.passive:
+            self.passive.close()
+
+    def virtual(self, path):
+        return posixpath.normpath(posixpath.join(self.cwd, path or '.'))
+
+    def real(self, path):
+        return os.path.join(self.server.root, self.virtual(path).lstrip('/'))
+
+    def ftp_USER(self, arg):
+        self.reply('331 Password required')
+
+    def ftp_PASS(self, arg):
+        self.reply('230 Logged in')
+
+    def ftp_SYST(self, arg):
+        self.reply('215 UNIX Type: L8')
+
+    def ftp_FEAT(self, arg):
+        self.wfile.write(b'211-Features:\r\n SIZE\r\n MDTM\r\n REST STREAM\r\n EPSV\r\n')
+        if self.server.mlsd:
+            self.wfile.write(b' MLST type*;size*;modify*;\r\n')
+        if self.server.hashes:
+            self.wfile.write(b' HASH SHA-256*;SHA-1;MD5;CRC32\r\n XCRC\r\n')
+        self.reply('211 End')
+
+    def ftp_OPTS(self, arg):
+        option, _, value = arg.partition(' ')
+        if option.upper() == 'HASH' and value:
+            if value.upper() not in ('SHA-256', 'SHA-1', 'MD5', 'CRC32'):
+                self.reply('501 Unknown algorithm')
+                return
+            self.hash = value.upper()
+        self.reply('200 OK')
+
+    def checksum(self, path, algorithm):
+        crc = 0
+        digest = None if algorithm == 'CRC32' else hashlib.new(algorithm.replace('-', '').lower())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                if digest is None:
+                    crc = zlib.crc32(chunk, crc)
+                else:
+                    digest.update(chunk)
+        return f'{crc:08X}' if digest is None else digest.hexdigest()
+
+    def ftp_HASH(self, arg):
+        if not self.server.hashes:
+            self.reply('502 Command not implemented')
+            return
+        path = self.real(arg)
+        size = os.path.getsize(path)
+        self.reply(f'213 {self.hash} 0-{size} {self.checksum(path, self.hash)} {arg}')
+
+    def ftp_XCRC(self, arg):
+        if not self.server.hashes:
+            self.reply('502 Command not implemented')
+            return
+        self.reply(f'250 {self.checksum(self.real(arg), "CRC32")}')
+
+    def ftp_TYPE(self, arg):
+        self.reply('200 Type set')
+
+    def ftp_NOOP(self, arg):
+        self.reply('200 OK')
+
+    def ftp_QUIT(self, arg):
+        self.reply('221 Bye')
+        return False
+
+    def ftp_PWD(self, arg):
+        self.reply(f'257 "{self.cwd}" is the current directory')
+
+    def ftp_CWD(self, arg):
+        if not os.path.isdir(self.real(arg)):
+            self.reply('550 Not a directory')
+            return
+        self.cwd = self.virtual(arg)
+        self.reply('250 OK')
+
+    def ftp_CDUP(self, arg):
+        self.ftp_CWD('..')
+
+    def ftp_MKD(self, arg):
+        os.mkdir(self.real(arg))
+        self.reply(f'257 "{self.virtual(arg)}" created')
+
+    def ftp_RMD(self, arg):
+        os.rmdir(self.real(arg))
+        self.reply('250 Removed')
+
+    def ftp_DELE(self, arg):
+        os.remove(self.real(arg))
+        self.reply('250 Deleted')
+
+    def ftp_SIZE(self, arg):
+        self.reply(f'213 {os.path.getsize(self.real(arg))}')
+
+    def ftp_MDTM(self, arg):
+        mtime = datetime.fromtimestamp(os.path.getmtime(self.real(arg)), timezone.utc)
+        self.reply(f'213 {mtime:%Y%m%d%H%M%S}')
+
+    def ftp_REST(self, arg):
+        self.rest = int(arg)
+        self.reply(f'350 Restarting at {self.rest}')
+
+    def open_passive(self):
+        if self.passive:
+            self.passive.close()
+        self.passive = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.passive.bind((self.request.getsockname()[0], 0))
+        self.passive.listen(1)
+        return self.passive.getsockname()
+
+    def ftp_PASV(self, arg):
+        host, port = self.open_passive()
+        self.reply(f"227 Entering Passive Mode ({host.replace('.', ',')},{port >> 8},{port & 255})")
+
+    def ftp_EPSV(self, arg):
+        _, port = self.open_passive()
+        self.reply(f'229 Entering Extended Passive Mode (|||{port}|)')
+
+    def data_connection(self):
+        if not self.passive:
+            self.reply('425 Use PASV first')
+            return None
+        self.reply('150 Opening data connection')
+        conn, _ = self.passive.accept()
+        self.passive.close()
+        self.passive = None
+        return conn
+
+    def ftp_RETR(self, arg):
+        rest, self.rest = self.rest, 0
+        with open(self.real(arg), 'rb') as f:
+            f.seek(rest)
+            conn = self.data_connection()
+            if conn is None:
+                return
+            throttle = Throttle(self.server.rate)
+            limit = self.failure_point()
+            try:
+                while True:
+                    chunk = f.read(self.server.chunk_size)
+                    if not chunk:
+                        break
+                    if limit is not None:
+                        if limit <= 0:
+                            raise ConnectionAbortedError
+                        chunk = chunk[:limit]
+                        limit -= len(chunk)
+                    throttle.wait(len(chunk))
+                    conn.sendall(chunk)
+            except OSError:
+                conn.close()
+                self.reply('426 Transfer aborted')
+                return
+            conn.close()
+        self.reply('226 Transfer complete')
+
+    def receive(self, path, mode, offset=0):
+        with open(path, mode) as f:
+            if offset:
+                f.seek(offset)
+            conn = self.data_connection()
+            if conn is None:
+                return
+            throttle = Throttle(self.server.rate)
+            limit = self.failure_point()
+            while True:
+                chunk = conn.recv(self.server.chunk_size)
+                if not chunk:
+                    break
+                if limit is not None:
+                    chunk = chunk[:limit]
+                    limit -= len(chunk)
+                throttle.wait(len(chunk))
+                f.write(chunk)
+                if limit is not None and limit <= 0:
+                    # Keep what arrived, like a real server whose client vanished
+                    conn.close()
+                    self.reply('426 Transfer aborted')
+                    return
+            conn.close()
+        self.reply('226 Transfer complete')
+
+    def failure_point(self):
+        # Bytes to pass before breaking this transfer, None if it is not going to break
+        if self.server.fail_rate and random.random() < self.server.fail_rate:
+            return random.randrange(self.server.fail_after)
+        return None
+
+    def ftp_STOR(self, arg):
+        rest, self.rest = self.rest, 0
+        path = self.real(arg)
+        if rest:
+            if rest > os.path.getsize(path):
+                self.reply('554 Invalid REST position')
+                return
+            self.receive(path, 'r+b', rest)
+        else:
+            self.receive(path, 'wb')
+
+    def ftp_APPE(self, arg):
+        self.receive(self.real(arg), 'ab')
+
+    def ftp_LIST(self, arg):
+        path = self.real(arg if arg and not arg.startswith('-') else '')
+        lines = []
+        for name in sorted(os.listdir(path)):
+            stat = os.stat(os.path.join(path, name))
+            kind = 'd' if os.path.isdir(os.path.join(path, name)) else '-'
+            mtime = datetime.fromtimestamp(stat.st_mtime)
+            lines.append(f'{kind}rw-r--r-- 1 owner group {stat.st_size:>12} {mtime:%b %d %H:%M} {name}')
+        self.send_listing(lines)
+
+    @staticmethod
+    def facts(path, name):
+        stat = os.stat(path)
+        kind = 'dir' if os.path.isdir(path) else 'file'
+        modify = datetime.fromtimestamp(stat.st_mtime, timezone.utc).strftime('%Y%m%d%H%M%S.%f')[:-3]
+        return f'type={kind};size={stat.st_size};modify={modify}; {name}'
+
+    def ftp_MLSD(self, arg):
+        if not self.server.mlsd:
+            self.reply('502 Command not implemented')
+            return
+        path = self.real(arg)
+        self.send_listing([self.facts(os.path.join(path, name), name) for name in sorted(os.listdir(path))])
+
+    def ftp_MLST(self, arg):
+        if not self.server.mlsd:
+            self.reply('502 Command not implemented')
+            return
+        facts = self.facts(self.real(arg), self.virtual(arg))
+        self.wfile.write(f'250-Listing {self.virtual(arg)}\r\n {facts}\r\n'.encode('utf-8'))
+        self.reply('250 End')
+
+    def ftp_NLST(self, arg):
+        self.send_listing(sorted(os.listdir(self.real(arg))))
+
+    def send_listing(self, lines):
+        conn = self.data_connection()
+        if conn is None:
+            return
+        conn.sendall(''.join(line + '\r\n' for line in lines).encode('utf-8'))
+        conn.close()
+        self.reply('226 Transfer complete')
+
+
+class FTPStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, root, rate=0, latency=0, chunk_size=64 * 1024, mlsd=True, hashes=True,
+                 fail_rate=0, fail_after=4 * 2 ** 20):
+        super().__init__(address, FTPHandler)
+        self.root = os.path.abspath(root)
+        self.rate = rate
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.mlsd = mlsd
+        self.hashes = hashes
+        self.fail_rate = fail_rate
+        self.fail_after = fail_after
+
+
+def start_stub(root, rate=0, latency=0, port=0, mlsd=True, hashes=True, fail_rate=0):
+    stub = FTPStub(('127.0.0.1', port), root, rate, latency, mlsd=mlsd, hashes=hashes, fail_rate=fail_rate)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    return stub, stub.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local FTP stand-in for benchmarks')
+    parser.add_argument('--root', default='.', help='Directory to serve')
+    parser.add_argument('--port', type=int, default=2121, help='Control port')
+    parser.add_argument('--rate', type=float, default=0, help='Per data connection limit, MB/s (0 - unlimited)')
+    parser.add_argument('--latency', type=float, default=0, help='Delay before every reply, ms')
+    parser.add_argument('--no-mlsd', action='store_true', help='Answer MLSD/MLST as unsupported (LIST only)')
+    parser.add_argument('--no-hash', action='store_true', help='Answer HASH/XCRC as unsupported')
+    parser.add_argument('--fail-rate', type=float, default=0, help='Share of transfers broken midway')
+
+    args = parser.parse_args()
+    stub = FTPStub(('127.0.0.1', args.port), args.root, args.rate * 2 ** 20, args.latency / 1000,
+                   mlsd=not args.no_mlsd, hashes=not args.no_hash, fail_rate=args.fail_rate)
+    print(f'Serving {stub.root} on 127.0.0.1:{args.port}')
+    stub.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,50 +1,212 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, simpledialog
+import codecs
 import os
-from ftplib import FTP
+import posixpath
+import queue
+import shutil
 import tempfile
-from ftplib import FTP
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ftplib import error_perm, error_temp
+
+from transfer import Progress, SessionPool, TransferEngine, format_progress
+
+# Rows added to the file list at a time: the rest is inserted when the list is scrolled near its end
+LIST_PAGE = 500
+# Bytes of a retrieved file shown at a time: the rest is read when the content is scrolled near its end
+CONTENT_PAGE = 64 * 1024
+# The editor holds the whole file in a Text widget
+EDIT_LIMIT = 4 * 2 ** 20
+# Seconds a directory listing is shown from the cache instead of asking the server again
+LISTING_TTL = 30
+# Child directories of the shown one listed ahead of time, and the sessions spent on it
+PREFETCH_LIMIT = 16
+PREFETCH_WORKERS = 2
+# Idle sessions send NOOP after this many seconds so that the server does not drop them
+KEEPALIVE_INTERVAL = 60
+
+def parse_listing(lines):
+    file_data = []
+
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 9:
+            continue
+
+        permissions = parts[0]
+        size = parts[4]
+        date = ' '.join(parts[5:8])
+        name = ' '.join(parts[8:])
+
+        is_dir = permissions.startswith('d')
+        file_type = "Directory" if is_dir else "File"
+
+        file_data.append((name, file_type, size, date))
+
+    directories = [f for f in file_data if f[1] == "Directory"]
+    files = [f for f in file_data if f[1] == "File"]
+    return sorted(directories) + sorted(files)
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+class ListingCache:
+
+    def __init__(self, ttl=LISTING_TTL):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, folder):
+        with self.lock:
+            entry = self.entries.get(posixpath.normpath(folder))
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1], entry[2]
+
+    def put(self, requested, folder, rows):
+        entry = (time.monotonic(), folder, rows)
+        with self.lock:
+            self.entries[posixpath.normpath(requested)] = entry
+            self.entries[posixpath.normpath(folder)] = entry
+
+    def invalidate(self, folder):
+        folder = posixpath.normpath(folder)
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if folder in (key, entry[1])]:
+                del self.entries[key]
 
 class FTPClient:
+    # Every call takes a session from the pool and absolute paths, so calls from several worker
+    # threads never share a control connection
 
-    def __init__(self, host, port, username, password):
-        self.ftp = FTP()
+    def __init__(self, host, port, username, password, connections=4):
         self.host = host
         self.port = port
         self.username = username
         self.password = password
+        self.pool = SessionPool(host, port, username, password, connections)
+        self.pool.keepalive(KEEPALIVE_INTERVAL)
+        self.cache = ListingCache()
+        self.prefetcher = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+        self.prefetches = []
+
+    def call(self, action):
+        # A session the server has dropped anyway fails on its first use and is discarded by the pool:
+        # the call moves on to the next idle session, at worst to a new one
+        for attempt in range(self.pool.size + 1):
+            try:
+                with self.pool.session() as ftp:
+                    return action(ftp)
+            except (EOFError, OSError, error_temp):
+                if attempt == self.pool.size:
+                    raise
 
     def connect(self):
-        self.ftp.connect(self.host, self.port)
-        self.ftp.login(self.username, self.password)
-
-    def go_to_folder(self, folder):
-        self.ftp.cwd(folder)
+        return self.call(lambda ftp: ftp.pwd())
+
+    def list_files(self, folder):
+        def listing(ftp):
+            files = []
+            ftp.cwd(folder)
+            path = ftp.pwd()
+            ftp.dir(files.append)
+            return path, files
+
+        path, files = self.call(listing)
+        rows = parse_listing(files)
+        self.cache.put(folder, path, rows)
+        return path, rows
+
+    def cached_files(self, folder):
+        return self.cache.get(folder)
+
+    def prefetch(self, folder, rows):
+        # Child directories are listed in the background, so opening one is served from the cache;
+        # whatever is still queued for the previously shown directory is dropped
+        for future in self.prefetches:
+            future.cancel()
+        folders = [posixpath.join(folder, row[0]) for row in rows if row[1] == "Directory"][:PREFETCH_LIMIT]
+        self.prefetches = [self.prefetcher.submit(self.prefetch_folder, path) for path in folders
+                           if self.cache.get(path) is None]
+
+    def prefetch_folder(self, folder):
+        try:
+            self.list_files(folder)
+        except Exception:
+            pass
 
     def create_folder(self, folder):
-        self.ftp.mkd(folder)
+        self.call(lambda ftp: ftp.mkd(folder))
+        self.cache.invalidate(posixpath.dirname(folder))
 
     def delete_file(self, file):
-        self.ftp.delete(file)
+        self.call(lambda ftp: ftp.delete(file))
+        self.cache.invalidate(posixpath.dirname(file))
 
     def delete_folder(self, folder):
-        self.ftp.rmd(folder)
+        self.call(lambda ftp: ftp.rmd(folder))
+        self.cache.invalidate(folder)
+        self.cache.invalidate(posixpath.dirname(folder))
 
-    def list_files(self):
-        files = []
-        self.ftp.dir(files.append)
-        return files
+    def file_size(self, file):
+        return self.call(lambda ftp: ftp.size(file))
 
-    def download_file(self, filename,  file):
-        with open(file, 'wb') as f:
-            self.ftp.retrbinary('RETR ' + filename, f.write)
+    def download_file(self, filename, file, progress=None, size=None):
+        return TransferEngine(self.pool, progress=Progress(progress)).download(filename, file, size)
 
-    def upload_file(self, filename, file):
-        with open(file, 'rb') as f:
-            self.ftp.storbinary('STOR ' + filename, f)
+    def upload_file(self, filename, file, progress=None):
+        size = TransferEngine(self.pool, progress=Progress(progress)).upload(file, filename)
+        self.cache.invalidate(posixpath.dirname(filename))
+        return size
 
     def quit(self):
-        self.ftp.quit()
+        self.prefetcher.shutdown(wait=False, cancel_futures=True)
+        self.pool.close()
+
+class TaskRunner:
+    # Tk widgets may only be touched from the main thread: workers hand their results back
+    # through a queue that the Tk loop drains every few milliseconds
+
+    def __init__(self, root, workers=4, interval=50):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.events = queue.Queue()
+        self.interval = interval
+        self.root.after(self.interval, self.poll)
+
+    def submit(self, work, on_done=None, on_error=None):
+        def run():
+            try:
+                result = work()
+            except Exception as e:
+                self.post(on_error, e)
+            else:
+                self.post(on_done, result)
+        self.executor.submit(run)
+
+    def post(self, callback, *args):
+        if callback is not None:
+            self.events.put((callback, args))
+
+    def poll(self):
+        try:
+            while True:
+                try:
+                    callback, args = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                callback(*args)
+        finally:
+            self.root.after(self.interval, self.poll)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 class FTPClientGUI:
     def __init__(self, root):
@@ -54,6 +216,16 @@ class FTPClientGUI:
         self.client = None
         self.current_path = "/"
         self.temp_dir = tempfile.mkdtemp()
+        self.tasks = TaskRunner(root)
+        self.listing = 0
+        self.retrieval = 0
+        self.rows = []
+        self.rows_shown = 0
+        self.back_history = []
+        self.forward_history = []
+        self.content_file = None
+        self.content_path = None
+        self.content_decoder = None
         self.create_connection_frame()
         self.create_file_list_frame()
         self.create_operations_frame()
@@ -108,6 +280,12 @@ class FTPClientGUI:
         self.up_button = ttk.Button(path_frame, text="Up", command=self.go_up, state="disabled")
         self.up_button.pack(side="left", padx=5)
 
+        self.back_button = ttk.Button(path_frame, text="Back", command=self.go_back, state="disabled")
+        self.back_button.pack(side="left", padx=5)
+
+        self.forward_button = ttk.Button(path_frame, text="Forward", command=self.go_forward, state="disabled")
+        self.forward_button.pack(side="left", padx=5)
+
         list_frame = ttk.Frame(frame)
         list_frame.pack(fill="both", expand=True, padx=5, pady=5)
 
@@ -122,9 +300,9 @@ class FTPClientGUI:
         self.file_list.column("size", width=100)
         self.file_list.column("date", width=150)
         self.file_list.pack(side="left", fill="both", expand=True)
-        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.file_list.yview)
-        scrollbar.pack(side="right", fill="y")
-        self.file_list.configure(yscrollcommand=scrollbar.set)
+        self.list_scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.file_list.yview)
+        self.list_scrollbar.pack(side="right", fill="y")
+        self.file_list.configure(yscrollcommand=self.on_list_scroll)
         self.file_list.bind("<Double-1>", self.on_file_double_click)
 
     def create_operations_frame(self):
@@ -162,13 +340,46 @@ class FTPClientGUI:
 
         self.content_text = scrolledtext.ScrolledText(frame, wrap=tk.WORD)
         self.content_text.pack(fill="both", expand=True, padx=5, pady=5)
+        self.content_text.configure(yscrollcommand=self.on_content_scroll)
 
     def create_status_bar(self):
         self.status_var = tk.StringVar()
         self.status_var.set("Not connected")
 
-        status_bar = ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
-        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        frame = ttk.Frame(self.root)
+        frame.pack(side=tk.BOTTOM, fill=tk.X)
+
+        status_bar = ttk.Label(frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.progress_bar = ttk.Progressbar(frame, length=200, maximum=100)
+        self.progress_bar.pack(side=tk.RIGHT, padx=5)
+
+    def run_task(self, work, on_done=None, failure="Operation failed", on_error=None):
+        # Results of a session that has been disconnected meanwhile are dropped
+        client = self.client
+
+        def done(result):
+            if self.client is client and on_done:
+                on_done(result)
+
+        def error(e):
+            if self.client is not client:
+                return
+            if on_error:
+                on_error(e)
+                return
+            messagebox.showerror("Error", f"{failure}: {str(e)}")
+            self.status_var.set(failure)
+
+        self.tasks.submit(work, done, error)
+
+    def transfer_progress(self, label):
+        return lambda progress: self.tasks.post(self.show_progress, label, progress)
+
+    def show_progress(self, label, progress):
+        self.progress_bar["value"] = progress.done / progress.total * 100 if progress.total else 100
+        self.status_var.set(f"{label}: {format_progress(progress)}")
 
     def connect_to_server(self):
         server = self.server_entry.get()
@@ -181,37 +392,36 @@ class FTPClientGUI:
         username = self.username_entry.get()
         password = self.password_entry.get()
 
-        try:
-            self.status_var.set("Connecting...")
-            self.root.update_idletasks()
-
-            self.client = FTPClient(server, port, username, password)
-            self.client.connect()
+        self.status_var.set("Connecting...")
+        self.back_history.clear()
+        self.forward_history.clear()
+        self.connect_button.config(state="disabled")
+        self.client = FTPClient(server, port, username, password)
 
+        def connected(path):
             self.enable_controls(True)
             self.status_var.set(f"Connected to {server}:{port}")
+            self.list_folder(path, record=False)
 
-            self.current_path = "/"
-            self.path_var.set(self.current_path)
-            self.refresh_files()
-
-        except Exception as e:
+        def failed(e):
             messagebox.showerror("Connection Error", str(e))
             self.status_var.set("Connection failed")
+            self.connect_button.config(state="normal")
+            self.client.quit()
             self.client = None
 
+        self.run_task(self.client.connect, connected, on_error=failed)
+
     def disconnect(self):
         if self.client:
-            try:
-                self.client.quit()
-            except:
-                pass
-            finally:
-                self.client = None
+            client, self.client = self.client, None
+            self.tasks.submit(client.quit)
 
         self.enable_controls(False)
         self.clear_file_list()
+        self.close_content()
         self.content_text.delete(1.0, tk.END)
+        self.progress_bar["value"] = 0
         self.status_var.set("Disconnected")
 
     def enable_controls(self, enable):
@@ -219,6 +429,8 @@ class FTPClientGUI:
         self.disconnect_button.config(state=state)
         self.go_button.config(state=state)
         self.up_button.config(state=state)
+        self.back_button.config(state=state)
+        self.forward_button.config(state=state)
         self.create_button.config(state=state)
         self.retrieve_button.config(state=state)
         self.update_button.config(state=state)
@@ -230,81 +442,100 @@ class FTPClientGUI:
         self.connect_button.config(state="disabled" if enable else "normal")
 
     def clear_file_list(self):
-        for item in self.file_list.get_children():
-            self.file_list.delete(item)
-
-    def refresh_files(self):
-        if not self.client:
-            return
+        self.file_list.delete(*self.file_list.get_children())
+        self.rows = []
+        self.rows_shown = 0
 
+    def show_rows(self, rows):
         self.clear_file_list()
-        self.status_var.set(f"Listing files in {self.current_path}")
-        self.root.update_idletasks()
-
-        try:
-            file_lines = self.client.list_files()
-            file_data = []
-
-            for line in file_lines:
-                parts = line.split()
-                if len(parts) < 9:
-                    continue
-
-                permissions = parts[0]
-                size = parts[4]
-                date = ' '.join(parts[5:8])
-                name = ' '.join(parts[8:])
-
-                is_dir = permissions.startswith('d')
-                file_type = "Directory" if is_dir else "File"
+        self.rows = rows
+        self.insert_rows()
+
+    def insert_rows(self):
+        end = min(self.rows_shown + LIST_PAGE, len(self.rows))
+        for row in self.rows[self.rows_shown:end]:
+            self.file_list.insert("", "end", values=row)
+        self.rows_shown = end
+
+    def on_list_scroll(self, first, last):
+        self.list_scrollbar.set(first, last)
+        if self.rows_shown < len(self.rows) and float(last) > 0.9:
+            self.root.after_idle(self.insert_rows)
+
+    def list_folder(self, path, on_error=None, fresh=False, record=True):
+        # Only the latest listing is shown: a slow one that finishes after a newer request is dropped
+        self.listing += 1
+        listing = self.listing
+        client = self.client
+
+        cached = None if fresh else client.cached_files(path)
+        if cached:
+            self.show_listing(*cached, record)
+            return
 
-                file_data.append((name, file_type, size, date))
+        self.status_var.set(f"Listing files in {path}")
 
-            directories = [f for f in file_data if f[1] == "Directory"]
-            files = [f for f in file_data if f[1] == "File"]
+        def done(result):
+            if listing == self.listing:
+                self.show_listing(*result, record)
 
-            for name, file_type, size, date in sorted(directories) + sorted(files):
-                self.file_list.insert("", "end", values=(name, file_type, size, date))
+        def failed(e):
+            if listing != self.listing:
+                return
+            if on_error:
+                on_error(e)
+            else:
+                messagebox.showerror("Error", f"Failed to list files: {str(e)}")
+                self.status_var.set("Failed to list files")
+
+        self.run_task(lambda: client.list_files(path), done, on_error=failed)
+
+    def show_listing(self, folder, rows, record):
+        if record and folder != self.current_path:
+            self.back_history.append(self.current_path)
+            self.forward_history.clear()
+        self.current_path = folder
+        self.path_var.set(folder)
+        self.show_rows(rows)
+        self.status_var.set(f"Found {len(rows)} items in {folder}")
+        self.client.prefetch(folder, rows)
+
+    def navigation_failed(self, e):
+        messagebox.showerror("Navigation Error", str(e))
+        self.path_var.set(self.current_path)
+        self.status_var.set("Navigation failed")
 
-            self.status_var.set(f"Found {len(file_data)} items in {self.current_path}")
+    def refresh_files(self):
+        if not self.client:
+            return
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to list files: {str(e)}")
-            self.status_var.set("Failed to list files")
+        self.list_folder(self.current_path, fresh=True, record=False)
 
     def navigate_to_path(self):
         if not self.client:
             return
 
-        path = self.path_var.get()
-
-        try:
-            self.client.go_to_folder(path)
-            self.current_path = path
-            self.refresh_files()
-        except Exception as e:
-            messagebox.showerror("Navigation Error", str(e))
-            self.path_var.set(self.current_path)
+        self.list_folder(self.path_var.get(), self.navigation_failed)
 
     def go_up(self):
         if not self.client or self.current_path == "/":
             return
 
-        path_parts = self.current_path.split("/")
-        if len(path_parts) <= 2:
-            new_path = "/"
-        else:
-            new_path = "/".join(path_parts[:-1])
-            if not new_path:
-                new_path = "/"
+        self.list_folder(posixpath.dirname(self.current_path.rstrip("/")) or "/", self.navigation_failed)
 
-        try:
-            self.client.go_to_folder(new_path)
-            self.current_path = new_path
-            self.path_var.set(new_path)
-            self.refresh_files()
-        except Exception as e:
-            messagebox.showerror("Navigation Error", str(e))
+    def go_back(self):
+        if not self.client or not self.back_history:
+            return
+
+        self.forward_history.append(self.current_path)
+        self.list_folder(self.back_history.pop(), self.navigation_failed, record=False)
+
+    def go_forward(self):
+        if not self.client or not self.forward_history:
+            return
+
+        self.back_history.append(self.current_path)
+        self.list_folder(self.forward_history.pop(), self.navigation_failed, record=False)
 
     def on_file_double_click(self, event):
         if not self.client:
@@ -321,64 +552,55 @@ class FTPClientGUI:
         name, file_type = values[0], values[1]
 
         if file_type == "Directory":
-            new_path = self.current_path
-            if new_path.endswith("/"):
-                new_path += name
-            else:
-                new_path += "/" + name
-
-            try:
-                self.client.go_to_folder(new_path)
-                self.current_path = new_path
-                self.path_var.set(new_path)
-                self.refresh_files()
-            except Exception as e:
-                messagebox.showerror("Navigation Error", str(e))
+            self.list_folder(posixpath.join(self.current_path, name), self.navigation_failed)
         else:
             self.file_entry.delete(0, tk.END)
             self.file_entry.insert(0, name)
             self.retrieve_file()
 
-    def create_file(self):
-        if not self.client:
-            return
-
-        filename = self.file_entry.get()
-        if not filename:
-            messagebox.showerror("Error", "Please enter a file name")
-            return
-
+    def open_editor(self, title, filename, content, done):
         editor = tk.Toplevel(self.root)
-        editor.title(f"Create File: {filename}")
+        editor.title(f"{title}: {filename}")
         editor.geometry("600x400")
 
+        buttons_frame = ttk.Frame(editor)
+        buttons_frame.pack(fill="x", side="bottom", padx=10, pady=5)
+
         editor_text = scrolledtext.ScrolledText(editor, wrap=tk.WORD)
         editor_text.pack(fill="both", expand=True, padx=10, pady=10)
 
+        if content:
+            editor_text.insert(1.0, content)
+
+        client = self.client
+        remote = posixpath.join(self.current_path, filename)
+
         def save_file():
             content = editor_text.get(1.0, tk.END)
-            try:
-                temp_file = os.path.join(self.temp_dir, filename)
-                with open(temp_file, 'w') as f:
-                    f.write(content)
+            fd, temp_file = tempfile.mkstemp(dir=self.temp_dir)
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
 
-                self.client.upload_file(filename, temp_file)
+            def upload():
+                try:
+                    client.upload_file(remote, temp_file, self.transfer_progress(f"Uploading {filename}"))
+                finally:
+                    remove_file(temp_file)
 
-                messagebox.showinfo("Success", f"File {filename} created successfully")
+            def uploaded(size):
+                self.progress_bar["value"] = 0
+                messagebox.showinfo("Success", f"File {filename} {done} successfully")
                 self.refresh_files()
                 self.retrieve_file()
                 editor.destroy()
 
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to create file: {str(e)}")
+            def failed(e):
+                self.progress_bar["value"] = 0
+                save_button.config(state="normal")
+                messagebox.showerror("Error", f"Failed to save file: {str(e)}", parent=editor)
 
-        buttons_frame = ttk.Frame(editor)
-        buttons_frame.pack(fill="x", side="bottom", padx=10, pady=5)
+            save_button.config(state="disabled")
+            self.run_task(upload, uploaded, on_error=failed)
 
         save_button = ttk.Button(buttons_frame, text="Save", command=save_file)
         save_button.pack(side="right", padx=5)
@@ -386,6 +608,17 @@ class FTPClientGUI:
         cancel_button = ttk.Button(buttons_frame, text="Cancel", command=editor.destroy)
         cancel_button.pack(side="right", padx=5)
 
+    def create_file(self):
+        if not self.client:
+            return
+
+        filename = self.file_entry.get()
+        if not filename:
+            messagebox.showerror("Error", "Please enter a file name")
+            return
+
+        self.open_editor("Create File", filename, "", "created")
+
     def retrieve_file(self):
         if not self.client:
             return
@@ -404,27 +637,69 @@ class FTPClientGUI:
             messagebox.showerror("Error", "Please enter a file name")
             return
 
+        self.close_content()
         self.content_text.delete(1.0, tk.END)
 
-        try:
-            temp_file = os.path.join(self.temp_dir, filename)
-
-            self.client.download_file(filename, temp_file)
-
-            with open(temp_file, 'r') as f:
-                content = f.read()
-                self.content_text.insert(1.0, content)
-
-            self.status_var.set(f"Retrieved file {filename}")
+        self.retrieval += 1
+        retrieval = self.retrieval
+        client = self.client
+        remote = posixpath.join(self.current_path, filename)
+        fd, temp_file = tempfile.mkstemp(dir=self.temp_dir)
+        os.close(fd)
 
+        def download():
             try:
-                os.remove(temp_file)
-            except:
-                pass
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to retrieve file: {str(e)}")
-            self.status_var.set("Failed to retrieve file")
+                return client.download_file(remote, temp_file, self.transfer_progress(f"Retrieving {filename}"))
+            except Exception:
+                remove_file(temp_file)
+                raise
+
+        def done(size):
+            self.progress_bar["value"] = 0
+            if retrieval != self.retrieval:
+                remove_file(temp_file)
+                return
+            self.show_content(temp_file)
+            self.status_var.set(f"Retrieved file {filename} ({size} bytes)")
+
+        def failed(e):
+            self.progress_bar["value"] = 0
+            if retrieval == self.retrieval:
+                messagebox.showerror("Error", f"Failed to retrieve file: {str(e)}")
+                self.status_var.set("Failed to retrieve file")
+
+        self.status_var.set(f"Retrieving file {filename}")
+        self.run_task(download, done, on_error=failed)
+
+    def show_content(self, path):
+        self.close_content()
+        self.content_text.delete(1.0, tk.END)
+        self.content_file = open(path, 'rb')
+        self.content_path = path
+        # Pages are cut at byte offsets: the incremental decoder carries a split character over to the next one
+        self.content_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.load_content_page()
+
+    def load_content_page(self):
+        if self.content_file is None:
+            return
+        data = self.content_file.read(CONTENT_PAGE)
+        last = len(data) < CONTENT_PAGE
+        self.content_text.insert(tk.END, self.content_decoder.decode(data, final=last))
+        if last:
+            self.close_content()
+
+    def close_content(self):
+        if self.content_file is not None:
+            self.content_file.close()
+            remove_file(self.content_path)
+            self.content_file = None
+            self.content_path = None
+
+    def on_content_scroll(self, first, last):
+        self.content_text.vbar.set(first, last)
+        if self.content_file is not None and float(last) > 0.9:
+            self.root.after_idle(self.load_content_page)
 
     def update_file(self):
         if not self.client:
@@ -435,61 +710,33 @@ class FTPClientGUI:
             messagebox.showerror("Error", "Please enter a file name")
             return
 
-        current_content = ""
-        try:
-            temp_file = os.path.join(self.temp_dir, filename)
+        client = self.client
+        remote = posixpath.join(self.current_path, filename)
 
+        def load():
+            # A file that does not exist yet is edited from scratch
             try:
-                self.client.download_file(filename, temp_file)
-
-                with open(temp_file, 'r') as f:
-                    current_content = f.read()
-            except:
-                pass
-
-        except Exception as e:
-            pass
-
-        editor = tk.Toplevel(self.root)
-        editor.title(f"Update File: {filename}")
-        editor.geometry("600x400")
-
-        editor_text = scrolledtext.ScrolledText(editor, wrap=tk.WORD)
-        editor_text.pack(fill="both", expand=True, padx=10, pady=10)
-
-        if current_content:
-            editor_text.insert(1.0, current_content)
-
-        def save_file():
-            content = editor_text.get(1.0, tk.END)
+                size = client.file_size(remote)
+            except error_perm:
+                return ""
+            if size > EDIT_LIMIT:
+                raise ValueError(f"{filename} is too large to edit ({size} bytes)")
+            fd, temp_file = tempfile.mkstemp(dir=self.temp_dir)
+            os.close(fd)
             try:
-                temp_file = os.path.join(self.temp_dir, filename)
-                with open(temp_file, 'w') as f:
-                    f.write(content)
-
-                self.client.upload_file(filename, temp_file)
-
-                messagebox.showinfo("Success", f"File {filename} updated successfully")
-                self.refresh_files()
-                self.retrieve_file()
-                editor.destroy()
-
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to update file: {str(e)}")
+                client.download_file(remote, temp_file, self.transfer_progress(f"Retrieving {filename}"), size)
+                with open(temp_file, 'r') as f:
+                    return f.read()
+            finally:
+                remove_file(temp_file)
 
-        buttons_frame = ttk.Frame(editor)
-        buttons_frame.pack(fill="x", padx=10, pady=5)
+        def loaded(content):
+            self.progress_bar["value"] = 0
+            self.status_var.set(f"Editing file {filename}")
+            self.open_editor("Update File", filename, content, "updated")
 
-        save_button = ttk.Button(buttons_frame, text="Save", command=save_file)
-        save_button.pack(side="right", padx=5)
-
-        cancel_button = ttk.Button(buttons_frame, text="Cancel", command=editor.destroy)
-        cancel_button.pack(side="right", padx=5)
+        self.status_var.set(f"Retrieving file {filename}")
+        self.run_task(load, loaded, "Failed to retrieve file")
 
     def delete_file(self):
         if not self.client:
@@ -504,14 +751,16 @@ class FTPClientGUI:
         if not confirm:
             return
 
-        try:
-            self.client.delete_file(filename)
+        def deleted(result):
             messagebox.showinfo("Success", f"File {filename} deleted successfully")
             self.refresh_files()
+            self.close_content()
             self.content_text.delete(1.0, tk.END)
             self.file_entry.delete(0, tk.END)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to delete file: {str(e)}")
+
+        client = self.client
+        remote = posixpath.join(self.current_path, filename)
+        self.run_task(lambda: client.delete_file(remote), deleted, "Failed to delete file")
 
     def create_directory(self):
         if not self.client:
@@ -521,12 +770,13 @@ class FTPClientGUI:
         if not dirname:
             return
 
-        try:
-            self.client.create_folder(dirname)
+        def created(result):
             messagebox.showinfo("Success", f"Directory {dirname} created successfully")
             self.refresh_files()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to create directory: {str(e)}")
+
+        client = self.client
+        remote = posixpath.join(self.current_path, dirname)
+        self.run_task(lambda: client.create_folder(remote), created, "Failed to create directory")
 
     def delete_directory(self):
         if not self.client:
@@ -540,12 +790,13 @@ class FTPClientGUI:
         if not confirm:
             return
 
-        try:
-            self.client.delete_folder(dirname)
+        def deleted(result):
             messagebox.showinfo("Success", f"Directory {dirname} deleted successfully")
             self.refresh_files()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to delete directory: {str(e)}")
+
+        client = self.client
+        remote = posixpath.join(self.current_path, dirname)
+        self.run_task(lambda: client.delete_folder(remote), deleted, "Failed to delete directory")
 
 
 def main():
@@ -553,14 +804,12 @@ def main():
     app = FTPClientGUI(root)
     root.mainloop()
 
-    if hasattr(app, 'temp_dir') and os.path.exists(app.temp_dir):
-        try:
-            for file in os.listdir(app.temp_dir):
-                os.remove(os.path.join(app.temp_dir, file))
-            os.rmdir(app.temp_dir)
-        except:
-            pass
+    app.tasks.shutdown()
+    if app.client:
+        app.client.quit()
+    app.close_content()
+    shutil.rmtree(app.temp_dir, ignore_errors=True)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
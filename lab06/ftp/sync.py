@@ -0,0 +1,317 @@
+import argparse
+import json
+import os
+import posixpath
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from ftplib import error_perm
+
+from transfer import (DEFAULT_BLOCK_SIZE, JOURNAL_SUFFIX, Progress, RetryPolicy, SessionPool, TransferEngine,
+                      format_progress)
+
+MIRROR_MANIFEST = '.ftpsync-mirror.json'
+PUSH_MANIFEST = '.ftpsync-push.json'
+
+# A file rewritten in place keeps its directory time, so the listing index cannot see it: once the last
+# full listing is older than this, the next mirror lists every directory again. Shorter than a day,
+# so a nightly sync always lists everything and frequent syncs still use the index
+INDEX_MAX_AGE = 6 * 3600
+
+Entry = namedtuple('Entry', 'name is_dir size modify')
+
+MONTHS = {name: number for number, name in
+          enumerate(['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1)}
+
+
+def parse_unix_line(line):
+    # drwxr-xr-x 1 owner group 4096 Oct 19 13:15 name  /  -rw-r--r-- 1 owner group 6 Oct 19 2024 name
+    parts = line.split(None, 8)
+    if len(parts) < 9 or parts[5].lower()[:3] not in MONTHS:
+        return None
+    name = parts[8]
+    if parts[0].startswith('l'):
+        name = name.split(' -> ')[0]
+    month, day, clock = MONTHS[parts[5].lower()[:3]], int(parts[6]), parts[7]
+    if ':' in clock:
+        now = datetime.now()
+        year = now.year if (month, day) <= (now.month, now.day) else now.year - 1
+        modify = f'{year:04}{month:02}{day:02}{clock.replace(":", "")}'
+    else:
+        modify = f'{int(clock):04}{month:02}{day:02}'
+    return Entry(name, parts[0].startswith('d'), int(parts[4]), modify)
+
+
+def parse_dos_line(line):
+    # 10-19-24  01:15PM       <DIR>          name  /  10-19-24  01:15PM                 6 name
+    parts = line.split(None, 3)
+    if len(parts) < 4:
+        return None
+    try:
+        stamp = datetime.strptime(parts[0] + ' ' + parts[1], '%m-%d-%y %I:%M%p')
+    except ValueError:
+        return None
+    is_dir = parts[2].upper() == '<DIR>'
+    return Entry(parts[3], is_dir, 0 if is_dir else int(parts[2]), f'{stamp:%Y%m%d%H%M}')
+
+
+def parse_list_line(line):
+    return parse_unix_line(line) or parse_dos_line(line)
+
+
+def list_directory(ftp, path):
+    try:
+        entries = []
+        # Without a facts list: ftplib would send OPTS MLST before every listing, and the default facts
+        # of servers already include type, size and modify
+        for name, facts in ftp.mlsd(path):
+            kind = facts.get('type', '').lower()
+            if kind in ('cdir', 'pdir'):
+                continue
+            entries.append(Entry(name, kind == 'dir', int(facts.get('size', 0)), facts.get('modify')))
+        return entries
+    except error_perm as e:
+        if not str(e).startswith(('500', '501', '502')):
+            raise
+    lines = []
+    ftp.dir(path, lines.append)
+    entries = [parse_list_line(line) for line in lines]
+    return [entry for entry in entries if entry and entry.name not in ('.', '..')]
+
+
+def stat_directory(ftp, path):
+    # MLST answers on the control connection: one round trip instead of a data connection and a listing
+    try:
+        response = ftp.sendcmd('MLST ' + path)
+    except error_perm:
+        return None
+    for line in response.splitlines()[1:]:
+        facts = line.strip().split(' ', 1)[0]
+        for fact in facts.split(';'):
+            key, _, value = fact.partition('=')
+            if key.lower() == 'modify':
+                return value
+    return None
+
+
+class RemoteScanner:
+    """
+    Walks a remote tree over a session pool, listing directories in parallel. A directory
+    whose modify time (from MLST) matches the cached listing is not listed again: adding,
+    removing or renaming an entry changes the directory time, rewriting a file in place
+    does not - use full=True to list everything (mirror does it once the index is older than
+    INDEX_MAX_AGE).
+    """
+
+    def __init__(self, pool, listings, full=False):
+        self.pool = pool
+        self.cache = listings
+        self.full = full
+        self.listings = {}
+        self.files = {}
+        self.listed = 0
+        self.reused = 0
+
+    def scan_directory(self, root, rel, modify):
+        path = posixpath.join(root, rel) if rel else root
+        cached = self.cache.get(rel)
+        with self.pool.session() as ftp:
+            if cached and not self.full:
+                if modify is None:
+                    modify = stat_directory(ftp, path)
+                if modify is not None and modify == cached['modify']:
+                    return rel, modify, [Entry(*entry) for entry in cached['entries']], True
+            if modify is None and not self.full:
+                modify = stat_directory(ftp, path)
+            return rel, modify, list_directory(ftp, path), False
+
+    def scan(self, root):
+        with ThreadPoolExecutor(max_workers=self.pool.size) as executor:
+            pending = {executor.submit(self.scan_directory, root, '', None)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rel, modify, entries, reused = future.result()
+                    self.listings[rel] = {'modify': modify, 'entries': [list(entry) for entry in entries]}
+                    if reused:
+                        self.reused += 1
+                    else:
+                        self.listed += 1
+                    for entry in entries:
+                        child = posixpath.join(rel, entry.name) if rel else entry.name
+                        if entry.is_dir:
+                            # A listing from the cache carries old directory times: ask the server again
+                            pending.add(executor.submit(self.scan_directory, root, child,
+                                                        None if reused else entry.modify))
+                        else:
+                            self.files[child] = [entry.size, entry.modify]
+        return self.files
+
+
+def load_manifest(path, root):
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('root') == root:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'root': root, 'files': {}, 'listings': {}, 'dirs': []}
+
+
+def save_manifest(path, manifest):
+    temp = path + '.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(temp, path)
+
+
+def mirror(engine, remote_root, local_root, full=False, delete=False, max_age=INDEX_MAX_AGE):
+    os.makedirs(local_root, exist_ok=True)
+    manifest_path = os.path.join(local_root, MIRROR_MANIFEST)
+    manifest = load_manifest(manifest_path, remote_root)
+
+    started = time.time()
+    full = full or started - manifest.get('full_listing', 0) > max_age
+    scanner = RemoteScanner(engine.pool, manifest['listings'], full)
+    remote_files = scanner.scan(remote_root)
+
+    items = []
+    for rel, state in sorted(remote_files.items()):
+        local = os.path.join(local_root, *rel.split('/'))
+        if manifest['files'].get(rel) == state and os.path.isfile(local) and os.path.getsize(local) == state[0]:
+            continue
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        items.append((rel, (posixpath.join(remote_root, rel), local, state[0])))
+
+    results = engine.download_many([item for _, item in items])
+    failed = []
+    for (rel, _), (_, error) in zip(items, results):
+        if error is None:
+            manifest['files'][rel] = remote_files[rel]
+        else:
+            failed.append((rel, error))
+            manifest['files'].pop(rel, None)
+
+    removed = 0
+    for rel in [rel for rel in manifest['files'] if rel not in remote_files]:
+        del manifest['files'][rel]
+        if delete:
+            try:
+                os.remove(os.path.join(local_root, *rel.split('/')))
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+    manifest['listings'] = scanner.listings
+    if full:
+        manifest['full_listing'] = started
+    save_manifest(manifest_path, manifest)
+    return {'files': len(remote_files), 'transferred': len(items) - len(failed), 'failed': failed,
+            'removed': removed, 'full': full, 'listed': scanner.listed, 'reused': scanner.reused, 'engine': dict(engine.stats)}
+
+
+def push(engine, local_root, remote_root):
+    manifest_path = os.path.join(local_root, PUSH_MANIFEST)
+    manifest = load_manifest(manifest_path, remote_root)
+
+    local_files = {}
+    local_dirs = []
+    for directory, dirs, files in os.walk(local_root):
+        rel_dir = os.path.relpath(directory, local_root).replace(os.sep, '/')
+        rel_dir = '' if rel_dir == '.' else rel_dir
+        if rel_dir:
+            local_dirs.append(rel_dir)
+        for name in files:
+            if name.startswith('.ftpsync-') or name.endswith(('.part', JOURNAL_SUFFIX, JOURNAL_SUFFIX + '.tmp')):
+                continue
+            stat = os.stat(os.path.join(directory, name))
+            local_files[posixpath.join(rel_dir, name) if rel_dir else name] = [stat.st_size, stat.st_mtime_ns]
+
+    known_dirs = set(manifest['dirs'])
+    with engine.pool.session() as ftp:
+        for rel in [''] + sorted(local_dirs):
+            if rel in known_dirs:
+                continue
+            try:
+                ftp.mkd(posixpath.join(remote_root, rel) if rel else remote_root)
+            except error_perm as e:
+                # 550: the directory already exists (or cannot be created - STOR will report that)
+                if not str(e).startswith('550'):
+                    raise
+            known_dirs.add(rel)
+
+    items = [(rel, (os.path.join(local_root, *rel.split('/')), posixpath.join(remote_root, rel)))
+             for rel, state in sorted(local_files.items()) if manifest['files'].get(rel) != state]
+    results = engine.upload_many([item for _, item in items])
+    failed = []
+    for (rel, _), (_, error) in zip(items, results):
+        if error is None:
+            manifest['files'][rel] = local_files[rel]
+        else:
+            failed.append((rel, error))
+
+    manifest['files'] = {rel: state for rel, state in manifest['files'].items() if rel in local_files}
+    manifest['dirs'] = sorted(known_dirs & set([''] + local_dirs))
+    save_manifest(manifest_path, manifest)
+    return {'files': len(local_files), 'transferred': len(items) - len(failed), 'failed': failed,
+            'engine': dict(engine.stats)}
+
+
+def print_summary(summary, elapsed):
+    print(f"\n{summary['files']} files, {summary['transferred']} transferred, {len(summary['failed'])} failed"
+          + (f", {summary['removed']} removed" if summary.get('removed') else '')
+          + (f"; directories listed {summary['listed']}, from index {summary['reused']}" if 'listed' in summary else '')
+          + (' (full listing)' if summary.get('full') else '')
+          + f' in {elapsed:.1f} s')
+    engine = summary['engine']
+    if engine['retries'] or engine['resumed']:
+        print(f"Retries: {engine['retries']}, resumed transfers: {engine['resumed']}")
+    if engine['verified'] or engine['size_checked']:
+        print(f"Checksums verified: {engine['verified']}, size only (no server checksum): {engine['size_checked']}")
+    for rel, error in summary['failed']:
+        print(f'File {rel} failed: {error}')
+
+
+def show_progress(progress):
+    sys.stdout.write('\r' + format_progress(progress) + ' ' * 8)
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mirror a remote FTP tree locally or push a local tree to FTP')
+    parser.add_argument('mode', choices=['mirror', 'push'], help='mirror: remote -> local, push: local -> remote')
+    parser.add_argument('source', help='Remote directory for mirror, local directory for push')
+    parser.add_argument('target', help='Local directory for mirror, remote directory for push')
+    parser.add_argument('--host', type=str, help='FTP host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='FTP port', default=21)
+    parser.add_argument('--username', type=str, help='FTP username', default='TestUser')
+    parser.add_argument('--password', type=str, help='FTP password', default='12345678')
+    parser.add_argument('--connections', type=int, help='Parallel FTP sessions', default=4)
+    parser.add_argument('--block-size', type=int, help='Transfer block size, KB', default=DEFAULT_BLOCK_SIZE // 1024)
+    parser.add_argument('--full', action='store_true', help='List every directory, ignore the listing index')
+    parser.add_argument('--index-max-age', type=float, default=INDEX_MAX_AGE / 3600,
+                        help='Hours after a full listing before the next mirror lists everything again')
+    parser.add_argument('--delete', action='store_true', help='Mirror: remove local files deleted on the server')
+    parser.add_argument('--retries', type=int, help='Attempts per file before giving up', default=5)
+
+    args = parser.parse_args()
+    pool = SessionPool(args.host, args.port, args.username, args.password, args.connections)
+    engine = TransferEngine(pool, args.block_size * 1024, progress=Progress(show_progress),
+                            retry=RetryPolicy(args.retries))
+    start = time.monotonic()
+    try:
+        if args.mode == 'mirror':
+            summary = mirror(engine, args.source, args.target, args.full, args.delete, args.index_max_age * 3600)
+        else:
+            summary = push(engine, args.source, args.target)
+    finally:
+        pool.close()
+    print_summary(summary, time.monotonic() - start)
+    sys.exit(1 if summary['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,529 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from ftplib import FTP, all_errors, error_perm
+
+DEFAULT_BLOCK_SIZE = 256 * 1024
+# Files smaller than two segments of this size are not split: extra logins would cost more than they save
+MIN_SEGMENT_SIZE = 8 * 2 ** 20
+# Smaller files are simply restarted after a failure: a journal write would cost more than the resend
+JOURNAL_MIN_SIZE = 2 ** 20
+# How many bytes a segment writes between journal checkpoints
+CHECKPOINT_SIZE = 4 * 2 ** 20
+JOURNAL_SUFFIX = '.ftpjournal'
+
+# Server-side checksums from the HASH extension (by preference) and the digests computed locally for them
+HASH_ALGORITHMS = ['SHA-256', 'SHA-512', 'SHA-1', 'MD5', 'CRC32']
+
+
+class SessionPool:
+
+    def __init__(self, host, port, username, password, size=4, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.opened = 0
+        self.closed = False
+        self.cond = threading.Condition()
+        # The keepalive thread sleeps on its own event: waiting on cond it could swallow the notify meant for acquire
+        self.stopped = threading.Event()
+        self.feature_set = None
+
+    def features(self, ftp):
+        # FEAT is asked once per pool: every session talks to the same server
+        if self.feature_set is None:
+            features = {}
+            try:
+                for line in ftp.sendcmd('FEAT').splitlines()[1:-1]:
+                    name, _, params = line.strip().partition(' ')
+                    features[name.upper()] = params
+            except error_perm:
+                pass
+            self.feature_set = features
+        return self.feature_set
+
+    def open(self):
+        ftp = FTP(timeout=self.timeout)
+        ftp.connect(self.host, self.port)
+        ftp.login(self.username, self.password)
+        ftp.voidcmd('TYPE I')
+        return ftp
+
+    def acquire(self):
+        with self.cond:
+            while not self.idle and self.opened >= self.size:
+                self.cond.wait()
+            if self.idle:
+                return self.idle.pop()[0]
+            self.opened += 1
+        try:
+            return self.open()
+        except BaseException:
+            self.discard()
+            raise
+
+    def release(self, ftp):
+        # A session closed by its user (ftp.sock is None) is left in an unknown state and is not reused
+        if ftp.sock is None:
+            self.discard()
+            return
+        with self.cond:
+            if not self.closed:
+                self.idle.append((ftp, time.monotonic()))
+                self.cond.notify()
+                return
+        self.quit(ftp)
+
+    def discard(self):
+        with self.cond:
+            self.opened -= 1
+            self.cond.notify()
+
+    @contextmanager
+    def session(self):
+        ftp = self.acquire()
+        try:
+            yield ftp
+        except error_perm:
+            # The server refused a command and is waiting for the next one: the session is still usable
+            raise
+        except BaseException:
+            ftp.close()
+            raise
+        finally:
+            self.release(ftp)
+
+    def keepalive(self, interval=60):
+        # Servers drop control connections left idle for a few minutes: idle sessions are kept alive with NOOP
+        threading.Thread(target=self.ping_idle, args=(interval,), daemon=True).start()
+
+    def ping_idle(self, interval):
+        while not self.stopped.wait(interval / 2):
+            with self.cond:
+                now = time.monotonic()
+                stale = [ftp for ftp, released in self.idle if now - released >= interval]
+                self.idle = [(ftp, released) for ftp, released in self.idle if now - released < interval]
+            for ftp in stale:
+                try:
+                    ftp.voidcmd('NOOP')
+                except all_errors:
+                    ftp.close()
+                self.release(ftp)
+
+    @staticmethod
+    def quit(ftp):
+        try:
+            ftp.quit()
+        except all_errors:
+            ftp.close()
+
+    def close(self):
+        self.stopped.set()
+        with self.cond:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.opened -= len(idle)
+        for ftp, _ in idle:
+            self.quit(ftp)
+
+
+class Progress:
+
+    def __init__(self, callback=None, interval=0.2):
+        self.callback = callback
+        self.interval = interval
+        self.total = 0
+        self.done = 0
+        self.files = 0
+        self.files_done = 0
+        self.started = time.monotonic()
+        self.reported = 0
+        self.lock = threading.Lock()
+
+    def add_file(self, size):
+        with self.lock:
+            self.files += 1
+            self.total += size
+
+    def update(self, size):
+        with self.lock:
+            self.done += size
+            now = time.monotonic()
+            if self.callback is None or now - self.reported < self.interval:
+                return
+            self.reported = now
+        self.callback(self)
+
+    def file_done(self):
+        with self.lock:
+            self.files_done += 1
+        if self.callback is not None:
+            self.callback(self)
+
+    @property
+    def rate(self):
+        return self.done / max(time.monotonic() - self.started, 1e-9)
+
+
+class ChecksumError(Exception):
+    pass
+
+
+class FileProgress:
+    # Progress of one file across attempts: a retry re-bases it on the bytes actually kept,
+    # so resent data is not counted twice
+
+    def __init__(self, progress):
+        self.progress = progress
+        self.counted = 0
+        self.lock = threading.Lock()
+
+    def advance(self, size):
+        with self.lock:
+            self.counted += size
+        self.progress.update(size)
+
+    def reset(self, present):
+        with self.lock:
+            delta, self.counted = present - self.counted, present
+        self.progress.update(delta)
+
+
+class RetryPolicy:
+
+    def __init__(self, attempts=5, base_delay=1.0, max_delay=30.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1)
+
+    def run(self, action, on_retry=None):
+        for attempt in range(self.attempts):
+            try:
+                return action()
+            except error_perm:
+                # 5xx: no such file, no permission - repeating will not help
+                raise
+            except all_errors + (ChecksumError,) as e:
+                if attempt + 1 == self.attempts:
+                    raise
+                if on_retry is not None:
+                    on_retry(e)
+                time.sleep(self.delay(attempt))
+
+
+class Journal:
+    """
+    Sidecar file next to the local file: what is being transferred (so a leftover .part
+    or a partial remote file is only resumed for the same file) and, for segmented
+    downloads, how many bytes of every segment are already on disk.
+    """
+
+    def __init__(self, local, identity):
+        self.path = local + JOURNAL_SUFFIX
+        self.identity = identity
+        self.segments = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('identity') != self.identity:
+            return False
+        self.segments = data.get('segments')
+        return True
+
+    def save(self):
+        temp = self.path + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump({'identity': self.identity, 'segments': self.segments}, f)
+        os.replace(temp, self.path)
+
+    def checkpoint(self, index, done):
+        with self.lock:
+            self.segments[index][1] = done
+            self.save()
+
+    def remove(self):
+        for path in (self.path, self.path + '.tmp'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def local_checksum(path, algorithm):
+    if algorithm == 'CRC32':
+        crc = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                crc = zlib.crc32(chunk, crc)
+        return f'{crc:08x}'
+    digest = hashlib.new(algorithm.replace('-', '').lower())
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remote_checksum(ftp, features, remote):
+    """(algorithm, hex digest) from the server, or None if it offers no checksum command"""
+    if 'HASH' in features:
+        # HASH SHA-256*;SHA-1;MD5 - the starred algorithm is the one currently selected
+        offered = [name.rstrip('*').upper() for name in features['HASH'].split(';') if name]
+        current = next((name.rstrip('*').upper() for name in features['HASH'].split(';') if name.endswith('*')),
+                       None)
+        algorithm = next((name for name in HASH_ALGORITHMS if name in offered), None)
+        if algorithm is not None:
+            if algorithm != current:
+                ftp.sendcmd('OPTS HASH ' + algorithm)
+            # 213 SHA-256 0-49 5f3b... name
+            parts = ftp.sendcmd('HASH ' + remote).split()
+            return parts[1].upper(), parts[3].lower()
+    if 'XCRC' in features:
+        # 250 1A2B3C4D or 250 CRC32 1A2B3C4D
+        return 'CRC32', ftp.sendcmd('XCRC ' + remote).split()[-1].lower().rjust(8, '0')
+    return None
+
+
+class TransferEngine:
+
+    def __init__(self, pool, block_size=DEFAULT_BLOCK_SIZE, segments=None, min_segment=MIN_SEGMENT_SIZE,
+                 progress=None, retry=None, verify=True):
+        self.pool = pool
+        self.block_size = block_size
+        self.segments = segments or pool.size
+        self.min_segment = min_segment
+        self.progress = progress or Progress()
+        self.retry = retry or RetryPolicy()
+        self.verify = verify
+        self.stats = {'retries': 0, 'resumed': 0, 'verified': 0, 'size_checked': 0}
+        self.stats_lock = threading.Lock()
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def download(self, remote, local, size=None):
+        if size is None:
+            with self.pool.session() as ftp:
+                size = ftp.size(remote)
+        self.progress.add_file(size)
+        progress = FileProgress(self.progress)
+        self.retry.run(lambda: self.fetch(remote, local, size, progress), lambda e: self.count('retries'))
+        self.progress.file_done()
+        return size
+
+    def fetch(self, remote, local, size, progress):
+        part = local + '.part'
+        journal = Journal(local, {'remote': remote, 'size': size, 'direction': 'download'})
+        resumed = journal.load() and os.path.exists(part)
+
+        if size < 2 * self.min_segment or self.segments < 2:
+            # One stream writes the file in order: the .part size itself says how much is done
+            if not resumed or journal.segments is not None:
+                open(part, 'wb').close()
+                if size >= JOURNAL_MIN_SIZE:
+                    journal.segments = None
+                    journal.save()
+            offset = os.path.getsize(part)
+            if offset:
+                self.count('resumed')
+            progress.reset(offset)
+            self.download_range(remote, part, offset, size, size, progress)
+        else:
+            if not resumed or not journal.segments or os.path.getsize(part) != size:
+                self.preallocate(part, size)
+                count = min(self.segments, size // self.min_segment)
+                bounds = [size * i // count for i in range(count + 1)]
+                journal.segments = [[bounds[i], bounds[i], bounds[i + 1]] for i in range(count)]
+                journal.save()
+            present = sum(done - start for start, done, _ in journal.segments)
+            if present:
+                self.count('resumed')
+            progress.reset(present)
+            self.download_segments(remote, part, size, journal, progress)
+
+        try:
+            self.verify_download(remote, part, size)
+        except ChecksumError:
+            # Start from scratch on the next attempt: the bad bytes could be anywhere
+            os.remove(part)
+            journal.remove()
+            raise
+        os.replace(part, local)
+        journal.remove()
+
+    @staticmethod
+    def preallocate(path, size):
+        with open(path, 'wb') as f:
+            f.truncate(size)
+            if hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(f.fileno(), 0, size)
+                except OSError:
+                    pass
+
+    def download_segments(self, remote, part, size, journal, progress):
+        errors = []
+
+        def run(index, done, end):
+            try:
+                self.download_range(remote, part, done, end, size, progress, journal, index)
+            except BaseException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(index, done, end))
+                   for index, (_, done, end) in enumerate(journal.segments) if done < end]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def download_range(self, remote, path, offset, end, size, progress, journal=None, index=None):
+        if offset >= end:
+            return
+        with self.pool.session() as ftp, open(path, 'r+b') as f:
+            f.seek(offset)
+            conn = ftp.transfercmd('RETR ' + remote, rest=offset or None)
+            remaining = end - offset
+            unsaved = 0
+            try:
+                with conn:
+                    while remaining:
+                        data = conn.recv(min(self.block_size, remaining))
+                        if not data:
+                            break
+                        f.write(data)
+                        remaining -= len(data)
+                        unsaved += len(data)
+                        progress.advance(len(data))
+                        if journal and unsaved >= CHECKPOINT_SIZE:
+                            # The journal must never promise bytes that are not on disk yet
+                            f.flush()
+                            os.fsync(f.fileno())
+                            journal.checkpoint(index, end - remaining)
+                            unsaved = 0
+            finally:
+                if journal and unsaved:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    journal.checkpoint(index, end - remaining)
+            if remaining:
+                raise EOFError(f'{remote}: connection closed {remaining} bytes before the end of a segment')
+            if end < size:
+                # The server sees the data connection closed early and answers with 426 or 226 depending on
+                # whether it noticed in time; the session may receive a late reply, so it is not reused
+                ftp.close()
+            else:
+                ftp.voidresp()
+
+    def verify_download(self, remote, part, size):
+        actual = os.path.getsize(part)
+        if actual != size:
+            raise ChecksumError(f'{remote}: expected {size} bytes, got {actual}')
+        if not self.verify:
+            return
+        with self.pool.session() as ftp:
+            checksum = remote_checksum(ftp, self.pool.features(ftp), remote)
+        self.compare(remote, part, checksum)
+
+    def compare(self, remote, local, checksum):
+        if checksum is None:
+            # Nothing to compare with on the server: the size check above is all that can be done
+            self.count('size_checked')
+            return
+        algorithm, expected = checksum
+        actual = local_checksum(local, algorithm)
+        if actual != expected:
+            raise ChecksumError(f'{remote}: {algorithm} mismatch ({actual} locally, {expected} on the server)')
+        self.count('verified')
+
+    def upload(self, local, remote):
+        # Segmented STOR needs REST beyond the current end of file, which servers reject, so a single file
+        # goes over one connection; parallelism comes from upload_many
+        stat = os.stat(local)
+        self.progress.add_file(stat.st_size)
+        journal = Journal(local, {'remote': remote, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                                  'direction': 'upload'})
+        progress = FileProgress(self.progress)
+        self.retry.run(lambda: self.send(local, remote, stat.st_size, journal, progress),
+                       lambda e: self.count('retries'))
+        journal.remove()
+        self.progress.file_done()
+        return stat.st_size
+
+    def send(self, local, remote, size, journal, progress):
+        with self.pool.session() as ftp, open(local, 'rb') as f:
+            offset = 0
+            if journal.load():
+                # The server's size of the partial file is the only reliable count of what arrived
+                try:
+                    offset = ftp.size(remote)
+                except error_perm:
+                    offset = 0
+                if not 0 < offset <= size:
+                    offset = 0
+            elif size >= JOURNAL_MIN_SIZE:
+                journal.save()
+
+            progress.reset(offset)
+            callback = lambda data: progress.advance(len(data))
+            if offset:
+                self.count('resumed')
+                f.seek(offset)
+                ftp.storbinary('APPE ' + remote, f, self.block_size, callback)
+            else:
+                ftp.storbinary('STOR ' + remote, f, self.block_size, callback)
+
+            try:
+                try:
+                    actual = ftp.size(remote)
+                except error_perm:
+                    actual = size
+                if actual != size:
+                    raise ChecksumError(f'{remote}: expected {size} bytes on the server, got {actual}')
+                if self.verify:
+                    self.compare(remote, local, remote_checksum(ftp, self.pool.features(ftp), remote))
+            except ChecksumError:
+                # The remote copy is wrong somewhere: the next attempt sends the whole file again
+                journal.remove()
+                raise
+
+    def download_many(self, pairs):
+        return self.run_many(self.download, pairs)
+
+    def upload_many(self, pairs):
+        return self.run_many(self.upload, pairs)
+
+    def run_many(self, transfer, pairs):
+        with ThreadPoolExecutor(max_workers=self.pool.size) as executor:
+            futures = [(pair, executor.submit(transfer, *pair)) for pair in pairs]
+        results = []
+        for pair, future in futures:
+            error = future.exception()
+            results.append((pair, error))
+        return results
+
+
+def format_progress(progress):
+    percent = progress.done / progress.total * 100 if progress.total else 100
+    return (f'{progress.files_done}/{progress.files} files, {progress.done / 2 ** 20:.1f}/'
+            f'{progress.total / 2 ** 20:.1f} MB ({percent:.0f}%), {progress.rate / 2 ** 20:.1f} MB/s')
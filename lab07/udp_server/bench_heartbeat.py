@@ -0,0 +1,149 @@
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+from heartbeat import pack_heartbeat
+from serverh import Client
+
+
+def scan_expiry(clients, ticks, timeout):
+    """Как было: словарь клиентов целиком просматривается раз в секунду; (учёт пакетов, проверка) за секунду"""
+    table = {i: {'last_seq': 0, 'last_time': 0.0} for i in range(clients)}
+    update = check = 0.0
+    for now in range(1, ticks + 1):
+        start = time.perf_counter()
+        for i in range(clients):
+            table[i]['last_time'] = now
+        update += time.perf_counter() - start
+        start = time.perf_counter()
+        disconnected = [key for key, info in table.items() if now - info['last_time'] > timeout]
+        for key in disconnected:
+            del table[key]
+        check += time.perf_counter() - start
+    return update / ticks, check / ticks
+
+
+def ordered_expiry(clients, ticks, timeout, tick=0.1):
+    """Как теперь: клиенты в порядке последних пакетов, проверка раз в tick смотрит только в начало"""
+    table = OrderedDict((i, Client(str(i), 0, 0.0)) for i in range(clients))
+    update = check = 0.0
+    for second in range(1, ticks + 1):
+        start = time.perf_counter()
+        for i in range(clients):
+            table[i].last_time = second
+            table.move_to_end(i)
+        update += time.perf_counter() - start
+        start = time.perf_counter()
+        for step in range(round(1 / tick)):
+            now = second + step * tick
+            while table:
+                key, client = next(iter(table.items()))
+                if now - client.last_time <= timeout:
+                    break
+                del table[key]
+        check += time.perf_counter() - start
+    return update / ticks, check / ticks
+
+
+def start_server(port, timeout):
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serverh.py'),
+                               '--host', '127.0.0.1', '--port', str(port), '--timeout', str(timeout),
+                               '--drop-rate', '0', '--report', '1', '--log-limit', '2'])
+    time.sleep(0.5)
+    return server
+
+
+def open_sockets(count):
+    socks = []
+    for _ in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 2 ** 20)
+        sock.setblocking(False)
+        socks.append(sock)
+    return socks
+
+
+def drain(socks):
+    acked = 0
+    for sock in socks:
+        try:
+            while True:
+                sock.recv(64)
+                acked += 1
+        except BlockingIOError:
+            pass
+    return acked
+
+
+def load(port, socks, clients, interval, duration, active, seq_num):
+    """Рассылает heartbeat от первых active из clients симулированных клиентов, начиная с номера seq_num;
+    клиент i всегда шлёт с сокета i % len(socks). Возвращает (отправлено, ACK, следующий номер)"""
+    server = ('127.0.0.1', port)
+    sockets = len(socks)
+    names = [f"sim-{i}" for i in range(clients)]
+    batch = 500
+    sent = acked = 0
+    start = time.monotonic()
+    first_seq = seq_num
+    # Клиенты равномерно распределены по интервалу: каждая пачка уходит в своё время
+    while time.monotonic() - start < duration:
+        round_start = start + (seq_num - first_seq) * interval
+        for first in range(0, active, batch):
+            due = round_start + first / clients * interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            now_ns = time.time_ns()
+            for i in range(first, min(first + batch, active)):
+                try:
+                    socks[i % sockets].sendto(pack_heartbeat(seq_num, now_ns, names[i]), server)
+                    sent += 1
+                except BlockingIOError:
+                    pass
+            acked += drain(socks)
+        seq_num += 1
+    time.sleep(0.2)
+    return sent, acked + drain(socks), seq_num
+
+
+def main(clients, interval, duration, timeout, sockets, port, ticks):
+    print(f"{clients} clients, each sends a heartbeat every second; time per second spent on:")
+    for name, run in (("full scan once a second", scan_expiry), ("ordered table, 10 checks", ordered_expiry)):
+        update, check = run(clients, ticks, timeout)
+        print(f"  {name}: bookkeeping {update * 1000:.1f} ms, expiry check {check * 1000:.3f} ms")
+
+    print(f"\n{clients} simulated clients, heartbeat every {interval} s ({clients / interval:.0f} packages/s), "
+          f"timeout {timeout} s")
+    server = start_server(port, timeout)
+    socks = open_sockets(sockets)
+    try:
+        sent, acked, seq_num = load(port, socks, clients, interval, duration, clients, 1)
+        print(f"All clients for {duration} s: sent {sent}, ACK {acked} ({acked / max(sent, 1) * 100:.1f}%)")
+        half = clients // 2
+        sent, acked, _ = load(port, socks, clients, interval, timeout + 2, half, seq_num)
+        print(f"{half} clients for {timeout + 2} s, the rest silent: sent {sent}, ACK {acked} "
+              f"({acked / max(sent, 1) * 100:.1f}%)")
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.wait()
+        for sock in socks:
+            sock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Heartbeat server under many simulated clients')
+    parser.add_argument('--clients', type=int, default=100000, help='Simulated clients')
+    parser.add_argument('--interval', type=float, default=4, help='Seconds between heartbeats of one client')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of load with all clients')
+    parser.add_argument('--timeout', type=float, default=10, help='Server client timeout, seconds')
+    parser.add_argument('--sockets', type=int, default=16, help='Sockets the simulated clients share')
+    parser.add_argument('--port', type=int, default=9998, help='Server port')
+    parser.add_argument('--ticks', type=int, default=10, help='Seconds simulated in the expiry check')
+    args = parser.parse_args()
+
+    main(args.clients, args.interval, args.duration, args.timeout, args.sockets, args.port, args.ticks)
@@ -4,6 +4,8 @@ import sys
 import random
 import threading
 
+from heartbeat import ACK, pack_heartbeat, unpack_packet
+
 
 class HeartbeatClient:
     def __init__(self, server_host='localhost', server_port=9999, interval=1.0, client_id=None):
@@ -37,19 +39,21 @@ class HeartbeatClient:
             self.client_socket.close()
 
     def send_heartbeat(self):
-        send_time = time.time()
-        message = f"Heartbeat {self.seq_num} {send_time}"
+        message = pack_heartbeat(self.seq_num, time.time_ns(), self.client_id)
 
         try:
-            self.client_socket.sendto(message.encode('utf-8'), self.server_address)
+            self.client_socket.sendto(message, self.server_address)
             self.sent_packets += 1
-            data, server = self.client_socket.recvfrom(1024)
-            response = data.decode('utf-8')
+            while True:
+                data, server = self.client_socket.recvfrom(1024)
+                packet = unpack_packet(data)
+                # Запоздавший ACK на прошлый пакет пропускаем и ждём ответа на текущий
+                if packet is not None and packet[0] == ACK and packet[1] == self.seq_num:
+                    break
             self.received_packets += 1
-            recv_time = time.time()
-            rtt = recv_time - send_time
+            rtt = (time.time_ns() - packet[2]) / 1e9
 
-            print(f"[{self.client_id}] Sent #{self.seq_num}, received answer: {response}, RTT: {rtt:.6f} sec")
+            print(f"[{self.client_id}] Sent #{self.seq_num}, received answer: ACK {packet[1]}, RTT: {rtt:.6f} sec")
 
         except socket.timeout:
             print(f"[{self.client_id}] Package #{self.seq_num} was missed or no answer")
@@ -0,0 +1,28 @@
+import struct
+
+# Заголовок: метка формата, тип пакета, номер, время отправки клиентом в наносекундах (сетевой порядок байт).
+# За заголовком Heartbeat идёт идентификатор клиента в UTF-8, ACK состоит из одного заголовка
+HEADER = struct.Struct('!HBIQ')
+MAGIC = 0x4842
+HEARTBEAT = 1
+ACK = 2
+MAX_CLIENT_ID = 64
+
+
+def pack_heartbeat(seq_num, timestamp_ns, client_id):
+    return HEADER.pack(MAGIC, HEARTBEAT, seq_num & 0xFFFFFFFF, timestamp_ns) + client_id.encode('utf-8')[:MAX_CLIENT_ID]
+
+
+def pack_ack(seq_num, timestamp_ns):
+    # Время клиента возвращается обратно: RTT считается без таблицы отправленных пакетов
+    return HEADER.pack(MAGIC, ACK, seq_num, timestamp_ns)
+
+
+def unpack_packet(data):
+    """(тип, номер, время отправки, идентификатор клиента) или None, если датаграмма в другом формате"""
+    if len(data) < HEADER.size or len(data) > HEADER.size + MAX_CLIENT_ID:
+        return None
+    magic, kind, seq_num, timestamp_ns = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        return None
+    return kind, seq_num, timestamp_ns, data[HEADER.size:]
@@ -1,94 +1,205 @@
+import argparse
 import socket
 import random
 import time
-import threading
+from collections import OrderedDict
 from datetime import datetime
 
+from heartbeat import HEARTBEAT, pack_ack, unpack_packet
+
+
+class Client:
+    __slots__ = ('name', 'last_seq', 'last_time')
+
+    def __init__(self, name, seq_num, current_time):
+        self.name = name
+        self.last_seq = seq_num
+        self.last_time = current_time
+
+
+class SampledLog:
+    # Не больше limit строк в секунду на каждый вид событий, остальные только считаются
+
+    def __init__(self, limit=5):
+        self.limit = limit
+        self.second = 0
+        self.printed = {}
+        self.suppressed = 0
+
+    def __call__(self, kind, message):
+        second = int(time.monotonic())
+        if second != self.second:
+            self.second = second
+            self.printed.clear()
+        printed = self.printed.get(kind, 0)
+        if printed >= self.limit:
+            self.suppressed += 1
+            return
+        self.printed[kind] = printed + 1
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+
 
 class HeartbeatServer:
-    def __init__(self, host='localhost', port=9999, timeout=5):
+    """
+    Таймаут у всех клиентов один, поэтому порядок последних пакетов совпадает с порядком дедлайнов:
+    клиент с пакетом переносится в конец clients, а просроченные всегда лежат в начале. Heartbeat
+    стоит O(1), проверка таймаутов раз в tick секунд - O(1) плюс число отключённых клиентов
+    """
+
+    def __init__(self, host='localhost', port=9999, timeout=5, drop_rate=0.2, tick=0.1, report_interval=10,
+                 log_limit=5):
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 2 ** 20)
         self.server_address = (host, port)
         self.server_socket.bind(self.server_address)
-        self.clients = {}
+        self.clients = OrderedDict()
         self.client_timeout = timeout
+        self.tick = tick
+        self.drop_rate = drop_rate
         self.running = True
-        self.monitor_thread = threading.Thread(target=self.monitor_clients)
-        self.monitor_thread.daemon = True
+        self.log = SampledLog(log_limit)
+        self.report_interval = report_interval
+        self.counters = {'packets': 0, 'invalid': 0, 'dropped': 0, 'connected': 0, 'disconnected': 0,
+                         'missed': 0, 'reordered': 0}
+        self.delay_sum = 0.0
+        self.delay_max = 0.0
 
     def start(self):
         print(f"Heartbeat server is running on {self.server_address[0]}:{self.server_address[1]}")
         print(f"Timeout for clients: {self.client_timeout} seconds")
 
-        self.monitor_thread.start()
+        # Приём пакетов и проверка таймаутов идут в одном потоке: таблица клиентов не делится между потоками
+        self.server_socket.settimeout(self.tick)
+        next_report = time.monotonic() + self.report_interval
+        next_tick = 0.0
+        last = dict(self.counters)
 
         try:
             while self.running:
-                data, client_address = self.server_socket.recvfrom(1024)
-                self.process_packet(data, client_address)
+                try:
+                    data, client_address = self.server_socket.recvfrom(1024)
+                except socket.timeout:
+                    data = None
+                current_time = time.monotonic()
+                if data is not None:
+                    self.process_packet(data, client_address, current_time)
+                if current_time >= next_tick:
+                    self.monitor_clients(current_time)
+                    next_tick = current_time + self.tick
+
+                if self.report_interval and current_time >= next_report:
+                    self.report(last, current_time - next_report + self.report_interval)
+                    last = dict(self.counters)
+                    next_report = current_time + self.report_interval
 
         except KeyboardInterrupt:
             print("Server shutting down...")
         finally:
             self.server_socket.close()
-
-    def process_packet(self, data, client_address):
-        message = data.decode('utf-8')
-        parts = message.split()
-
-        if len(parts) >= 3 and parts[0] == "Heartbeat":
-            seq_num = int(parts[1])
-            timestamp = float(parts[2])
-            current_time = time.time()
-            delay = current_time - timestamp
-
-            if random.random() < 0.2:
-                print(f"Package from {client_address} was dropped")
+            self.report(None, None)
+
+    def process_packet(self, data, client_address, current_time):
+        self.counters['packets'] += 1
+        packet = unpack_packet(data)
+        if packet is not None:
+            kind, seq_num, timestamp_ns, client_id = packet
+            if kind != HEARTBEAT:
+                self.counters['invalid'] += 1
                 return
-
-            if client_address in self.clients:
-                last_seq = self.clients[client_address]['last_seq']
-
-                if seq_num > last_seq + 1:
-                    missed = seq_num - last_seq - 1
-                    print(f"Client {client_address} missed {missed} package(s) ({last_seq + 1}-{seq_num - 1})")
-
-                # Обновляем информацию о клиенте
-                self.clients[client_address]['last_seq'] = seq_num
-                self.clients[client_address]['last_time'] = current_time
+            # Клиенты за одним адресом (NAT, симулятор) различаются по идентификатору из пакета
+            key = (client_address, client_id)
+            delay = time.time() - timestamp_ns / 1e9
+            response = pack_ack(seq_num, timestamp_ns)
+        else:
+            # Текстовый формат прежних клиентов: "Heartbeat <номер> <время>"
+            parts = data.decode('utf-8', errors='replace').split()
+            if len(parts) < 3 or parts[0] != "Heartbeat":
+                self.counters['invalid'] += 1
+                return
+            try:
+                seq_num, timestamp = int(parts[1]), float(parts[2])
+            except ValueError:
+                self.counters['invalid'] += 1
+                return
+            key = client_address
+            delay = time.time() - timestamp
+            response = f"ACK {seq_num}".encode('utf-8')
+
+        if self.drop_rate and random.random() < self.drop_rate:
+            self.counters['dropped'] += 1
+            self.log('dropped', f"Package from {client_address} was dropped")
+            return
+
+        client = self.clients.get(key)
+        if client is not None:
+            if seq_num > client.last_seq + 1:
+                missed = seq_num - client.last_seq - 1
+                self.counters['missed'] += missed
+                self.log('missed', f"Client {client.name} missed {missed} package(s) "
+                                   f"({client.last_seq + 1}-{seq_num - 1})")
+
+            # Обновляем информацию о клиенте; опоздавший пакет не отматывает номер назад
+            if seq_num > client.last_seq:
+                client.last_seq = seq_num
             else:
-                # Новый клиент
-                print(f"New client was connected: {client_address}")
-                self.clients[client_address] = {
-                    'last_seq': seq_num,
-                    'last_time': current_time
-                }
-
-            print(
-                f"[{datetime.now().strftime('%H:%M:%S')}] Received Heartbeat #{seq_num} from {client_address}, delay: {delay:.6f} sec")
-
-            response = f"ACK {seq_num}"
-            self.server_socket.sendto(response.encode('utf-8'), client_address)
-
-    def monitor_clients(self):
-        while self.running:
-            current_time = time.time()
-            disconnected_clients = []
-
-            for client_address, info in self.clients.items():
-                last_time = info['last_time']
-
-                if current_time - last_time > self.client_timeout:
-                    print(
-                        f"[{datetime.now().strftime('%H:%M:%S')}] WARNING: Client {client_address} was disconnected (no activity for {self.client_timeout} seconds)")
-                    disconnected_clients.append(client_address)
-
-            for client in disconnected_clients:
-                del self.clients[client]
-
-            time.sleep(1)
+                self.counters['reordered'] += 1
+            client.last_time = current_time
+            self.clients.move_to_end(key)
+        else:
+            # Новый клиент
+            if packet is not None:
+                name = f"{client_id.decode('utf-8', errors='replace')}@{client_address}"
+            else:
+                name = str(client_address)
+            client = Client(name, seq_num, current_time)
+            self.clients[key] = client
+            self.counters['connected'] += 1
+            self.log('connected', f"New client was connected: {name}")
+
+        self.delay_sum += delay
+        self.delay_max = max(self.delay_max, delay)
+
+        self.server_socket.sendto(response, client_address)
+
+    def monitor_clients(self, current_time):
+        while self.clients:
+            key, client = next(iter(self.clients.items()))
+            if current_time - client.last_time <= self.client_timeout:
+                break
+            del self.clients[key]
+            self.counters['disconnected'] += 1
+            self.log('disconnected', f"WARNING: Client {client.name} was disconnected "
+                                     f"(no activity for {self.client_timeout} seconds)")
+
+    def report(self, last, elapsed):
+        counters = self.counters
+        answered = counters['packets'] - counters['invalid'] - counters['dropped']
+        delay = f"{self.delay_sum / answered * 1000:.2f}" if answered else "-"
+        if last is None:
+            print(f"Total: {counters['packets']} packages, {counters['connected']} clients connected, "
+                  f"{counters['disconnected']} disconnected, {counters['missed']} missed, "
+                  f"{counters['dropped']} dropped, {counters['invalid']} invalid, "
+                  f"delay avg {delay} ms, max {self.delay_max * 1000:.2f} ms")
+            return
+        packets = counters['packets'] - last['packets']
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {len(self.clients)} clients alive, "
+              f"{packets} packages ({packets / elapsed:.0f}/s), "
+              f"+{counters['connected'] - last['connected']} connected, "
+              f"-{counters['disconnected'] - last['disconnected']} disconnected, "
+              f"{counters['missed'] - last['missed']} missed, {counters['dropped'] - last['dropped']} dropped, "
+              f"delay avg {delay} ms, log lines suppressed: {self.log.suppressed}")
 
 
 if __name__ == "__main__":
-    server = HeartbeatServer(timeout=5)
-    server.start()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='UDP Heartbeat server')
+    parser.add_argument('--host', default='localhost', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=9999, help='Port to listen on')
+    parser.add_argument('--timeout', type=float, default=5, help='Seconds without heartbeats before a client is lost')
+    parser.add_argument('--drop-rate', type=float, default=0.2, help='Share of packages dropped on purpose')
+    parser.add_argument('--report', type=float, default=10, help='Seconds between statistics lines, 0 - off')
+    parser.add_argument('--log-limit', type=int, default=5, help='Log lines per second for each kind of event')
+    args = parser.parse_args()
+
+    server = HeartbeatServer(args.host, args.port, args.timeout, args.drop_rate, report_interval=args.report,
+                             log_limit=args.log_limit)
+    server.start()